@@ -1135,3 +1135,228 @@ select *
 from public.water_lintrend_3000
 limit 20
 
+
+
+
+/***** Потоковый детектор инцидентов (backend/app/incident_detector.py) ***/
+/* incident_hist_1 / incident_hist_2 больше не пересобираются вручную:
+   новые показания принимает POST /api/readings, переходы пишутся в incident_hist_2 сразу */
+
+CREATE INDEX IF NOT EXISTS ix_water_consump_hot_house_time
+	ON water_consump_hot (id_house, time_5min);
+
+/* Уникальный ключ показаний: повтор пачки не дублирует строки (INSERT ... ON CONFLICT DO NOTHING).
+   API создаёт его при старте, предварительно удалив накопившиеся дубли */
+DELETE FROM water_consump_hot a
+USING water_consump_hot b
+WHERE a.id_house = b.id_house AND a.time_5min = b.time_5min AND a.ctid > b.ctid;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_water_consump_hot_house_time
+	ON water_consump_hot (id_house, time_5min);
+
+CREATE INDEX IF NOT EXISTS ix_incident_hist_2_house_time
+	ON incident_hist_2 (id_house, time_5min);
+
+
+/***** Инкрементальный классификатор состояния домов (backend/app/house_health.py) ***/
+/* CREATE TABLE status_houses AS ... больше не нужно пересобирать: house_health обновляется
+   только у домов, у которых изменились окна 24ч/120ч по incident_hist_2 (в т.ч. по истечению событий) */
+
+
+/***** Outbox email-уведомлений (backend/app/notifications.py) ***/
+/* создаётся автоматически при старте API, если задан NOTIFICATION_EMAILS */
+CREATE TABLE IF NOT EXISTS notification_outbox (
+	id BIGSERIAL PRIMARY KEY,
+	id_house INTEGER NOT NULL,
+	house_health VARCHAR(10) NOT NULL,
+	status_incident VARCHAR(20),
+	created_at TIMESTAMP NOT NULL DEFAULT now(),
+	status VARCHAR(10) NOT NULL DEFAULT 'pending',	/* pending / sent / failed */
+	attempts INTEGER NOT NULL DEFAULT 0,
+	next_attempt_at TIMESTAMP NOT NULL DEFAULT now(),
+	sent_at TIMESTAMP,
+	last_error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS ix_notification_outbox_pending
+	ON notification_outbox (next_attempt_at)
+	WHERE status = 'pending';
+
+
+/***** Постраничный список домов (keyset-пагинация, backend/app/pagination.py) ***/
+CREATE INDEX IF NOT EXISTS ix_lublino_houses_id_address_sort
+	ON lublino_houses_id ((coalesce(simple_address, address, '')), id_house);
+
+CREATE INDEX IF NOT EXISTS ix_lublino_houses_id_options_sort
+	ON lublino_houses_id ((coalesce(simple_address, '')), id_house);
+
+/* sort_by=unom: дома без УНОМ в конце списка, то же выражение в ORDER BY и в условии курсора */
+CREATE INDEX IF NOT EXISTS ix_status_houses_unom_sort
+	ON status_houses ((coalesce(unom, 9223372036854775807)), id_house);
+
+
+/***** Инкрементальные агрегаты 1h/1d/1w (backend/app/rollups.py) ***/
+/* water_consump_hot_1h, water_diffr_coldhot_1h и water_diffr_coldhot больше не пересобираются
+   через drop/create table ... as: триггеры на water_consump_hot пишут затронутые часы в
+   rollup_dirty_hours, API пересчитывает только их (и затронутые сутки/недели).
+   Таблицы, функции и триггеры создаются автоматически при старте API. */
+CREATE TABLE IF NOT EXISTS rollup_dirty_hours (
+	id_house BIGINT NOT NULL,
+	time_1hour TIMESTAMP NOT NULL,
+	PRIMARY KEY (id_house, time_1hour)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_watermark (
+	id_house BIGINT PRIMARY KEY,
+	rolled_up_to TIMESTAMP NOT NULL,	/* последний агрегированный час дома */
+	updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS water_consump_hot_1d (
+	id_house BIGINT NOT NULL,
+	time_1day TIMESTAMP NOT NULL,
+	water_cold DOUBLE PRECISION,
+	water_hot DOUBLE PRECISION,
+	PRIMARY KEY (id_house, time_1day)
+);
+
+CREATE TABLE IF NOT EXISTS water_consump_hot_1w (
+	id_house BIGINT NOT NULL,
+	time_1week TIMESTAMP NOT NULL,	/* понедельник недели */
+	water_cold DOUBLE PRECISION,
+	water_hot DOUBLE PRECISION,
+	PRIMARY KEY (id_house, time_1week)
+);
+
+/* ручной пересчёт всех часов дома (например, после загрузки с отключёнными триггерами) */
+INSERT INTO rollup_dirty_hours (id_house, time_1hour)
+SELECT DISTINCT id_house, date_trunc('hour', time_5min)
+FROM water_consump_hot
+WHERE id_house = 3000
+ON CONFLICT DO NOTHING;
+
+select *
+from water_consump_hot_1d
+where id_house = 3000
+order by time_1day desc
+limit 20
+
+
+/***** Районы и секционирование по району (backend/app/districts.py) ***/
+/* Выполняется автоматически при старте API. lublino_houses_id, status_houses, incident_hist_2 и
+   water_forecast_all становятся секционированными LIST (region_id); прежние данные — секции *_lublino.
+   Имена таблиц не меняются, у region_id DEFAULT 'lublino' для вставок из скриптов. */
+CREATE TABLE IF NOT EXISTS districts (
+	region_id TEXT PRIMARY KEY,	/* латиница: lublino, maryino, ... — входит в имена секций */
+	name TEXT NOT NULL,	/* 'Район Люблино' */
+	registry_district TEXT NOT NULL,	/* подстрока DISTRICT реестра адресов (lublino_houses) */
+	created_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+/* миграция одной таблицы (то же для status_houses, incident_hist_2, water_forecast_all) */
+ALTER TABLE lublino_houses_id ADD COLUMN IF NOT EXISTS region_id TEXT NOT NULL DEFAULT 'lublino';
+ALTER TABLE lublino_houses_id ADD CONSTRAINT lublino_houses_id_region_check CHECK (region_id = 'lublino');
+ALTER TABLE lublino_houses_id RENAME TO lublino_houses_id_lublino;
+CREATE TABLE lublino_houses_id (LIKE lublino_houses_id_lublino INCLUDING DEFAULTS) PARTITION BY LIST (region_id);
+ALTER TABLE lublino_houses_id ATTACH PARTITION lublino_houses_id_lublino FOR VALUES IN ('lublino');
+ALTER TABLE lublino_houses_id_lublino DROP CONSTRAINT lublino_houses_id_region_check;
+
+/* новый район: загрузить его дома в реестр (python -m db.import_lublino ... --district Марьино),
+   затем POST /api/regions {"region_id": "maryino", "name": "Район Марьино", "registry_district": "Марьино"} —
+   создаются секции *_maryino, дома получают новые id_house и строки status_houses */
+
+/* проверка: запрос по району читает только свою секцию */
+EXPLAIN
+select count(*)
+from status_houses
+where region_id = 'lublino';
+
+/***** Синтетические ряды с размеченными аномалиями (backend/app/synthetic_data.py) ***/
+/* python -m app.synthetic_data --region lublino --days 30; разметка создаётся автоматически */
+CREATE TABLE IF NOT EXISTS synthetic_anomalies (
+    run_id UUID NOT NULL,
+    id_house BIGINT NOT NULL,
+    anomaly TEXT NOT NULL,          -- leak / meter_drift / divergence
+    started_at TIMESTAMP NOT NULL,
+    ended_at TIMESTAMP,             -- NULL: длится до конца сгенерированного периода
+    magnitude DOUBLE PRECISION NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+/* сколько размеченных утечек детектор отметил инцидентом */
+SELECT a.anomaly, count(DISTINCT a.id_house) AS houses,
+       count(DISTINCT i.id_house) AS detected
+FROM synthetic_anomalies a
+LEFT JOIN incident_hist_2 i ON i.id_house = a.id_house AND i.type_incdnt = 1 AND i.time_5min >= a.started_at
+GROUP BY a.anomaly;
+
+
+/***** Версии прогнозов районов (backend/app/regional_forecast.py) ***/
+/* Триггеры на water_forecast_all увеличивают версию района при любой перезаписи прогноза;
+   API перечитывает сводку прогноза района в память. Создаётся автоматически при старте API. */
+CREATE TABLE IF NOT EXISTS water_forecast_versions (
+    region_id TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+/* сумма прогноза по району на ближайшие сутки (то же считает GET /api/regions/{region_id}/forecast-24h) */
+SELECT ds, count(*) AS houses, sum(yhat) AS total
+FROM water_forecast_all
+WHERE region_id = 'lublino'
+  AND ds >= now() AT TIME ZONE 'UTC' AND ds < now() AT TIME ZONE 'UTC' + INTERVAL '1 day'
+  AND EXTRACT(MINUTE FROM ds) = 0
+GROUP BY ds
+ORDER BY ds;
+
+
+/***** Отклонения от прогноза (backend/app/residual_detector.py) ***/
+/* type_incdnt 4 — часовой расход ХВС вышел за интервал прогноза и остаток необычен для дома,
+   5 — расход вернулся в интервал. Открытое отклонение (последнее событие 4/5 за 120 часов — 4) даёт Yellow. */
+SELECT DISTINCT ON (id_house) id_house, time_5min, diffr_prcnt_1h, comment_incdnt
+FROM incident_hist_2
+WHERE type_incdnt IN (4, 5)
+  AND time_5min >= now() - INTERVAL '120 hours'
+ORDER BY id_house, time_5min DESC;
+
+/* часовой факт против прогноза для одного дома (то же считает детектор для всех домов в памяти) */
+SELECT c.time_5min,
+       sum(c.water_consumption) OVER w AS actual_1h,
+       sum(f.yhat) OVER w AS forecast_1h,
+       sum(f.yhat_lower) OVER w AS lower_1h,
+       sum(f.yhat_upper) OVER w AS upper_1h
+FROM water_consump_hot c
+JOIN water_forecast_all f ON f.id_house = c.id_house AND f.ds = c.time_5min
+WHERE c.id_house = 0
+  AND c.time_5min >= now() - INTERVAL '1 day'
+WINDOW w AS (ORDER BY c.time_5min ROWS BETWEEN 11 PRECEDING AND CURRENT ROW)
+ORDER BY c.time_5min;
+
+
+/***** Точность прогноза по домам (backend/app/forecast_accuracy.py) ***/
+/* Суточные накопители ошибок 5-минутного прогноза: сумма по строкам даёт метрики за любое окно.
+   Создаётся автоматически при старте API. */
+CREATE TABLE IF NOT EXISTS forecast_accuracy_daily (
+    region_id TEXT NOT NULL,
+    id_house BIGINT NOT NULL,
+    day DATE NOT NULL,
+    points INTEGER NOT NULL,            -- пятиминуток с фактом и прогнозом
+    abs_error DOUBLE PRECISION NOT NULL, -- sum |факт - yhat|
+    sq_error DOUBLE PRECISION NOT NULL,  -- sum (факт - yhat)^2
+    error DOUBLE PRECISION NOT NULL,     -- sum (факт - yhat)
+    ape_points INTEGER NOT NULL,         -- пятиминуток с фактом > 0.01
+    ape DOUBLE PRECISION NOT NULL,       -- sum |факт - yhat| / факт по ним
+    actual DOUBLE PRECISION NOT NULL,    -- sum факта
+    updated_at TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (region_id, day, id_house)
+);
+
+/* MAE / RMSE / MAPE домов района за неделю (как в ноутбуке "Копия Модели", но для всех домов) */
+SELECT id_house,
+       sum(abs_error) / sum(points) AS mae,
+       sqrt(sum(sq_error) / sum(points)) AS rmse,
+       sum(ape) / NULLIF(sum(ape_points), 0) * 100 AS mape
+FROM forecast_accuracy_daily
+WHERE region_id = 'lublino' AND day >= current_date - 6
+GROUP BY id_house
+ORDER BY mape DESC NULLS LAST;
@@ -0,0 +1,305 @@
+"""
+Поиск домов по адресу и автодополнение.
+
+Вместо ILIKE '%...%' по simple_address/address (полный проход по таблице на каждое нажатие
+клавиши) адреса один раз разбираются на нормализованные токены и держатся в памяти:
+  - «улица»/«ул.», «проспект»/«пр-кт», «дом»/«д.», «корпус»/«корп.»/«к», «строение»/«стр.»
+    и т.п. приводятся к одной форме, номер корпуса/строения склеивается с числом («к2», «с1»);
+  - обратный индекс токен -> дома для точного совпадения;
+  - отсортированный словарь токенов для поиска по префиксу (последнее слово ещё набирается);
+  - триграммы токенов для опечаток («люблинска», «люблинкая»).
+Каждое слово запроса должно совпасть с каким-то токеном адреса; дома ранжируются по качеству
+совпадений, поиск можно ограничить районом. Индекс загружается при старте API и пересобирается rebuild(db).
+
+Он же служит реестром домов в памяти (id_house <-> unom <-> адрес <-> район): house(), house_by_unom(),
+region_house_ids() не ходят в БД. Реестр пересобирается при регистрации района, а run_refresher раз в
+HOUSE_REGISTRY_REFRESH_SECONDS сверяет контрольную сумму lublino_houses_id и пересобирает его, если
+таблицу поменяли в обход API (db.import_lublino, ручные правки).
+"""
+import asyncio
+import heapq
+import os
+import re
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.districts import district_registry
+
+HOUSE_REGISTRY_REFRESH_SECONDS = float(os.getenv("HOUSE_REGISTRY_REFRESH_SECONDS", "300"))
+
+# Синонимы -> каноническая форма
+TOKEN_SYNONYMS: Dict[str, str] = {
+    "улица": "ул",
+    "проспект": "пр-кт",
+    "просп": "пр-кт",
+    "пр": "пр-кт",
+    "переулок": "пер",
+    "бульвар": "б-р",
+    "бул": "б-р",
+    "шоссе": "ш",
+    "площадь": "пл",
+    "проезд": "пр-д",
+    "набережная": "наб",
+    "тупик": "туп",
+    "аллея": "ал",
+    "микрорайон": "мкр",
+    "квартал": "кв-л",
+    "дом": "д",
+    "корпус": "к",
+    "корп": "к",
+    "строение": "с",
+    "стр": "с",
+    "владение": "вл",
+}
+# Обозначения, которые склеиваются со следующим числом: «корп. 2» -> «к2»
+NUMBER_PREFIXES = {"к", "с", "вл"}
+# Не несут смысла для поиска
+STOP_TOKENS = {"г", "город", "москва", "россия", "д", "р-н", "район", "муниципальный", "округ"}
+
+_TOKEN_RE = re.compile(r"\d+|[^\W\d_]+(?:-[^\W\d_]+)?")
+
+EXACT_SCORE = 3.0
+PREFIX_SCORE = 2.0
+FUZZY_MIN_SIMILARITY = 0.45
+FUZZY_MAX_CANDIDATES = 20
+PREFIX_MAX_TOKENS = 500
+
+# Число строк и сумма хешей строк реестра: меняется при любой вставке, удалении или правке
+REGISTRY_CHECKSUM_SQL = """
+    SELECT count(*) AS houses,
+           COALESCE(sum(hashtext(concat_ws('|', id_house, unom, simple_address, address, region_id))), 0) AS checksum
+    FROM lublino_houses_id
+"""
+
+
+def normalize_tokens(value: Optional[str]) -> List[str]:
+    """Адрес или запрос -> список нормализованных токенов"""
+    if not value:
+        return []
+    raw = _TOKEN_RE.findall(value.lower().replace("ё", "е"))
+    tokens: List[str] = []
+    i = 0
+    while i < len(raw):
+        token = TOKEN_SYNONYMS.get(raw[i], raw[i])
+        if token in NUMBER_PREFIXES and i + 1 < len(raw) and raw[i + 1].isdigit():
+            tokens.append(token + raw[i + 1])
+            i += 2
+            continue
+        if token not in STOP_TOKENS:
+            tokens.append(token)
+        i += 1
+    return tokens
+
+
+def trigrams(token: str) -> Set[str]:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass
+class AddressEntry:
+    id_house: int
+    unom: Optional[int]
+    simple_address: Optional[str]
+    address: Optional[str]
+    region_id: Optional[str] = None
+    tokens: Set[str] = field(default_factory=set)
+
+
+class AddressIndex:
+    """In-memory индекс адресов домов"""
+
+    def __init__(self):
+        self._entries: Dict[int, AddressEntry] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self._vocabulary: List[str] = []
+        self._trigrams: Dict[str, Set[str]] = {}
+        self._unoms: Dict[str, int] = {}
+        self._regions: Dict[Optional[str], List[int]] = {}
+        self._checksum: Optional[Tuple[int, int]] = None
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def build(self, rows) -> None:
+        """rows: (id_house, unom, simple_address, address, region_id)"""
+        entries: Dict[int, AddressEntry] = {}
+        postings: Dict[str, Set[int]] = {}
+        unoms: Dict[str, int] = {}
+        for id_house, unom, simple_address, address, region_id in rows:
+            entry = AddressEntry(int(id_house), unom, simple_address, address, region_id)
+            entry.tokens = set(normalize_tokens(simple_address)) | set(normalize_tokens(address))
+            entries[entry.id_house] = entry
+            for token in entry.tokens:
+                postings.setdefault(token, set()).add(entry.id_house)
+            if unom is not None:
+                unoms[str(unom)] = entry.id_house
+
+        trigram_index: Dict[str, Set[str]] = {}
+        for token in postings:
+            if not token.isdigit() and len(token) >= 3:
+                for gram in trigrams(token):
+                    trigram_index.setdefault(gram, set()).add(token)
+
+        regions: Dict[Optional[str], List[int]] = {}
+        for entry in entries.values():
+            regions.setdefault(entry.region_id, []).append(entry.id_house)
+
+        # Подмена целиком, чтобы параллельные запросы не видели полупостроенный индекс
+        self._entries, self._postings, self._unoms, self._regions = entries, postings, unoms, regions
+        self._vocabulary = sorted(postings)
+        self._trigrams = trigram_index
+
+    async def rebuild(self, db: AsyncSession) -> int:
+        checksum = tuple((await db.execute(text(REGISTRY_CHECKSUM_SQL))).one())
+        result = await db.execute(text("SELECT id_house, unom, simple_address, address, region_id FROM lublino_houses_id"))
+        self.build(result.fetchall())
+        self._checksum = checksum
+        print(f"[address] Indexed {len(self._entries)} house addresses, {len(self._vocabulary)} tokens")
+        return len(self._entries)
+
+    async def refresh_if_changed(self, db: AsyncSession) -> bool:
+        """Пересобирает реестр (и принадлежность домов районам), если lublino_houses_id изменилась"""
+        checksum = tuple((await db.execute(text(REGISTRY_CHECKSUM_SQL))).one())
+        if checksum == self._checksum:
+            return False
+        await self.rebuild(db)
+        await district_registry.reload(db)
+        return True
+
+    async def run_refresher(self, session_factory, interval: float = HOUSE_REGISTRY_REFRESH_SECONDS) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async with session_factory() as db:
+                    await self.refresh_if_changed(db)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[address] Error refreshing house registry: {e}")
+
+    def house(self, id_house) -> Optional[AddressEntry]:
+        return self._entries.get(int(id_house))
+
+    def house_by_unom(self, unom) -> Optional[AddressEntry]:
+        id_house = self._unoms.get(str(unom))
+        return self._entries.get(id_house) if id_house is not None else None
+
+    def region_house_ids(self, region_id: str) -> List[int]:
+        return list(self._regions.get(region_id, ()))
+
+    def _prefix_tokens(self, prefix: str) -> List[str]:
+        start = bisect_left(self._vocabulary, prefix)
+        found = []
+        for token in self._vocabulary[start:start + PREFIX_MAX_TOKENS]:
+            if not token.startswith(prefix):
+                break
+            found.append(token)
+        return found
+
+    def _fuzzy_tokens(self, token: str) -> List[Tuple[str, float]]:
+        grams = trigrams(token)
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for candidate in self._trigrams.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        scored = []
+        for candidate, common in shared.items():
+            similarity = common / (len(grams) + len(trigrams(candidate)) - common)
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                scored.append((candidate, similarity))
+        scored.sort(key=lambda item: -item[1])
+        return scored[:FUZZY_MAX_CANDIDATES]
+
+    def _match_groups(self, token: str) -> List[Tuple[float, Set[int]]]:
+        """Группы домов, подходящих под одно слово запроса, с оценкой совпадения (по убыванию)"""
+        groups: List[Tuple[float, Set[int]]] = []
+        exact = self._postings.get(token)
+        if exact:
+            groups.append((EXACT_SCORE, exact))
+        for candidate in self._prefix_tokens(token):
+            if candidate != token:
+                # Чем меньше недописано, тем ближе к точному совпадению
+                groups.append((PREFIX_SCORE * len(token) / len(candidate), self._postings[candidate]))
+        if not groups and not token.isdigit() and len(token) >= 3:
+            for candidate, similarity in self._fuzzy_tokens(token):
+                groups.append((similarity, self._postings[candidate]))
+        groups.sort(key=lambda group: -group[0])
+        return groups
+
+    def _score(self, query: str, region_id: Optional[str] = None) -> Dict[int, float]:
+        tokens = normalize_tokens(query)
+        if not tokens:
+            return {}
+        token_groups = [self._match_groups(token) for token in tokens]
+
+        # Все слова запроса должны совпасть: сначала пересекаем множества (самое редкое слово первым),
+        # оценки считаем только для оставшихся домов
+        matched = sorted((set().union(*(ids for _, ids in groups)) for groups in token_groups), key=len)
+        candidates = matched[0]
+        for ids in matched[1:]:
+            candidates = candidates & ids
+            if not candidates:
+                break
+
+        if region_id is not None:
+            candidates = {id_house for id_house in candidates if self._entries[id_house].region_id == region_id}
+
+        total: Dict[int, float] = dict.fromkeys(candidates, 0.0)
+        for groups in token_groups:
+            remaining = set(candidates)
+            for score, ids in groups:
+                hit = remaining & ids
+                for id_house in hit:
+                    total[id_house] += score
+                remaining -= hit
+                if not remaining:
+                    break
+
+        # Запрос, совпадающий с УНОМ дома
+        unom_house = self._unoms.get(query.strip())
+        if unom_house is not None and region_id in (None, self._entries[unom_house].region_id):
+            total[unom_house] = total.get(unom_house, 0.0) + EXACT_SCORE * 2
+        return total
+
+    def search_ids(self, query: str, region_id: Optional[str] = None) -> Optional[List[int]]:
+        """Все дома (района), подходящие под запрос (для фильтра списка домов).
+        None, если в запросе нет значимых слов («д», «дом», «г. Москва»): фильтровать не по чему."""
+        if not normalize_tokens(query):
+            return None
+        return list(self._score(query, region_id))
+
+    def autocomplete(self, query: str, limit: int = 10, region_id: Optional[str] = None) -> List[Dict]:
+        """Лучшие limit домов: по убыванию оценки, затем более короткие адреса"""
+        total = self._score(query, region_id)
+        ranked = heapq.nsmallest(
+            limit,
+            total.items(),
+            key=lambda item: (
+                -item[1],
+                len(self._entries[item[0]].tokens),
+                self._entries[item[0]].simple_address or "",
+            ),
+        )
+        return [
+            {
+                "id_house": self._entries[id_house].id_house,
+                "unom": self._entries[id_house].unom,
+                "simple_address": self._entries[id_house].simple_address,
+                "address": self._entries[id_house].address,
+                "region_id": self._entries[id_house].region_id,
+                "score": round(score, 3),
+            }
+            for id_house, score in ranked
+        ]
+
+
+address_index = AddressIndex()
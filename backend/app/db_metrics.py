@@ -0,0 +1,155 @@
+"""
+Наблюдаемость БД: время запросов, журнал медленных запросов и состояние пула подключений.
+
+Время каждого запроса попадает в гистограмму db_query_duration_seconds с меткой caller —
+функцией приложения, из которой он выполнен (например real_data.get_real_house_list).
+Под async SQLAlchemy запрос исполняется в отдельном greenlet, поэтому функция ищется сначала
+в его стеке, затем в стеке приостановленного greenlet-родителя, где лежат корутины приложения.
+
+Запросы дольше DB_SLOW_QUERY_MS печатаются с параметрами и хранятся в кольцевом журнале
+(последние DB_SLOW_QUERY_LOG_SIZE). Ожидание подключения из пула и его заполненность
+снимаются через TimedQueuePool из db.database.
+"""
+import os
+import sys
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+
+from sqlalchemy import event
+
+from app.metrics import counter, gauge, histogram
+from app.tracing import add_span
+from db.database import TimedQueuePool
+
+try:
+    import greenlet
+except ImportError:
+    greenlet = None
+
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "500"))
+DB_SLOW_QUERY_LOG_SIZE = int(os.getenv("DB_SLOW_QUERY_LOG_SIZE", "100"))
+MAX_LOGGED_CHARS = 2000
+UNKNOWN_CALLER = "other"
+# Модули, кадры которых не считаются вызывающей функцией
+_SKIP_MODULES = {__name__, "app.metrics", "app.tracing"}
+
+query_duration = histogram(
+    "db_query_duration_seconds",
+    "Время выполнения SQL-запроса по вызывающей функции и типу запроса",
+    ("caller", "operation"),
+)
+query_errors = counter("db_query_errors_total", "SQL-запросы, завершившиеся ошибкой", ("caller", "operation"))
+slow_queries = counter("db_slow_queries_total", "SQL-запросы дольше DB_SLOW_QUERY_MS", ("caller",))
+checkout_wait = histogram(
+    "db_pool_checkout_wait_seconds",
+    "Ожидание подключения из пула SQLAlchemy",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0),
+)
+checkout_timeouts = counter("db_pool_checkout_timeouts_total", "Подключение не выдано за DB_POOL_TIMEOUT")
+
+_slow_log: Deque[Dict] = deque(maxlen=DB_SLOW_QUERY_LOG_SIZE)
+
+
+def _app_function(frame) -> Optional[str]:
+    """Ближайшая к запросу функция пакета app: 'модуль.функция'"""
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith("app.") and module not in _SKIP_MODULES:
+            return f"{module[4:]}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+def current_caller() -> str:
+    caller = _app_function(sys._getframe(1))
+    if caller is None and greenlet is not None:
+        parent = greenlet.getcurrent().parent
+        if parent is not None:
+            caller = _app_function(parent.gr_frame)
+    return caller or UNKNOWN_CALLER
+
+
+def _operation(statement: str) -> str:
+    words = statement.lstrip(" \n\t(").split(None, 1)
+    return words[0].upper() if words else "UNKNOWN"
+
+
+def _shorten(value, limit: int = MAX_LOGGED_CHARS) -> str:
+    value = " ".join(str(value).split())
+    return value if len(value) <= limit else value[:limit] + "…"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["metrics_started"].pop()
+    elapsed = time.perf_counter() - started
+    caller = current_caller()
+    query_duration.observe(elapsed, caller, _operation(statement))
+    add_span("db", elapsed)
+    if elapsed * 1000 >= DB_SLOW_QUERY_MS:
+        _record_slow_query(caller, statement, parameters, executemany, elapsed)
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("metrics_started"):
+        conn.info["metrics_started"].pop()
+    statement = exception_context.statement or ""
+    query_errors.inc(current_caller(), _operation(statement))
+
+
+def _record_slow_query(caller: str, statement: str, parameters, executemany: bool, elapsed: float) -> None:
+    slow_queries.inc(caller)
+    entry = {
+        "time": datetime.utcnow().isoformat(),
+        "caller": caller,
+        "duration_ms": round(elapsed * 1000, 1),
+        "statement": _shorten(statement),
+        "parameters": _shorten(repr(parameters)),
+        "executemany": executemany,
+    }
+    _slow_log.append(entry)
+    print(
+        f"[db] slow query {entry['duration_ms']} ms in {caller}: {entry['statement']} "
+        f"params={entry['parameters']}"
+    )
+
+
+def recent_slow_queries(limit: int = DB_SLOW_QUERY_LOG_SIZE) -> List[Dict]:
+    """Последние медленные запросы, новые первыми"""
+    return list(reversed(_slow_log))[:limit]
+
+
+def _observe_checkout(seconds: float, timed_out: bool) -> None:
+    checkout_wait.observe(seconds)
+    if timed_out:
+        checkout_timeouts.inc()
+
+
+def install(engine) -> None:
+    """Подписывает движок (AsyncEngine или Engine) на события запросов и регистрирует gauge пула"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+    TimedQueuePool.wait_observer = staticmethod(_observe_checkout)
+
+    def pool_value(read):
+        # engine.dispose() заменяет пул, поэтому берём текущий при каждом скрейпе
+        return lambda: [((), read(sync_engine.pool))]
+
+    def saturation(pool) -> float:
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        return pool.checkedout() / capacity if capacity else 0.0
+
+    gauge("db_pool_size", "Постоянных подключений в пуле (DB_POOL_SIZE)", pool_value(lambda p: p.size()))
+    gauge("db_pool_checked_out", "Подключений выдано сейчас", pool_value(lambda p: p.checkedout()))
+    gauge("db_pool_checked_in", "Свободных подключений в пуле", pool_value(lambda p: p.checkedin()))
+    gauge("db_pool_overflow", "Подключений сверх DB_POOL_SIZE (отрицательно — пул ещё не заполнен)",
+          pool_value(lambda p: p.overflow()))
+    gauge("db_pool_saturation", "Доля занятых подключений от DB_POOL_SIZE + DB_MAX_OVERFLOW", pool_value(saturation))
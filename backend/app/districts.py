@@ -0,0 +1,227 @@
+"""
+Реестр районов и секционирование таблиц по району.
+
+Таблицы домов (lublino_houses_id), статусов (status_houses), инцидентов (incident_hist_2)
+и прогнозов (water_forecast_all) секционированы LIST (region_id): у каждого района своя
+секция <таблица>_<region_id>. Запросы по району фильтруют region_id и читают только свою
+секцию; запросы по конкретному дому берут его район из реестра (region_of) и тоже читают одну секцию.
+
+Миграция существующей базы выполняется при старте API один раз: в таблицу добавляется
+region_id = 'lublino' (без перезаписи строк), она переименовывается в <таблица>_lublino и
+подключается секцией к новой секционированной таблице с прежним именем. Имена таблиц
+не меняются, поэтому SQL-скрипты и Grafana продолжают работать (DEFAULT 'lublino' у
+region_id оставлен для вставок в обход API).
+
+Новый район регистрируется через register(): запись в districts, секции во всех таблицах,
+дома из реестра адресов lublino_houses (см. db.import_lublino) и строки status_houses.
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+DEFAULT_REGION = "lublino"
+UNKNOWN_REGION_NAME = "Неизвестный район"
+# region_id входит в имена секций, поэтому только латиница, цифры и _
+REGION_ID_RE = re.compile(r"^[a-z][a-z0-9_]{1,40}$")
+
+
+@dataclass(frozen=True)
+class District:
+    region_id: str
+    name: str
+    registry_district: str  # подстрока столбца DISTRICT реестра адресов
+
+
+@dataclass(frozen=True)
+class PartitionedTable:
+    table: str
+    # Индексы секционированной таблицы: (имя, столбцы). region_id в них не нужен — район
+    # выбирается секцией; совпадающие индексы существующей секции подключаются без перестроения
+    indexes: Sequence[Tuple[str, str]]
+
+
+PARTITIONED_TABLES = [
+    PartitionedTable("lublino_houses_id", (
+        ("ix_lublino_houses_id_part_house", "id_house"),
+        ("ix_lublino_houses_id_part_unom", "unom"),
+        ("ix_lublino_houses_id_part_address_sort", "(coalesce(simple_address, address, '')), id_house"),
+        ("ix_lublino_houses_id_part_options_sort", "(coalesce(simple_address, '')), id_house"),
+    )),
+    PartitionedTable("status_houses", (
+        ("ix_status_houses_part_house", "id_house"),
+        ("ix_status_houses_part_unom_sort", "(coalesce(unom, 9223372036854775807)), id_house"),
+    )),
+    PartitionedTable("incident_hist_2", (
+        ("ix_incident_hist_2_part_house_time", "id_house, time_5min"),
+    )),
+    PartitionedTable("water_forecast_all", (
+        ("ix_water_forecast_all_part_house_ds", "id_house, ds"),
+        # Окно прогноза всех домов по времени (детектор отклонений от прогноза, сводка района)
+        ("ix_water_forecast_all_part_ds", "ds"),
+    )),
+]
+
+SCHEMA_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS districts (
+        region_id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        registry_district TEXT NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+    """,
+    """
+    INSERT INTO districts (region_id, name, registry_district)
+    VALUES ('lublino', 'Район Люблино', 'Люблино')
+    ON CONFLICT (region_id) DO NOTHING
+    """,
+]
+
+
+class InvalidDistrict(ValueError):
+    """Недопустимый region_id или параметры района"""
+
+
+async def _relkind(db: AsyncSession, table: str):
+    result = await db.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"), {"name": f"public.{table}"}
+    )
+    return result.scalar()
+
+
+async def _partition_table(db: AsyncSession, spec: PartitionedTable) -> bool:
+    """Превращает обычную таблицу в секционированную с единственной секцией lublino; True, если мигрировали"""
+    relkind = await _relkind(db, spec.table)
+    if relkind is None:
+        print(f"[districts] Table {spec.table} not found, partitioning skipped")
+        return False
+    if relkind == "p":
+        return False
+
+    table, partition = spec.table, f"{spec.table}_{DEFAULT_REGION}"
+    # Добавление столбца с константой по умолчанию не переписывает таблицу; CHECK позволяет
+    # подключить секцию без повторной проверки строк
+    await db.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS region_id TEXT NOT NULL DEFAULT '{DEFAULT_REGION}'"))
+    await db.execute(text(f"ALTER TABLE {table} ADD CONSTRAINT {table}_region_check CHECK (region_id = '{DEFAULT_REGION}')"))
+    await db.execute(text(f"ALTER TABLE {table} RENAME TO {partition}"))
+    await db.execute(text(f"CREATE TABLE {table} (LIKE {partition} INCLUDING DEFAULTS) PARTITION BY LIST (region_id)"))
+    await db.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES IN ('{DEFAULT_REGION}')"))
+    await db.execute(text(f"ALTER TABLE {partition} DROP CONSTRAINT {table}_region_check"))
+    print(f"[districts] Partitioned {table} by region_id, existing rows are in {partition}")
+    return True
+
+
+async def _ensure_partitions(db: AsyncSession, region_id: str) -> None:
+    for spec in PARTITIONED_TABLES:
+        if await _relkind(db, spec.table) != "p":
+            continue
+        await db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {spec.table}_{region_id} "
+            f"PARTITION OF {spec.table} FOR VALUES IN ('{region_id}')"
+        ))
+
+
+class DistrictRegistry:
+    """Районы и принадлежность домов районам (в памяти, перечитывается reload)"""
+
+    def __init__(self):
+        self._districts: Dict[str, District] = {
+            DEFAULT_REGION: District(DEFAULT_REGION, "Район Люблино", "Люблино"),
+        }
+        self._house_regions: Dict[int, str] = {}
+
+    def exists(self, region_id: str) -> bool:
+        return region_id in self._districts
+
+    def name(self, region_id: str) -> str:
+        district = self._districts.get(region_id)
+        return district.name if district else UNKNOWN_REGION_NAME
+
+    def all(self) -> List[District]:
+        return sorted(self._districts.values(), key=lambda d: d.name)
+
+    def region_of(self, id_house) -> str:
+        """Район дома; дома, которых ещё нет в реестре, относятся к району по умолчанию"""
+        return self._house_regions.get(int(id_house), DEFAULT_REGION)
+
+    async def ensure_schema(self, db: AsyncSession) -> None:
+        """Таблица районов, миграция таблиц в секционированные, секции и индексы для всех районов"""
+        for statement in SCHEMA_STATEMENTS:
+            await db.execute(text(statement))
+        for spec in PARTITIONED_TABLES:
+            await _partition_table(db, spec)
+            if await _relkind(db, spec.table) == "p":
+                for index_name, columns in spec.indexes:
+                    await db.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {spec.table} ({columns})"))
+        result = await db.execute(text("SELECT region_id FROM districts"))
+        for region_id in result.scalars().all():
+            await _ensure_partitions(db, region_id)
+        await db.commit()
+
+    async def reload(self, db: AsyncSession) -> None:
+        result = await db.execute(text("SELECT region_id, name, registry_district FROM districts"))
+        districts = {row.region_id: District(row.region_id, row.name, row.registry_district) for row in result}
+        result = await db.execute(text("SELECT id_house, region_id FROM lublino_houses_id"))
+        house_regions = {row.id_house: row.region_id for row in result}
+        self._districts, self._house_regions = districts or self._districts, house_regions
+        print(f"[districts] {len(self._districts)} districts, {len(self._house_regions)} houses")
+
+    async def register(self, db: AsyncSession, region_id: str, name: str, registry_district: str) -> int:
+        """
+        Регистрирует район (или обновляет название), создаёт его секции и добавляет его дома из
+        реестра адресов lublino_houses с новыми id_house и статусом Green. Возвращает число новых домов.
+        """
+        if not REGION_ID_RE.match(region_id):
+            raise InvalidDistrict("region_id: латиница в нижнем регистре, цифры и _, от 2 до 41 символа")
+        if not name.strip() or not registry_district.strip():
+            raise InvalidDistrict("name и registry_district обязательны")
+
+        await db.execute(
+            text("""
+                INSERT INTO districts (region_id, name, registry_district)
+                VALUES (:region_id, :name, :registry_district)
+                ON CONFLICT (region_id) DO UPDATE
+                    SET name = EXCLUDED.name, registry_district = EXCLUDED.registry_district
+            """),
+            {"region_id": region_id, "name": name.strip(), "registry_district": registry_district.strip()},
+        )
+        await _ensure_partitions(db, region_id)
+
+        # id_house выдаются подряд после максимального — параллельная регистрация ждёт
+        await db.execute(text("LOCK TABLE lublino_houses_id IN SHARE ROW EXCLUSIVE MODE"))
+        result = await db.execute(
+            text("""
+                INSERT INTO lublino_houses_id (region_id, id_house, unom, address, simple_address, district, n_fias, nreg)
+                SELECT :region_id, base.max_id + ROW_NUMBER() OVER (ORDER BY lh.unom),
+                       lh.unom, lh.address, lh.simple_address, lh.district, lh.n_fias, lh.nreg
+                FROM lublino_houses lh
+                CROSS JOIN (SELECT COALESCE(max(id_house), 0) AS max_id FROM lublino_houses_id) base
+                WHERE lh.district ILIKE '%' || :registry_district || '%'
+                  AND lh.unom IS NOT NULL
+                  AND NOT EXISTS (SELECT 1 FROM lublino_houses_id h WHERE h.unom = lh.unom)
+            """),
+            {"region_id": region_id, "registry_district": registry_district.strip()},
+        )
+        added = result.rowcount or 0
+        await db.execute(
+            text("""
+                INSERT INTO status_houses (region_id, id_house, unom, status_incident, house_health)
+                SELECT h.region_id, h.id_house, h.unom, NULL, 'Green'
+                FROM lublino_houses_id h
+                WHERE h.region_id = :region_id
+                  AND NOT EXISTS (
+                      SELECT 1 FROM status_houses s WHERE s.region_id = :region_id AND s.id_house = h.id_house
+                  )
+            """),
+            {"region_id": region_id},
+        )
+        await db.commit()
+        await self.reload(db)
+        print(f"[districts] Registered {region_id} ({name}): {added} new houses")
+        return added
+
+
+district_registry = DistrictRegistry()
@@ -0,0 +1,251 @@
+"""
+Потоковая выгрузка рядов для аналитиков: NDJSON или Arrow IPC (stream).
+
+Данные читаются серверным курсором asyncpg пачками по EXPORT_BATCH_ROWS строк и сразу
+отдаются клиенту, поэтому память не зависит от объёма выгрузки, а медленный клиент
+притормаживает чтение из БД (StreamingResponse не запрашивает следующую пачку, пока не
+отправлена предыдущая). Каждая выгрузка идёт по отдельному подключению, а не через пул
+SQLAlchemy, и одновременно их не больше EXPORT_MAX_CONCURRENT.
+"""
+import asyncio
+import json
+import math
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Sequence
+
+import asyncpg
+
+from app.districts import district_registry
+from db.database import ASYNCPG_DSN
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow-формат недоступен, NDJSON работает
+    pa = None
+
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "10000"))
+EXPORT_MAX_CONCURRENT = int(os.getenv("EXPORT_MAX_CONCURRENT", "2"))
+
+
+@dataclass(frozen=True)
+class ExportTable:
+    table: str
+    time_column: str
+    value_columns: Sequence[str]
+    partitioned: bool = False  # секционирована по region_id
+
+
+EXPORT_TABLES = {
+    "water_consump_hot": ExportTable("water_consump_hot", "time_5min", ("water_consumption", "water_hot")),
+    "water_diffr_coldhot": ExportTable("water_diffr_coldhot", "time_5min", ("diffr_cldht", "diffr_ratio")),
+    "water_forecast_all": ExportTable("water_forecast_all", "ds", ("yhat", "yhat_lower", "yhat_upper"), True),
+}
+
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+
+class ExportBusy(Exception):
+    """Достигнут предел одновременных выгрузок"""
+
+
+_slots = asyncio.Semaphore(EXPORT_MAX_CONCURRENT)
+
+
+def arrow_available() -> bool:
+    return pa is not None
+
+
+def build_export_query(
+    spec: ExportTable,
+    house_ids: Optional[List[int]],
+    region_id: Optional[str],
+    start: Optional[datetime],
+    end: Optional[datetime],
+):
+    """SQL и параметры выгрузки; дома — списком id и/или всем районом, время — [start, end)"""
+    if not house_ids and not region_id:
+        raise ValueError("Укажите house_id или region_id")
+    if region_id and not district_registry.exists(region_id):
+        raise ValueError(f"Неизвестный район: {region_id}")
+
+    conditions, args = [], []
+    if house_ids:
+        args.append(house_ids)
+        conditions.append(f"id_house = ANY(${len(args)}::bigint[])")
+    if region_id:
+        args.append(region_id)
+        if spec.partitioned:
+            conditions.append(f"region_id = ${len(args)}")
+        else:
+            conditions.append(f"id_house IN (SELECT id_house FROM lublino_houses_id WHERE region_id = ${len(args)})")
+    if start is not None:
+        args.append(start)
+        conditions.append(f"{spec.time_column} >= ${len(args)}")
+    if end is not None:
+        args.append(end)
+        conditions.append(f"{spec.time_column} < ${len(args)}")
+
+    values = ", ".join(f"CAST({column} AS double precision) AS {column}" for column in spec.value_columns)
+    query = f"""
+        SELECT CAST(id_house AS bigint) AS id_house, {spec.time_column}, {values}
+        FROM public.{spec.table}
+        WHERE {" AND ".join(conditions)}
+        ORDER BY id_house, {spec.time_column}
+    """
+    return query, args
+
+
+class _ChunkSink:
+    """Файлоподобный приёмник для pyarrow: копит записанные байты до следующего take()"""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+class ExportStream:
+    """Одна выгрузка: своё подключение, read-only транзакция и серверный курсор"""
+
+    def __init__(self, spec: ExportTable, fmt: str, query: str, args: list):
+        self.spec = spec
+        self.fmt = fmt
+        self.columns = ["id_house", spec.time_column, *spec.value_columns]
+        self._query = query
+        self._args = args
+        self._conn: Optional[asyncpg.Connection] = None
+        self._transaction = None
+        self._closed = False
+        self.rows = 0
+
+    @property
+    def media_type(self) -> str:
+        return EXPORT_FORMATS[self.fmt][0]
+
+    @property
+    def filename(self) -> str:
+        return f"{self.spec.table}.{EXPORT_FORMATS[self.fmt][1]}"
+
+    async def open(self) -> None:
+        self._conn = await asyncpg.connect(ASYNCPG_DSN)
+        self._transaction = self._conn.transaction(isolation="repeatable_read", readonly=True)
+        await self._transaction.start()
+
+    async def close(self) -> None:
+        """Идемпотентно: вызывается и по окончании потока, и фоновой задачей ответа (если клиент отвалился)"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if self._transaction is not None:
+                await self._transaction.rollback()
+        except Exception as e:
+            print(f"[export] Error closing export transaction: {e}")
+        finally:
+            if self._conn is not None:
+                await self._conn.close()
+            _slots.release()
+
+    async def _batches(self) -> AsyncIterator[List[asyncpg.Record]]:
+        cursor = await self._conn.cursor(self._query, *self._args)
+        while True:
+            rows = await cursor.fetch(EXPORT_BATCH_ROWS)
+            if not rows:
+                return
+            self.rows += len(rows)
+            yield rows
+
+    async def iter_ndjson(self) -> AsyncIterator[bytes]:
+        async for rows in self._batches():
+            lines = [
+                json.dumps({column: _json_value(value) for column, value in zip(self.columns, row)}, ensure_ascii=False)
+                for row in rows
+            ]
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+
+    async def iter_arrow(self) -> AsyncIterator[bytes]:
+        schema = pa.schema(
+            [pa.field("id_house", pa.int64()), pa.field(self.spec.time_column, pa.timestamp("us"))]
+            + [pa.field(column, pa.float64()) for column in self.spec.value_columns]
+        )
+        sink = _ChunkSink()
+        writer = pa.ipc.new_stream(sink, schema)
+        yield sink.take()
+        async for rows in self._batches():
+            columns = list(zip(*rows))
+            batch = pa.record_batch(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema,
+            )
+            writer.write_batch(batch)
+            yield sink.take()
+        writer.close()
+        yield sink.take()
+
+    async def iter_bytes(self) -> AsyncIterator[bytes]:
+        try:
+            body = self.iter_arrow() if self.fmt == "arrow" else self.iter_ndjson()
+            async for chunk in body:
+                yield chunk
+            print(f"[export] {self.spec.table}: {self.rows} rows exported as {self.fmt}")
+        finally:
+            await self.close()
+
+
+async def open_export(
+    table: str,
+    fmt: str,
+    house_ids: Optional[List[int]] = None,
+    region_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> ExportStream:
+    """
+    Готовит выгрузку (ошибки параметров и подключения — до начала ответа).
+    ValueError — неверные параметры, ExportBusy — все слоты выгрузки заняты.
+    """
+    spec = EXPORT_TABLES.get(table)
+    if spec is None:
+        raise ValueError(f"Неизвестная таблица: {table}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    query, args = build_export_query(spec, house_ids, region_id, start, end)
+
+    if _slots.locked():
+        raise ExportBusy()
+    await _slots.acquire()
+    stream = ExportStream(spec, fmt, query, args)
+    try:
+        await stream.open()
+    except Exception:
+        await stream.close()
+        raise
+    return stream
@@ -0,0 +1,288 @@
+"""
+Точность прогноза по каждому дому, которая обновляется по мере поступления показаний.
+
+В ноутбуке "Копия Модели" MAE/RMSE/MAPE считаются один раз для одного дома на отложенной выборке.
+Здесь те же метрики по 5-минутным точкам ведутся для всех домов непрерывно: детектор отклонений
+от прогноза (app.residual_detector) после проверки каждой пятиминутки передаёт факт и yhat всех
+домов, трекер копит по ним суммы, и раз в FORECAST_ACCURACY_FLUSH_SECONDS одним запросом добавляет
+их к суточным накопителям forecast_accuracy_daily (район, дом, сутки): число точек, суммы |e|, e^2,
+e, |e|/факт и факта. История показаний при этом не перечитывается.
+
+Метрики за любое число суток складываются из накопителей: MAE = sum|e|/n, RMSE = sqrt(sum e^2/n),
+MAPE — по точкам с фактом больше MIN_COLD_5MIN (на почти нулевом расходе процент бессмысленен),
+WAPE = sum|e|/sum факта, смещение = sum e/n. Деградация — MAE последних
+FORECAST_ACCURACY_RECENT_DAYS суток относительно MAE за всё окно запроса.
+"""
+import asyncio
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+
+from app.address_search import address_index
+from app.districts import district_registry
+from app.incident_detector import MIN_COLD_5MIN
+
+FORECAST_ACCURACY_FLUSH_SECONDS = float(os.getenv("FORECAST_ACCURACY_FLUSH_SECONDS", "60"))
+FORECAST_ACCURACY_RETENTION_DAYS = int(os.getenv("FORECAST_ACCURACY_RETENTION_DAYS", "60"))
+FORECAST_ACCURACY_RECENT_DAYS = int(os.getenv("FORECAST_ACCURACY_RECENT_DAYS", "1"))
+# Дом попадает в распределение и рейтинги, если за окно у него хотя бы 6 часов точек
+MIN_POINTS = 72
+QUANTILES = (10, 25, 50, 75, 90)
+
+SCHEMA_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS forecast_accuracy_daily (
+        region_id TEXT NOT NULL,
+        id_house BIGINT NOT NULL,
+        day DATE NOT NULL,
+        points INTEGER NOT NULL,
+        abs_error DOUBLE PRECISION NOT NULL,
+        sq_error DOUBLE PRECISION NOT NULL,
+        error DOUBLE PRECISION NOT NULL,
+        ape_points INTEGER NOT NULL,
+        ape DOUBLE PRECISION NOT NULL,
+        actual DOUBLE PRECISION NOT NULL,
+        updated_at TIMESTAMP NOT NULL DEFAULT now(),
+        PRIMARY KEY (region_id, day, id_house)
+    )
+    """,
+]
+
+# Накопители складываются: повторная запись тех же суток дома добавляет к ним новую пачку
+UPSERT_SQL = """
+    INSERT INTO forecast_accuracy_daily
+        (region_id, id_house, day, points, abs_error, sq_error, error, ape_points, ape, actual)
+    SELECT *
+    FROM unnest(
+        CAST(:region_ids AS text[]), CAST(:house_ids AS bigint[]), CAST(:days AS date[]),
+        CAST(:points AS integer[]), CAST(:abs_error AS double precision[]), CAST(:sq_error AS double precision[]),
+        CAST(:error AS double precision[]), CAST(:ape_points AS integer[]), CAST(:ape AS double precision[]),
+        CAST(:actual AS double precision[])
+    )
+    ON CONFLICT (region_id, day, id_house) DO UPDATE SET
+        points = forecast_accuracy_daily.points + excluded.points,
+        abs_error = forecast_accuracy_daily.abs_error + excluded.abs_error,
+        sq_error = forecast_accuracy_daily.sq_error + excluded.sq_error,
+        error = forecast_accuracy_daily.error + excluded.error,
+        ape_points = forecast_accuracy_daily.ape_points + excluded.ape_points,
+        ape = forecast_accuracy_daily.ape + excluded.ape,
+        actual = forecast_accuracy_daily.actual + excluded.actual,
+        updated_at = now()
+"""
+
+ACCUMULATOR_COLUMNS = ("points", "abs_error", "sq_error", "error", "ape_points", "ape", "actual")
+
+HOUSE_TOTALS_SQL = """
+    SELECT id_house,
+           sum(points) AS points, sum(abs_error) AS abs_error, sum(sq_error) AS sq_error, sum(error) AS error,
+           sum(ape_points) AS ape_points, sum(ape) AS ape, sum(actual) AS actual,
+           COALESCE(sum(points) FILTER (WHERE day >= :recent), 0) AS recent_points,
+           COALESCE(sum(abs_error) FILTER (WHERE day >= :recent), 0) AS recent_abs_error
+    FROM forecast_accuracy_daily
+    WHERE region_id = :region_id AND day >= :since
+    GROUP BY id_house
+"""
+
+
+def accuracy_metrics(points, abs_error, sq_error, error, ape_points, ape, actual) -> Dict[str, np.ndarray]:
+    """Метрики из накопителей (скаляры или массивы); NaN там, где точек нет"""
+    points = np.asarray(points, dtype=np.float64)
+    ape_points = np.asarray(ape_points, dtype=np.float64)
+    actual = np.asarray(actual, dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "mae": np.where(points > 0, abs_error / points, np.nan),
+            "rmse": np.where(points > 0, np.sqrt(sq_error / points), np.nan),
+            "mape": np.where(ape_points > 0, ape / ape_points * 100, np.nan),
+            "wape": np.where(actual > 0, abs_error / actual * 100, np.nan),
+            "bias": np.where(points > 0, error / points, np.nan),
+        }
+
+
+def _round(value, digits: int = 4) -> Optional[float]:
+    return None if value is None or np.isnan(value) else round(float(value), digits)
+
+
+class ForecastAccuracyTracker:
+    """Накопители ошибок прогноза по домам: пачки пятиминуток в памяти, суточные суммы в БД"""
+
+    def __init__(self, session_factory):
+        self._session_factory = session_factory
+        # (сутки, id_house, ошибка факт - yhat, факт) по проверенным, но ещё не записанным пятиминуткам
+        self._pending: List[Tuple[date, np.ndarray, np.ndarray, np.ndarray]] = []
+        self._pending_points = 0
+        self._flushed_points = 0
+        self._last_cleanup: Optional[date] = None
+
+    async def ensure_schema(self) -> None:
+        async with self._session_factory() as db:
+            for statement in SCHEMA_STATEMENTS:
+                await db.execute(text(statement))
+            await db.commit()
+
+    def observe(self, house_ids: np.ndarray, moment: datetime, actual: np.ndarray, yhat: np.ndarray) -> None:
+        """Слушатель детектора отклонений: факт и прогноз всех домов за одну пятиминутку"""
+        valid = ~np.isnan(actual) & ~np.isnan(yhat)
+        if not valid.any():
+            return
+        actual = actual[valid].astype(np.float64)
+        self._pending.append((moment.date(), house_ids[valid], actual - yhat[valid], actual))
+        self._pending_points += int(valid.sum())
+
+    def _aggregate(self, batches) -> Dict[str, List]:
+        """Пачки пятиминуток -> накопители по (сутки, дом) в виде массивов для unnest"""
+        days = np.concatenate([np.full(len(ids), np.datetime64(day, "D")) for day, ids, _, _ in batches])
+        house_ids = np.concatenate([ids for _, ids, _, _ in batches])
+        errors = np.concatenate([e for _, _, e, _ in batches])
+        actual = np.concatenate([a for _, _, _, a in batches])
+        keys, groups = np.unique(
+            np.column_stack([days.astype(np.int64), house_ids]), axis=0, return_inverse=True
+        )
+        groups = groups.reshape(-1)
+        with_ape = actual > MIN_COLD_5MIN
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ape = np.where(with_ape, np.abs(errors) / actual, 0.0)
+
+        def total(weights=None):
+            return np.bincount(groups, weights=weights, minlength=len(keys))
+
+        house_list = keys[:, 1].tolist()
+        return {
+            "region_ids": [district_registry.region_of(id_house) for id_house in house_list],
+            "house_ids": house_list,
+            "days": keys[:, 0].astype("datetime64[D]").astype(date).tolist(),
+            "points": total().astype(np.int64).tolist(),
+            "abs_error": total(np.abs(errors)).tolist(),
+            "sq_error": total(errors * errors).tolist(),
+            "error": total(errors).tolist(),
+            "ape_points": total(with_ape.astype(np.float64)).astype(np.int64).tolist(),
+            "ape": total(ape).tolist(),
+            "actual": total(actual).tolist(),
+        }
+
+    async def flush(self) -> int:
+        """Добавляет накопленное к суточным суммам одним запросом; возвращает число записанных точек"""
+        if not self._pending:
+            return 0
+        batches, self._pending = self._pending, []
+        points, self._pending_points = self._pending_points, 0
+        try:
+            params = self._aggregate(batches)
+            async with self._session_factory() as db:
+                await db.execute(text(UPSERT_SQL), params)
+                today = date.today()
+                if self._last_cleanup != today:
+                    await db.execute(
+                        text("DELETE FROM forecast_accuracy_daily WHERE day < :border"),
+                        {"border": today - timedelta(days=FORECAST_ACCURACY_RETENTION_DAYS)},
+                    )
+                await db.commit()
+            self._last_cleanup = today
+        except Exception:
+            # Не записанное вернётся в следующий flush, пришедшее за это время — после него
+            self._pending[:0] = batches
+            self._pending_points += points
+            raise
+        self._flushed_points += points
+        return points
+
+    async def run(self, interval: float = FORECAST_ACCURACY_FLUSH_SECONDS) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[accuracy] Error flushing forecast accuracy: {e}")
+
+    async def region_distribution(self, db, region_id: str, days: int, limit: int) -> Dict:
+        """Распределение метрик по домам района за days суток, худшие и деградировавшие дома"""
+        today = date.today()
+        since = today - timedelta(days=days - 1)
+        recent = today - timedelta(days=FORECAST_ACCURACY_RECENT_DAYS - 1)
+        result = await db.execute(
+            text(HOUSE_TOTALS_SQL), {"region_id": region_id, "since": since, "recent": recent}
+        )
+        rows = np.array([tuple(row) for row in result], dtype=np.float64).reshape(-1, 10)
+        rows = rows[rows[:, 1] >= MIN_POINTS]
+        house_ids = rows[:, 0].astype(np.int64)
+        metrics = accuracy_metrics(*rows[:, 1:8].T)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            recent_mae = np.where(rows[:, 8] > 0, rows[:, 9] / rows[:, 8], np.nan)
+            degradation = np.where(rows[:, 8] >= MIN_POINTS, recent_mae / metrics["mae"], np.nan)
+
+        distribution = {}
+        for name, values in {**metrics, "degradation": degradation}.items():
+            present = values[~np.isnan(values)]
+            distribution[name] = {
+                "houses": int(len(present)),
+                "mean": _round(present.mean()) if len(present) else None,
+                **{
+                    f"p{q}": _round(value)
+                    for q, value in zip(QUANTILES, np.percentile(present, QUANTILES) if len(present) else [None] * len(QUANTILES))
+                },
+                "max": _round(present.max()) if len(present) else None,
+            }
+
+        def ranked(values: np.ndarray) -> List[Dict]:
+            rows_order = np.argsort(-np.where(np.isnan(values), -np.inf, values))[:limit]
+            houses = []
+            for row in rows_order:
+                if np.isnan(values[row]):
+                    break
+                entry = address_index.house(int(house_ids[row]))
+                houses.append({
+                    "id_house": int(house_ids[row]),
+                    "address": (entry.simple_address if entry else None) or "Адрес не указан",
+                    "points": int(rows[row, 1]),
+                    **{name: _round(metric[row]) for name, metric in metrics.items()},
+                    "recent_mae": _round(recent_mae[row]),
+                    "degradation": _round(degradation[row]),
+                })
+            return houses
+
+        return {
+            "region_id": region_id,
+            "since": since.isoformat(),
+            "recent_since": recent.isoformat(),
+            "houses": int(len(house_ids)),
+            "distribution": distribution,
+            "worst_mape": ranked(metrics["mape"]),
+            "most_degraded": ranked(degradation),
+        }
+
+    async def house_daily(self, db, id_house: int, days: int) -> List[Dict]:
+        """Метрики дома по суткам за days суток"""
+        result = await db.execute(
+            text(f"""
+                SELECT day, {", ".join(ACCUMULATOR_COLUMNS)}
+                FROM forecast_accuracy_daily
+                WHERE region_id = :region_id AND id_house = :id_house AND day >= :since
+                ORDER BY day
+            """),
+            {
+                "region_id": district_registry.region_of(id_house),
+                "id_house": id_house,
+                "since": date.today() - timedelta(days=days - 1),
+            },
+        )
+        daily = []
+        for row in result:
+            metrics = accuracy_metrics(*(getattr(row, column) for column in ACCUMULATOR_COLUMNS))
+            daily.append({
+                "day": row.day.isoformat(),
+                "points": row.points,
+                **{name: _round(value) for name, value in metrics.items()},
+            })
+        return daily
+
+    def stats(self) -> Dict:
+        return {
+            "pending_points": self._pending_points,
+            "pending_slots": len(self._pending),
+            "flushed_points": self._flushed_points,
+        }
@@ -0,0 +1,269 @@
+"""
+Пакетный прогноз расхода ХВС по всем домам района (Prophet).
+
+Замена ноутбучного batch_forecast_save_separate / forecast_single_house:
+дома раздаются по пулу процессов, обучающие данные читаются из water_consump_hot
+по одному дому, а результаты через COPY копятся во временной таблице и одним
+проходом заменяют прогнозы в water_forecast_all.
+
+Запуск из директории backend:
+    python -m app.forecasting --workers 8 --days 7
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import asyncpg
+
+from db.database import ASYNCPG_DSN
+
+FORECAST_COLUMNS = ["id_house", "ds", "yhat", "yhat_lower", "yhat_upper"]
+# Меньше двух суток 5-минутных данных Prophet с суточной сезонностью не обучить
+MIN_TRAINING_POINTS = 2 * 24 * 12
+PROGRESS_REPORT_SECONDS = 10.0
+
+TRAINING_QUERY = """
+    SELECT time_5min, water_consumption
+    FROM public.water_consump_hot
+    WHERE id_house = $1
+      AND time_5min < $2
+      AND water_consumption IS NOT NULL
+    ORDER BY time_5min
+"""
+
+ForecastRecord = Tuple[int, datetime, float, float, float]
+ProgressCallback = Callable[[int, int], None]
+
+
+def _init_worker() -> None:
+    """Инициализация процесса пула: глушим подробные логи Prophet/cmdstanpy"""
+    logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+    logging.getLogger("prophet").setLevel(logging.WARNING)
+
+
+def forecast_single_house(
+    id_house: int,
+    times: Sequence[datetime],
+    values: Sequence[float],
+    days_forecast: int = 7,
+) -> List[ForecastRecord]:
+    """Обучение Prophet и прогноз для одного дома (выполняется в процессе пула)"""
+    import pandas as pd
+    from prophet import Prophet
+
+    prophet_df = pd.DataFrame({"ds": pd.to_datetime(list(times)), "y": list(values)})
+
+    # Параметры модели — как в ноутбуке "Копия Модели"
+    model = Prophet(
+        daily_seasonality=True,    # суточная сезонность
+        weekly_seasonality=True,   # недельная сезонность
+        yearly_seasonality=False,  # годовая не нужна для коротких рядов
+        changepoint_prior_scale=0.05,  # гибкость тренда
+        seasonality_prior_scale=20.0   # сила сезонности
+    )
+    model.add_seasonality(
+        name='daily_detailed',
+        period=1,
+        fourier_order=30,
+        prior_scale=15.0
+    )
+    model.add_seasonality(
+        name='weekly_detailed',
+        period=7,
+        fourier_order=20,
+        prior_scale=15.0
+    )
+    model.fit(prophet_df)
+
+    future = model.make_future_dataframe(
+        periods=days_forecast * 24 * 12,
+        freq='5min',
+        include_history=False
+    )
+    forecast = model.predict(future)
+
+    return [
+        (id_house, ds.to_pydatetime(), float(yhat), float(yhat_lower), float(yhat_upper))
+        for ds, yhat, yhat_lower, yhat_upper in zip(
+            forecast["ds"], forecast["yhat"], forecast["yhat_lower"], forecast["yhat_upper"]
+        )
+    ]
+
+
+async def _load_house_ids(conn: asyncpg.Connection) -> List[int]:
+    rows = await conn.fetch("SELECT id_house FROM lublino_houses_id ORDER BY id_house")
+    return [row["id_house"] for row in rows]
+
+
+async def _replace_forecasts(conn: asyncpg.Connection) -> int:
+    """Одним проходом заменяет прогнозы обработанных домов данными из временной таблицы"""
+    async with conn.transaction():
+        await conn.execute("""
+            DELETE FROM public.water_forecast_all f
+            USING (SELECT DISTINCT id_house FROM water_forecast_staging) s
+            WHERE f.id_house = s.id_house
+        """)
+        # region_id дома берётся из lublino_houses_id, строки сразу попадают в секцию района
+        status = await conn.execute(f"""
+            INSERT INTO public.water_forecast_all (region_id, {", ".join(FORECAST_COLUMNS)})
+            SELECT h.region_id, {", ".join("s." + column for column in FORECAST_COLUMNS)}
+            FROM water_forecast_staging s
+            JOIN lublino_houses_id h ON h.id_house = s.id_house
+        """)
+    return int(status.split()[-1])
+
+
+async def run_fleet_forecast(
+    house_ids: Optional[List[int]] = None,
+    start_forecast: Optional[datetime] = None,
+    days_forecast: int = 7,
+    workers: Optional[int] = None,
+    progress_callback: Optional[ProgressCallback] = None,
+    cancel_event: Optional[asyncio.Event] = None,
+) -> Dict:
+    """
+    Прогноз по всем (или указанным) домам в пуле процессов.
+    Возвращает статистику: сколько домов обработано, пропущено, с ошибкой, и скорость (домов/с).
+    При отмене через cancel_event уже посчитанные прогнозы в water_forecast_all не записываются.
+    """
+    workers = workers or os.cpu_count() or 1
+    start_forecast = start_forecast or datetime.now()
+    started = time.perf_counter()
+
+    read_conn = await asyncpg.connect(ASYNCPG_DSN)
+    write_conn = await asyncpg.connect(ASYNCPG_DSN)
+    stats = {
+        "houses_total": 0,
+        "houses_processed": 0,
+        "houses_skipped": 0,
+        "houses_failed": 0,
+        "rows_loaded": 0,
+        "cancelled": False,
+    }
+    try:
+        if house_ids is None:
+            house_ids = await _load_house_ids(read_conn)
+        stats["houses_total"] = len(house_ids)
+
+        await write_conn.execute(
+            "CREATE TEMP TABLE water_forecast_staging "
+            "(LIKE public.water_forecast_all INCLUDING DEFAULTS)"
+        )
+
+        loop = asyncio.get_running_loop()
+        last_report = started
+        in_flight_houses: Dict[asyncio.Future, int] = {}
+
+        async def collect(done) -> None:
+            nonlocal last_report
+            for future in done:
+                id_house = in_flight_houses.pop(future)
+                try:
+                    records = future.result()
+                except Exception as e:
+                    stats["houses_failed"] += 1
+                    print(f"[forecast] Ошибка прогноза для дома {id_house}: {e}")
+                    continue
+                await write_conn.copy_records_to_table(
+                    "water_forecast_staging", records=records, columns=FORECAST_COLUMNS
+                )
+                stats["houses_processed"] += 1
+
+            finished = stats["houses_processed"] + stats["houses_failed"] + stats["houses_skipped"]
+            if progress_callback:
+                progress_callback(finished, stats["houses_total"])
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_REPORT_SECONDS:
+                last_report = now
+                rate = stats["houses_processed"] / (now - started)
+                print(f"[forecast] {finished}/{stats['houses_total']} домов, {rate:.2f} домов/с")
+
+        # spawn, а не fork: из uvicorn форк скопировал бы цикл событий, потоки и сокеты сервера.
+        # Пул закрывается в потоке — shutdown(wait=True) иначе заблокировал бы цикл событий
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        try:
+            for id_house in house_ids:
+                if cancel_event is not None and cancel_event.is_set():
+                    stats["cancelled"] = True
+                    break
+
+                rows = await read_conn.fetch(TRAINING_QUERY, id_house, start_forecast)
+                if len(rows) < MIN_TRAINING_POINTS:
+                    stats["houses_skipped"] += 1
+                    continue
+
+                future = loop.run_in_executor(
+                    pool,
+                    forecast_single_house,
+                    id_house,
+                    [row["time_5min"] for row in rows],
+                    [row["water_consumption"] for row in rows],
+                    days_forecast,
+                )
+                in_flight_houses[future] = id_house
+
+                # Держим в очереди не больше двух домов на процесс, чтобы память не росла с размером района
+                if len(in_flight_houses) >= workers * 2:
+                    done, _ = await asyncio.wait(set(in_flight_houses), return_when=asyncio.FIRST_COMPLETED)
+                    await collect(done)
+
+            if stats["cancelled"]:
+                for future in in_flight_houses:
+                    future.cancel()
+            elif in_flight_houses:
+                done, _ = await asyncio.wait(set(in_flight_houses))
+                await collect(done)
+        finally:
+            await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
+
+        if not stats["cancelled"]:
+            stats["rows_loaded"] = await _replace_forecasts(write_conn)
+    finally:
+        await read_conn.close()
+        await write_conn.close()
+
+    elapsed = time.perf_counter() - started
+    stats["elapsed_seconds"] = round(elapsed, 2)
+    stats["houses_per_second"] = round(stats["houses_processed"] / elapsed, 3) if elapsed > 0 else 0.0
+    print(
+        f"[forecast] Готово за {elapsed:.1f} с: обработано {stats['houses_processed']}, "
+        f"пропущено {stats['houses_skipped']}, ошибок {stats['houses_failed']}, "
+        f"{stats['houses_per_second']} домов/с, строк в water_forecast_all: {stats['rows_loaded']}"
+    )
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Пакетный прогноз ХВС по всем домам (Prophet)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Количество процессов")
+    parser.add_argument("--days", type=int, default=7, help="Горизонт прогноза в днях")
+    parser.add_argument(
+        "--start",
+        type=datetime.fromisoformat,
+        default=None,
+        help="Начало прогноза, например 2025-10-02T00:00 (по умолчанию — текущее время)",
+    )
+    parser.add_argument("--houses", default=None, help="id_house через запятую (по умолчанию — все дома)")
+    args = parser.parse_args()
+
+    house_ids = [int(h) for h in args.houses.split(",")] if args.houses else None
+    asyncio.run(run_fleet_forecast(
+        house_ids=house_ids,
+        start_forecast=args.start,
+        days_forecast=args.days,
+        workers=args.workers,
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""
+Инкрементальный классификатор состояния домов (house_health в status_houses).
+
+Правила те же, что в запросе CREATE TABLE status_houses AS WITH warning_3, critical_1, warning_12:
+  - Red:    последний инцидент (тип 1) за 120 ч позже последнего "отклонения нет" (тип 2)
+            или за 120 ч был инцидент, а "отклонения нет" не было;
+  - Yellow: за 24 ч не меньше 3 инцидентов (тип 1) или не меньше 29 предупреждений (тип 3),
+            или за 120 ч последнее отклонение от прогноза (тип 4) не закрыто (тип 5);
+  - Green:  иначе.
+Вместо пересборки таблицы для каждого дома хранятся скользящие окна событий, а
+пересчитываются и записываются только дома, у которых окно изменилось — в том числе
+когда старые события выходят за границу окна.
+"""
+import asyncio
+import heapq
+import os
+from bisect import insort
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.districts import district_registry
+from app.incident_detector import (
+    FORECAST_DEVIATION_END,
+    FORECAST_DEVIATION_START,
+    INCIDENT_END,
+    INCIDENT_START,
+    WARNING_5MIN,
+)
+from app.notifications import enqueue_health_changes, notification_sender
+from app.status_snapshot import UNCHANGED, apply_status_change, commit_status_changes
+
+SHORT_WINDOW = timedelta(hours=24)
+LONG_WINDOW = timedelta(hours=120)
+YELLOW_MIN_INCIDENTS_24H = 3
+YELLOW_MIN_WARNINGS_24H = 29
+
+HEALTH_TICK_SECONDS = float(os.getenv("HEALTH_TICK_SECONDS", "60"))
+
+HealthChange = Tuple[int, Optional[str], str]
+
+
+def _append_sorted(window: Deque[datetime], event_time: datetime) -> None:
+    if not window or window[-1] <= event_time:
+        window.append(event_time)
+    else:
+        insort(window, event_time)
+
+
+def _expire(window: Deque[datetime], border: datetime) -> bool:
+    """Удаляет события старше границы окна; возвращает True, если что-то удалено"""
+    expired = False
+    while window and window[0] < border:
+        window.popleft()
+        expired = True
+    return expired
+
+
+class HouseHealthWindows:
+    """Скользящие окна событий incident_hist_2 для одного дома"""
+
+    __slots__ = (
+        "incidents_120h", "resolved_120h", "incidents_24h", "warnings_24h", "deviations_120h", "deviation_ends_120h"
+    )
+
+    def __init__(self):
+        self.incidents_120h: Deque[datetime] = deque()
+        self.resolved_120h: Deque[datetime] = deque()
+        self.incidents_24h: Deque[datetime] = deque()
+        self.warnings_24h: Deque[datetime] = deque()
+        self.deviations_120h: Deque[datetime] = deque()
+        self.deviation_ends_120h: Deque[datetime] = deque()
+
+    def _windows_of(self, type_incdnt: int) -> Tuple[Deque[datetime], ...]:
+        if type_incdnt == INCIDENT_START:
+            return self.incidents_120h, self.incidents_24h
+        if type_incdnt == INCIDENT_END:
+            return (self.resolved_120h,)
+        if type_incdnt == WARNING_5MIN:
+            return (self.warnings_24h,)
+        if type_incdnt == FORECAST_DEVIATION_START:
+            return (self.deviations_120h,)
+        if type_incdnt == FORECAST_DEVIATION_END:
+            return (self.deviation_ends_120h,)
+        return ()
+
+    def add(self, event_time: datetime, type_incdnt: int) -> None:
+        for window in self._windows_of(type_incdnt):
+            _append_sorted(window, event_time)
+
+    def remove(self, event_time: datetime, type_incdnt: int) -> bool:
+        """Убирает одно такое событие (если оно ещё в окнах); True — окна изменились"""
+        removed = False
+        for window in self._windows_of(type_incdnt):
+            try:
+                window.remove(event_time)
+                removed = True
+            except ValueError:
+                pass
+        return removed
+
+    def expire(self, now: datetime) -> bool:
+        long_border = now - LONG_WINDOW
+        short_border = now - SHORT_WINDOW
+        expired = _expire(self.incidents_120h, long_border)
+        expired = _expire(self.resolved_120h, long_border) or expired
+        expired = _expire(self.incidents_24h, short_border) or expired
+        expired = _expire(self.warnings_24h, short_border) or expired
+        expired = _expire(self.deviations_120h, long_border) or expired
+        expired = _expire(self.deviation_ends_120h, long_border) or expired
+        return expired
+
+    def is_empty(self) -> bool:
+        return not (
+            self.incidents_120h or self.resolved_120h or self.incidents_24h or self.warnings_24h
+            or self.deviations_120h or self.deviation_ends_120h
+        )
+
+    def next_expiry(self) -> Optional[datetime]:
+        candidates = []
+        if self.incidents_120h:
+            candidates.append(self.incidents_120h[0] + LONG_WINDOW)
+        if self.resolved_120h:
+            candidates.append(self.resolved_120h[0] + LONG_WINDOW)
+        if self.incidents_24h:
+            candidates.append(self.incidents_24h[0] + SHORT_WINDOW)
+        if self.warnings_24h:
+            candidates.append(self.warnings_24h[0] + SHORT_WINDOW)
+        if self.deviations_120h:
+            candidates.append(self.deviations_120h[0] + LONG_WINDOW)
+        if self.deviation_ends_120h:
+            candidates.append(self.deviation_ends_120h[0] + LONG_WINDOW)
+        return min(candidates) if candidates else None
+
+    def health(self) -> str:
+        last_incident = self.incidents_120h[-1] if self.incidents_120h else None
+        last_resolved = self.resolved_120h[-1] if self.resolved_120h else None
+
+        if last_incident is not None and (last_resolved is None or last_incident > last_resolved):
+            return "Red"
+        if len(self.incidents_24h) >= YELLOW_MIN_INCIDENTS_24H:
+            return "Yellow"
+        if len(self.warnings_24h) >= YELLOW_MIN_WARNINGS_24H:
+            return "Yellow"
+        last_deviation = self.deviations_120h[-1] if self.deviations_120h else None
+        last_deviation_end = self.deviation_ends_120h[-1] if self.deviation_ends_120h else None
+        if last_deviation is not None and (last_deviation_end is None or last_deviation > last_deviation_end):
+            return "Yellow"
+        return "Green"
+
+
+class HouseHealthClassifier:
+    """Классификатор по всем домам: окна, очередь истечений и текущее значение house_health"""
+
+    def __init__(self):
+        self._windows: Dict[int, HouseHealthWindows] = {}
+        self._current: Dict[int, Optional[str]] = {}
+        # События с временем в будущем ждут своего момента (в SQL их отсекает BETWEEN ... AND NOW())
+        self._pending: List[Tuple[datetime, int, int]] = []
+        # (момент истечения, id_house) — дома, у которых в этот момент что-то выйдет из окна
+        self._expiry: List[Tuple[datetime, int]] = []
+        self._dirty: Set[int] = set()
+
+    def reset(self) -> None:
+        self._windows.clear()
+        self._current.clear()
+        self._pending.clear()
+        self._expiry.clear()
+        self._dirty.clear()
+
+    def set_current_health(self, id_house: int, house_health: Optional[str]) -> None:
+        self._current[id_house] = house_health
+
+    def add_event(self, id_house: int, event_time: datetime, type_incdnt: int, now: Optional[datetime] = None) -> None:
+        now = now or datetime.now()
+        if event_time > now:
+            heapq.heappush(self._pending, (event_time, id_house, type_incdnt))
+            return
+        if event_time < now - LONG_WINDOW:
+            return
+        windows = self._windows.get(id_house)
+        if windows is None:
+            windows = HouseHealthWindows()
+            self._windows[id_house] = windows
+        windows.add(event_time, type_incdnt)
+        self._dirty.add(id_house)
+        expiry = windows.next_expiry()
+        if expiry is not None:
+            heapq.heappush(self._expiry, (expiry, id_house))
+
+    def add_events(self, incidents: Iterable[Dict], now: Optional[datetime] = None) -> None:
+        now = now or datetime.now()
+        for incident in incidents:
+            self.add_event(incident["id_house"], incident["time_5min"], incident["type_incdnt"], now)
+
+    def remove_events(self, incidents: Iterable[Dict]) -> None:
+        """Откатывает add_events для событий, транзакция которых не закоммитилась"""
+        for incident in incidents:
+            id_house, event_time, type_incdnt = incident["id_house"], incident["time_5min"], incident["type_incdnt"]
+            entry = (event_time, id_house, type_incdnt)
+            if entry in self._pending:
+                self._pending.remove(entry)
+                heapq.heapify(self._pending)
+                continue
+            windows = self._windows.get(id_house)
+            if windows is not None and windows.remove(event_time, type_incdnt):
+                self._dirty.add(id_house)
+
+    def discard(self, changes: List[HealthChange]) -> None:
+        """
+        Изменения из advance() не закоммитились: возвращаем прежние значения и снова помечаем дома,
+        чтобы следующий advance() вернул эти изменения ещё раз
+        """
+        for id_house, old_health, new_health in changes:
+            if self._current.get(id_house) == new_health:
+                self._current[id_house] = old_health
+            self._dirty.add(id_house)
+
+    def mark_all_dirty(self) -> None:
+        self._dirty.update(self._current.keys())
+        self._dirty.update(self._windows.keys())
+
+    def advance(self, now: Optional[datetime] = None) -> List[HealthChange]:
+        """
+        Сдвигает окна к моменту now и пересчитывает только затронутые дома.
+        Возвращает список (id_house, старое значение, новое значение) для изменившихся домов.
+        """
+        now = now or datetime.now()
+
+        while self._pending and self._pending[0][0] <= now:
+            event_time, id_house, type_incdnt = heapq.heappop(self._pending)
+            self.add_event(id_house, event_time, type_incdnt, now)
+
+        # Граница окна включительная (BETWEEN), поэтому событие истекает строго после expiry
+        while self._expiry and self._expiry[0][0] < now:
+            _, id_house = heapq.heappop(self._expiry)
+            windows = self._windows.get(id_house)
+            if windows is None:
+                continue
+            if windows.expire(now):
+                self._dirty.add(id_house)
+                expiry = windows.next_expiry()
+                if expiry is not None:
+                    heapq.heappush(self._expiry, (expiry, id_house))
+
+        changes: List[HealthChange] = []
+        for id_house in self._dirty:
+            windows = self._windows.get(id_house)
+            if windows is not None:
+                windows.expire(now)
+            new_health = windows.health() if windows is not None else "Green"
+            if windows is not None and windows.is_empty():
+                del self._windows[id_house]
+            old_health = self._current.get(id_house)
+            if new_health != old_health:
+                self._current[id_house] = new_health
+                changes.append((id_house, old_health, new_health))
+        self._dirty.clear()
+        return changes
+
+    async def warm_up(self, db: AsyncSession, now: Optional[datetime] = None) -> int:
+        """Загружает текущий house_health и события incident_hist_2 за последние 120 часов"""
+        now = now or datetime.now()
+        self.reset()
+
+        result = await db.execute(text("SELECT id_house, house_health FROM status_houses"))
+        for row in result.fetchall():
+            self._current[row.id_house] = row.house_health
+
+        result = await db.execute(
+            text("""
+                SELECT id_house, time_5min, type_incdnt
+                FROM public.incident_hist_2
+                WHERE time_5min >= :since
+                  AND type_incdnt IN (1, 2, 3, 4, 5)
+                ORDER BY id_house, time_5min
+            """),
+            {"since": now - LONG_WINDOW},
+        )
+        rows = result.fetchall()
+        for row in rows:
+            self.add_event(row.id_house, row.time_5min, row.type_incdnt, now)
+
+        # При старте сверяем все дома, как это делала полная пересборка status_houses
+        self.mark_all_dirty()
+        print(f"[health] Loaded {len(rows)} events for {len(self._windows)} houses")
+        return len(rows)
+
+
+classifier = HouseHealthClassifier()
+
+
+async def update_house_health(db: AsyncSession, now: Optional[datetime] = None) -> List[HealthChange]:
+    """
+    Пересчитывает затронутые дома и записывает изменившиеся house_health в status_houses.
+    Коммит (commit_status_changes) — на вызывающей стороне, сразу после него нужно вызвать apply_health_changes,
+    а если коммит не удался — classifier.discard(changes).
+    """
+    changes = classifier.advance(now)
+    if changes:
+        try:
+            await db.execute(
+                text("""
+                    UPDATE status_houses SET house_health = :house_health
+                    WHERE region_id = :region_id AND id_house = :id_house
+                """),
+                [
+                    {"region_id": district_registry.region_of(id_house), "id_house": id_house, "house_health": new_health}
+                    for id_house, _, new_health in changes
+                ],
+            )
+        except Exception:
+            classifier.discard(changes)
+            raise
+    return changes
+
+
+def apply_health_changes(changes: List[HealthChange]) -> None:
+    """Переносит закоммиченные изменения house_health в снимки статусов районов этих домов"""
+    for id_house, old_health, new_health in changes:
+        apply_status_change(
+            district_registry.region_of(id_house), old_health, None, new_health, UNCHANGED, id_house=id_house
+        )
+
+
+async def run_health_ticker(session_factory, interval: float = HEALTH_TICK_SECONDS) -> None:
+    """Фоновый цикл: раз в interval секунд сдвигает окна, чтобы старые события истекали вовремя"""
+    while True:
+        await asyncio.sleep(interval)
+        changes: List[HealthChange] = []
+        try:
+            async with session_factory() as db:
+                changes = await update_house_health(db)
+                if changes:
+                    notify = await enqueue_health_changes(db, changes)
+                    await commit_status_changes(db)
+                    apply_health_changes(changes)
+                    if notify:
+                        notification_sender.wake()
+                    print(f"[health] Updated house_health for {len(changes)} houses")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            classifier.discard(changes)
+            print(f"Error updating house health: {e}")
@@ -0,0 +1,73 @@
+"""
+Массовая смена статусов домов (status_houses) одним set-based запросом.
+
+Все изменения пачки передаются массивами в unnest и применяются одним UPDATE ... FROM в секциях
+районов домов; старые значения берутся из CTE, который блокирует строки (FOR UPDATE), поэтому
+RETURNING отдаёт и прежние, и новые house_health/status_incident без повторного чтения.
+"""
+import os
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.districts import district_registry
+
+BULK_STATUS_MAX_ITEMS = int(os.getenv("BULK_STATUS_MAX_ITEMS", "5000"))
+
+BULK_UPDATE_SQL = """
+    WITH requested AS (
+        SELECT *
+        FROM unnest(
+            CAST(:region_ids AS text[]), CAST(:house_ids AS bigint[]),
+            CAST(:set_status AS boolean[]), CAST(:statuses AS text[]),
+            CAST(:set_health AS boolean[]), CAST(:healths AS text[])
+        ) AS t(region_id, id_house, set_status, status_incident, set_health, house_health)
+    ),
+    old AS (
+        SELECT s.region_id, s.id_house, s.house_health, s.status_incident
+        FROM status_houses s
+        JOIN requested i ON i.region_id = s.region_id AND i.id_house = s.id_house
+        FOR UPDATE OF s
+    )
+    UPDATE status_houses s
+    SET status_incident = CASE WHEN i.set_status THEN i.status_incident ELSE s.status_incident END,
+        house_health = CASE WHEN i.set_health THEN i.house_health ELSE s.house_health END
+    FROM requested i
+    JOIN old o ON o.region_id = i.region_id AND o.id_house = i.id_house
+    WHERE s.region_id = i.region_id AND s.id_house = i.id_house
+    RETURNING s.region_id, s.id_house,
+              o.house_health AS old_health, o.status_incident AS old_status,
+              s.house_health AS new_health, s.status_incident AS new_status
+"""
+
+# id_house -> {"incident_status": ..., "house_health": ...} (только переданные поля)
+StatusUpdates = Dict[int, Dict[str, Optional[str]]]
+
+
+async def bulk_update_house_status(db: AsyncSession, updates: StatusUpdates) -> Tuple[List[Dict], List[int]]:
+    """
+    Применяет изменения одним запросом в транзакции вызывающего (коммит — на его стороне).
+    Возвращает строки с region_id, id_house, old_/new_health и old_/new_status
+    и id домов, которых нет в status_houses.
+    """
+    house_ids = list(updates)
+    params = {
+        "region_ids": [district_registry.region_of(id_house) for id_house in house_ids],
+        "house_ids": house_ids,
+        "set_status": [],
+        "statuses": [],
+        "set_health": [],
+        "healths": [],
+    }
+    for id_house in house_ids:
+        fields = updates[id_house]
+        params["set_status"].append("incident_status" in fields)
+        params["statuses"].append(fields.get("incident_status"))
+        params["set_health"].append("house_health" in fields)
+        params["healths"].append(fields.get("house_health"))
+
+    result = await db.execute(text(BULK_UPDATE_SQL), params)
+    rows = [dict(row._mapping) for row in result]
+    found = {row["id_house"] for row in rows}
+    return rows, [id_house for id_house in house_ids if id_house not in found]
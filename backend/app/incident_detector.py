@@ -0,0 +1,323 @@
+"""
+Потоковый детектор инцидентов по 5-минутным показаниям ХВС/ГВС.
+
+Повторяет логику скриптов incident_hist_1 / incident_hist_2 из "SQL Postgres water.sql",
+но считает её инкрементально: для каждого дома хранится окно из 12 последних показаний
+(скользящие суммы за 1 час) и флаги отклонений предыдущих строк, поэтому обработка
+одного показания стоит O(1) и не требует пересканирования water_consump_hot.
+
+Пачка показаний прогоняется по копиям состояний затронутых домов (stage); в детектор они
+попадают только после коммита (apply). Если транзакция откатилась, повтор той же пачки
+обработается заново, а не будет отброшен как уже виденный. Повторы показаний отсекает
+уникальный ключ water_consump_hot (id_house, time_5min).
+"""
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.districts import district_registry
+
+READINGS_UNIQUE_INDEX = "ux_water_consump_hot_house_time"
+
+# Размер окна: 12 пятиминуток = 1 час (ROWS BETWEEN 11 PRECEDING AND CURRENT ROW)
+WINDOW_SIZE = 12
+# Пороговые значения из SQL
+MIN_COLD_5MIN = 0.01
+MIN_COLD_1H = 0.05
+DEVIATION_THRESHOLD = 0.1
+
+INCIDENT_START = 1
+INCIDENT_END = 2
+WARNING_5MIN = 3
+# Расход ХВС за час вышел за интервал прогноза и начал/перестал отклоняться (app.residual_detector)
+FORECAST_DEVIATION_START = 4
+FORECAST_DEVIATION_END = 5
+
+
+def format_percent(value: float) -> str:
+    """Аналог to_char(value * 100, '999%') из PostgreSQL"""
+    percent = value * 100
+    rounded = int(percent + 0.5) if percent >= 0 else -int(-percent + 0.5)
+    if abs(rounded) > 999:
+        return " ###%"
+    sign = "-" if rounded < 0 else " "
+    return f"{sign}{abs(rounded):>3}%"
+
+
+def incident_comment(type_incdnt: int, diffr_prcnt_1h: float) -> str:
+    """Текст comment_incdnt в том же виде, что формирует incident_hist_2"""
+    if type_incdnt == INCIDENT_START:
+        return "Инцидент: отклонение ХВС-ГВС за 1 час на" + format_percent(diffr_prcnt_1h)
+    if type_incdnt == INCIDENT_END:
+        return "Отклонения за 1 час нет"
+    return "Предупреждение: отклонение ХВС-ГВС за 5 мин"
+
+
+class HouseDetectorState:
+    """Состояние детектора для одного дома"""
+
+    __slots__ = (
+        "cold_window",
+        "hot_window",
+        "cold_sum",
+        "hot_sum",
+        "since_resync",
+        "prev_fl_1h",
+        "prev_kept_fl_5min",
+        "last_time",
+    )
+
+    def __init__(self):
+        self.cold_window: Deque[float] = deque(maxlen=WINDOW_SIZE)
+        self.hot_window: Deque[float] = deque(maxlen=WINDOW_SIZE)
+        self.cold_sum = 0.0
+        self.hot_sum = 0.0
+        self.since_resync = 0
+        # lag(fl_incident_1h) по всем показаниям дома
+        self.prev_fl_1h: Optional[int] = None
+        # lag(fl_incident_5min) по строкам, попавшим в incident_hist_1 (как в SQL)
+        self.prev_kept_fl_5min: Optional[int] = None
+        self.last_time: Optional[datetime] = None
+
+    def copy(self) -> "HouseDetectorState":
+        clone = HouseDetectorState.__new__(HouseDetectorState)
+        for name in self.__slots__:
+            setattr(clone, name, getattr(self, name))
+        clone.cold_window = deque(self.cold_window, maxlen=WINDOW_SIZE)
+        clone.hot_window = deque(self.hot_window, maxlen=WINDOW_SIZE)
+        return clone
+
+    def push(self, cold: float, hot: float) -> None:
+        if len(self.cold_window) == WINDOW_SIZE:
+            self.cold_sum -= self.cold_window[0]
+            self.hot_sum -= self.hot_window[0]
+        self.cold_window.append(cold)
+        self.hot_window.append(hot)
+        self.cold_sum += cold
+        self.hot_sum += hot
+
+        # Раз в окно пересчитываем суммы целиком, чтобы не копилась ошибка округления
+        self.since_resync += 1
+        if self.since_resync >= WINDOW_SIZE:
+            self.cold_sum = sum(self.cold_window)
+            self.hot_sum = sum(self.hot_window)
+            self.since_resync = 0
+
+
+class IncidentDetector:
+    """Детектор инцидентов по всем домам"""
+
+    def __init__(self):
+        self._houses: Dict[int, HouseDetectorState] = {}
+        # Пачки стадируются и применяются по очереди: следующая начинается от состояния с учётом предыдущей
+        self.lock = asyncio.Lock()
+
+    def reset(self) -> None:
+        self._houses.clear()
+
+    def process(
+        self,
+        id_house: int,
+        time_5min: datetime,
+        water_consumption: Optional[float],
+        water_hot: Optional[float],
+        houses: Optional[Dict[int, HouseDetectorState]] = None,
+    ) -> Optional[Dict]:
+        """
+        Обрабатывает одно показание дома (по состояниям houses, по умолчанию — самого детектора).
+        Возвращает строку для incident_hist_2 или None, если перехода нет.
+        """
+        houses = self._houses if houses is None else houses
+        state = houses.get(id_house)
+        if state is None:
+            state = HouseDetectorState()
+            houses[id_house] = state
+        elif state.last_time is not None and time_5min <= state.last_time:
+            # Повтор или запоздавшее показание — окно уже ушло дальше
+            print(f"[detector] Skipping out-of-order reading for house {id_house}: {time_5min} <= {state.last_time}")
+            return None
+        state.last_time = time_5min
+
+        # SUM() в SQL игнорирует NULL, поэтому пропуски считаем нулями
+        cold = water_consumption or 0.0
+        hot = water_hot or 0.0
+        state.push(cold, hot)
+
+        if water_consumption is not None and water_hot is not None and water_consumption > MIN_COLD_5MIN:
+            diffr_prcnt_5min = abs(water_consumption - water_hot) / water_consumption
+        else:
+            diffr_prcnt_5min = 0.0
+        fl_5min = int(diffr_prcnt_5min > DEVIATION_THRESHOLD)
+
+        cold_1h = state.cold_sum
+        hot_1h = state.hot_sum
+        if cold_1h > MIN_COLD_1H:
+            diffr_prcnt_1h = abs(cold_1h - hot_1h) / cold_1h
+        else:
+            diffr_prcnt_1h = 0.0
+        fl_1h = int(diffr_prcnt_1h > DEVIATION_THRESHOLD)
+
+        prev_fl_1h = state.prev_fl_1h
+        state.prev_fl_1h = fl_1h
+
+        # Фильтр incident_hist_1
+        kept = fl_5min == 1 or fl_1h == 1 or (fl_1h == 0 and prev_fl_1h == 1)
+        if not kept:
+            return None
+
+        prev_kept_fl_5min = state.prev_kept_fl_5min
+        state.prev_kept_fl_5min = fl_5min
+
+        # Классификация incident_hist_2
+        if fl_1h == 1 and (prev_fl_1h or 0) == 0:
+            type_incdnt = INCIDENT_START
+        elif fl_1h == 0 and prev_fl_1h == 1:
+            type_incdnt = INCIDENT_END
+        elif fl_5min == 1 and prev_kept_fl_5min == 0:
+            type_incdnt = WARNING_5MIN
+        else:
+            return None
+
+        return {
+            "id_house": id_house,
+            "time_5min": time_5min,
+            "diffr_prcnt_1h": diffr_prcnt_1h,
+            "type_incdnt": type_incdnt,
+            "comment_incdnt": incident_comment(type_incdnt, diffr_prcnt_1h),
+        }
+
+    def process_many(self, readings: Iterable[Dict], houses: Optional[Dict[int, HouseDetectorState]] = None) -> List[Dict]:
+        """Обрабатывает пачку показаний (в порядке времени внутри дома)"""
+        incidents = []
+        for reading in readings:
+            incident = self.process(
+                reading["id_house"],
+                reading["time_5min"],
+                reading.get("water_consumption"),
+                reading.get("water_hot"),
+                houses,
+            )
+            if incident:
+                incidents.append(incident)
+        return incidents
+
+    def stage(self, readings: List[Dict]) -> Tuple[List[Dict], Dict[int, HouseDetectorState]]:
+        """Прогоняет пачку по копиям состояний её домов, не меняя детектор; копии применяет apply()"""
+        staged: Dict[int, HouseDetectorState] = {}
+        for reading in readings:
+            id_house = reading["id_house"]
+            if id_house not in staged:
+                current = self._houses.get(id_house)
+                staged[id_house] = current.copy() if current is not None else HouseDetectorState()
+        return self.process_many(readings, staged), staged
+
+    def apply(self, staged: Dict[int, HouseDetectorState]) -> None:
+        """Переносит состояния домов после успешного коммита пачки"""
+        self._houses.update(staged)
+
+    async def warm_up(self, db: AsyncSession) -> int:
+        """
+        Восстанавливает окна детектора из последних показаний в water_consump_hot.
+        Берётся WINDOW_SIZE + 1 показание на дом, чтобы восстановить и флаг предыдущего часа.
+        """
+        query = text("""
+            SELECT w.id_house, w.time_5min, w.water_consumption, w.water_hot
+            FROM lublino_houses_id h
+            CROSS JOIN LATERAL (
+                SELECT id_house, time_5min, water_consumption, water_hot
+                FROM public.water_consump_hot
+                WHERE id_house = h.id_house
+                ORDER BY time_5min DESC
+                LIMIT :depth
+            ) w
+            ORDER BY w.id_house, w.time_5min
+        """)
+        result = await db.execute(query, {"depth": WINDOW_SIZE + 1})
+        rows = result.fetchall()
+
+        self.reset()
+        for row in rows:
+            self.process(row.id_house, row.time_5min, row.water_consumption, row.water_hot)
+        print(f"[detector] Warmed up {len(self._houses)} houses from {len(rows)} readings")
+        return len(self._houses)
+
+
+detector = IncidentDetector()
+
+
+@dataclass
+class IngestResult:
+    """Итог пачки до коммита: новые показания, найденные переходы и состояния домов для detector.apply"""
+    readings: List[Dict]
+    incidents: List[Dict]
+    staged: Dict[int, HouseDetectorState]
+
+
+async def ensure_schema(db: AsyncSession) -> None:
+    """Уникальный ключ показаний (id_house, time_5min); дубли, накопившиеся до него, удаляются один раз"""
+    result = await db.execute(text(f"SELECT to_regclass('public.{READINGS_UNIQUE_INDEX}')"))
+    if result.scalar() is not None:
+        return
+    deleted = await db.execute(text("""
+        DELETE FROM public.water_consump_hot a
+        USING public.water_consump_hot b
+        WHERE a.id_house = b.id_house AND a.time_5min = b.time_5min AND a.ctid > b.ctid
+    """))
+    await db.execute(text(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {READINGS_UNIQUE_INDEX} ON public.water_consump_hot (id_house, time_5min)"
+    ))
+    print(f"[detector] Created {READINGS_UNIQUE_INDEX}, removed {deleted.rowcount} duplicate readings")
+
+
+async def ingest_readings(db: AsyncSession, readings: List[Dict]) -> IngestResult:
+    """
+    Сохраняет новые показания в water_consump_hot (повторы (id_house, time_5min) отбрасываются),
+    прогоняет их через копию состояния детектора и записывает найденные переходы в incident_hist_2.
+    Коммит — на вызывающей стороне (под detector.lock), после него — detector.apply(result.staged).
+    """
+    if not readings:
+        return IngestResult([], [], {})
+
+    # Внутри пачки остаётся первое показание с данным (id_house, time_5min)
+    unique: Dict[tuple, Dict] = {}
+    for reading in readings:
+        unique.setdefault((reading["id_house"], reading["time_5min"]), reading)
+    readings = sorted(unique.values(), key=lambda r: (r["id_house"], r["time_5min"]))
+    result = await db.execute(
+        text("""
+            INSERT INTO public.water_consump_hot (id_house, time_5min, water_consumption, water_hot)
+            SELECT *
+            FROM unnest(
+                CAST(:house_ids AS bigint[]), CAST(:times AS timestamp[]),
+                CAST(:cold AS double precision[]), CAST(:hot AS double precision[])
+            )
+            ON CONFLICT (id_house, time_5min) DO NOTHING
+            RETURNING id_house, time_5min
+        """),
+        {
+            "house_ids": [r["id_house"] for r in readings],
+            "times": [r["time_5min"] for r in readings],
+            "cold": [r.get("water_consumption") for r in readings],
+            "hot": [r.get("water_hot") for r in readings],
+        },
+    )
+    inserted = {(row.id_house, row.time_5min) for row in result}
+    readings = [r for r in readings if (r["id_house"], r["time_5min"]) in inserted]
+
+    incidents, staged = detector.stage(readings)
+    if incidents:
+        await db.execute(
+            text("""
+                INSERT INTO public.incident_hist_2
+                    (region_id, id_house, time_5min, diffr_prcnt_1h, type_incdnt, comment_incdnt)
+                VALUES (:region_id, :id_house, :time_5min, :diffr_prcnt_1h, :type_incdnt, :comment_incdnt)
+            """),
+            # Строка сразу попадает в секцию района дома
+            [{**incident, "region_id": district_registry.region_of(incident["id_house"])} for incident in incidents],
+        )
+    return IngestResult(readings, incidents, staged)
@@ -0,0 +1,135 @@
+"""
+Кэш ответов LLM для /api/ask-llm и /api/houses/{house_id}/ask-llm.
+
+Ключ — нормализованный вопрос плюс хэш контекста, на котором строился ответ,
+поэтому при изменении данных дома или района ответ автоматически перестаёт совпадать.
+Дополнительно записи привязаны к областям ("house:<id>", "region:<id>") и сбрасываются
+при изменении статуса дома. Вытеснение — LRU, время жизни ограничено TTL.
+"""
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from app.status_snapshot import add_status_change_listener
+
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "600"))
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]", re.UNICODE)
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """«Какие дома в ремонте?» и «какие  дома в ремонте» дают один ключ"""
+    normalized = question.lower().replace("ё", "е")
+    normalized = _PUNCTUATION_RE.sub(" ", normalized)
+    return _SPACES_RE.sub(" ", normalized).strip()
+
+
+def house_scope(house_id) -> str:
+    return f"house:{house_id}"
+
+
+def region_scope(region_id: str) -> str:
+    return f"region:{region_id}"
+
+
+class LLMAnswerCache:
+    """LRU-кэш с TTL и сбросом по областям"""
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES, ttl_seconds: float = LLM_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (answer, expires_at, scopes)
+        self._entries: "OrderedDict[str, Tuple[str, float, Tuple[str, ...]]]" = OrderedDict()
+        self._scopes: Dict[str, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(question: str, context: str) -> str:
+        context_hash = hashlib.sha256(context.encode("utf-8")).hexdigest()
+        return f"{normalize_question(question)}|{context_hash}"
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        answer, expires_at, _ = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return answer
+
+    def put(self, key: str, answer: str, scopes: Iterable[str]) -> None:
+        if self.max_entries <= 0:
+            return
+        if key in self._entries:
+            self._remove(key)
+        scopes = tuple(scopes)
+        self._entries[key] = (answer, time.monotonic() + self.ttl_seconds, scopes)
+        for scope in scopes:
+            self._scopes.setdefault(scope, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def invalidate(self, scope: str) -> int:
+        keys = self._scopes.pop(scope, set())
+        for key in keys:
+            self._remove(key)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._scopes.clear()
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for scope in entry[2]:
+            keys = self._scopes.get(scope)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._scopes[scope]
+
+    def stats(self) -> Dict:
+        requests = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / requests, 4) if requests else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+llm_cache = LLMAnswerCache()
+
+
+def _on_status_change(region_id: str, id_house: Optional[int], new_health: Optional[str], new_status: Optional[str]) -> None:
+    if id_house is not None:
+        llm_cache.invalidate(house_scope(id_house))
+    llm_cache.invalidate(region_scope(region_id))
+
+
+add_status_change_listener(_on_status_change)
@@ -0,0 +1,131 @@
+"""
+Общий клиент к OpenRouter (chat/completions) для всех вопросов к LLM.
+
+Один долгоживущий httpx.AsyncClient с keep-alive и HTTP/2 вместо нового клиента
+(и нового TLS-рукопожатия) на каждый вопрос. Поддерживает обычный ответ и потоковый
+(stream=true, Server-Sent Events). Адрес задаётся OPENROUTER_BASE_URL, поэтому клиент
+можно направить на локальный mock-сервер completions.
+"""
+import json
+import os
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from app.tracing import span
+
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1").rstrip("/")
+LLM_MODEL = os.getenv("LLM_MODEL", "deepseek/deepseek-chat-v3.1:free")
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+class LLMUpstreamError(Exception):
+    """Ошибка ответа OpenRouter"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=OPENROUTER_BASE_URL,
+            http2=True,
+            timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                keepalive_expiry=120.0,
+            ),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _headers() -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {os.getenv('OPENROUTER_API_KEY')}",
+        "Content-Type": "application/json",
+    }
+
+
+def _request_body(prompt: str, max_tokens: int, stream: bool) -> Dict:
+    return {
+        "model": LLM_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.3,
+        "max_tokens": max_tokens,
+        "stream": stream,
+    }
+
+
+def _error_message(body: bytes) -> str:
+    try:
+        return json.loads(body).get("error", {}).get("message", "Unknown error")
+    except (ValueError, AttributeError):
+        return "Unknown error"
+
+
+async def complete(prompt: str, max_tokens: int) -> str:
+    """Полный ответ модели одной строкой"""
+    with span("llm_upstream"):
+        resp = await get_client().post(
+            "/chat/completions",
+            headers=_headers(),
+            json=_request_body(prompt, max_tokens, stream=False),
+        )
+    if resp.status_code != 200:
+        raise LLMUpstreamError(resp.status_code, _error_message(resp.content))
+    return resp.json()["choices"][0]["message"]["content"].strip()
+
+
+async def stream_completion(prompt: str, max_tokens: int) -> AsyncIterator[str]:
+    """Фрагменты ответа модели по мере генерации (stream=true)"""
+    # Для потока — время до последнего фрагмента (включая паузы, пока клиент читает ответ)
+    with span("llm_upstream"):
+        async with get_client().stream(
+            "POST",
+            "/chat/completions",
+            headers=_headers(),
+            json=_request_body(prompt, max_tokens, stream=True),
+        ) as resp:
+            if resp.status_code != 200:
+                raise LLMUpstreamError(resp.status_code, _error_message(await resp.aread()))
+
+            async for line in resp.aiter_lines():
+                # Строки-комментарии (": OPENROUTER PROCESSING") и пустые разделители пропускаем
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    continue
+                if "error" in chunk:
+                    raise LLMUpstreamError(502, chunk["error"].get("message", "Unknown error"))
+                choices: List[Dict] = chunk.get("choices") or []
+                if not choices:
+                    continue
+                token = (choices[0].get("delta") or {}).get("content")
+                if token:
+                    yield token
+
+
+def sse_event(data: Dict, event: Optional[str] = None) -> str:
+    """Форматирует одно событие Server-Sent Events"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,52 @@
+"""
+Параллельная сборка контекста для вопросов LLM о доме.
+
+Карточка дома, три ряда расхода/прогноза и история инцидентов не зависят друг от друга,
+поэтому читаются одновременно — каждое чтение в своей сессии из пула.
+Время до ответа определяется самым медленным запросом, а не их суммой.
+Контекстов одновременно собирается не больше LLM_CONTEXT_MAX_SESSIONS // CONTEXT_READS (каждый —
+целиком, все чтения параллельно), чтобы всплеск вопросов к LLM не занял весь пул подключений
+(DB_POOL_SIZE + DB_MAX_OVERFLOW) и не остановил остальные эндпоинты.
+"""
+import asyncio
+import os
+from typing import Dict, List, Optional, Tuple
+
+from db.database import AsyncSessionLocal
+from app.real_data import (
+    WATER_DATA_QUERIES,
+    get_incident_history_for_llm,
+    get_real_house_detail,
+    get_water_series_for_llm,
+)
+from app.schemas import HouseDetail
+
+LLM_CONTEXT_MAX_SESSIONS = int(os.getenv("LLM_CONTEXT_MAX_SESSIONS", "10"))
+
+# Карточка дома, история инцидентов и ряды WATER_DATA_QUERIES — по сессии на чтение
+CONTEXT_READS = 2 + len(WATER_DATA_QUERIES)
+
+_slots = asyncio.Semaphore(max(1, LLM_CONTEXT_MAX_SESSIONS // CONTEXT_READS))
+
+
+async def _in_session(reader, *args, **kwargs):
+    async with AsyncSessionLocal() as db:
+        return await reader(db, *args, **kwargs)
+
+
+async def load_house_llm_context(
+    house_id: str,
+    hours_back: int = 720,
+) -> Tuple[Optional[HouseDetail], Dict[str, List[Dict]], List[Dict]]:
+    """
+    Возвращает (карточка дома, ряды для LLM, история инцидентов).
+    Карточка равна None, если дом не найден.
+    """
+    water_keys = list(WATER_DATA_QUERIES)
+    async with _slots:
+        house, history, *series = await asyncio.gather(
+            _in_session(get_real_house_detail, house_id),
+            _in_session(get_incident_history_for_llm, house_id, hours_back=hours_back),
+            *(_in_session(get_water_series_for_llm, house_id, key) for key in water_keys),
+        )
+    return house, dict(zip(water_keys, series)), history
@@ -1,38 +1,72 @@
-from fastapi import Depends, FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict, List, Optional
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
-from db.database import get_db
+from db.database import AsyncSessionLocal, engine, get_db
 from sqlalchemy import text, select
 from fastapi import HTTPException
-import httpx
 import os
+import asyncio
+import json
+import secrets
+import time
 from dotenv import load_dotenv
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 
 from .schemas import (
     DashboardMetrics,
-    HouseListItem,
     HouseDetail,
+    HouseListPage,
+    HouseOptionsPage,
+    HouseStatusBulkUpdate,
     LLMQuestionRequest,
+    RegionCreate,
+    RegionInfo,
+    WaterReadingsBatch,
 )
 
 from .real_data import (
-    REGION_ID_TO_NAME,
+    count_real_houses,
     get_full_llm_context,
-    get_incident_history_for_llm,
+    get_house_options,
+    get_house_rollup_series,
+    get_house_water_series,
     get_real_dashboard_metrics,
     get_real_house_list,
     get_real_house_detail,
     get_real_llm_context,
-    get_regional_forecast_cold_water_24h_hourly_random,
     get_regional_incident_stats,
-    get_water_data_for_llm,
 )
 from .models import LublinoHousesId, StatusHealth
+from .districts import InvalidDistrict, district_registry
+from .address_search import address_index
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor
+from .status_snapshot import apply_status_change, commit_status_changes
+from .status_push import status_hub
+from .timeseries_store import timeseries_store
+from .rollups import RollupEngine
+from .regional_forecast import RegionalForecastAggregate
+from .export import ExportBusy, arrow_available, open_export
+from .llm_context import load_house_llm_context
+from .llm_cache import house_scope, llm_cache, region_scope
+from .llm_client import LLMUpstreamError, close_client, complete as llm_complete, sse_event, stream_completion
+from .incident_detector import IngestResult, detector, ensure_schema as ensure_readings_schema, ingest_readings
+from .house_status import BULK_STATUS_MAX_ITEMS, bulk_update_house_status
+from .house_health import apply_health_changes, classifier, run_health_ticker, update_house_health
+from .residual_detector import residual_detector, run_residual_detector
+from .forecast_accuracy import FORECAST_ACCURACY_RETENTION_DAYS, ForecastAccuracyTracker
+from .notifications import (
+    enqueue_health_changes,
+    enqueue_house_notification,
+    enqueue_house_notifications,
+    notification_sender,
+    notifications_enabled,
+)
+from .relearn_jobs import DEFAULT_MODEL_NAME, RelearnJobConflict, RelearnJobRunner
+from . import db_metrics, metrics, profiler
+from .tracing import TracingMiddleware, add_span, latency_report, span
 
 app = FastAPI(title="GVS Monitoring API")
 
@@ -43,127 +77,198 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(TracingMiddleware)
 
 load_dotenv() 
 
-# Email конфигурация
-SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.mail.ru")
-SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
-EMAIL_USER = os.getenv("EMAIL_USER")
-EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
-NOTIFICATION_EMAILS = [email.strip() for email in os.getenv("NOTIFICATION_EMAILS", "").split(",") if email.strip()]
-
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+# Токен для /api/admin/* и регистрации районов (заголовок X-Admin-Token); пусто — эндпоинты закрыты
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
 
-def format_regional_forecasts_for_llm(forecast_list: List[Dict]) -> str:
-    """
-    Форматирует список прогнозов ХВС для LLM контекста.
-    """
-    if not forecast_list:
-        return "Нет прогнозных данных по ХВС для выбранных рандомных домов на ближайшие 24 часа (1-час интервал)."
-    lines = []
-    for item in forecast_list[:20]: # Ограничиваем, чтобы не перегружать контекст
-        addr = item["address"]
-        time_str = item["time_str"]
-        value = item["forecast_value"]
-        lines.append(f"- {addr} ({time_str}): {value} (прогноз)")
-    return "\n".join(lines)
 
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled: ADMIN_TOKEN is not set")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
 
-def send_email_notification(house_id: str, address: str, status: str, incident_status: str):
-    """
-    Отправка email уведомления о новом инциденте
-    """
-    if not EMAIL_USER or not EMAIL_PASSWORD or not NOTIFICATION_EMAILS:
-        print(f"Email configuration not set, skipping notification")
-        print(f"EMAIL_USER: {EMAIL_USER is not None}")
-        print(f"EMAIL_PASSWORD: {EMAIL_PASSWORD is not None}")
-        print(f"NOTIFICATION_EMAILS: {NOTIFICATION_EMAILS}")
+
+_background_tasks: List[asyncio.Task] = []
+db_metrics.install(engine)
+rollup_engine = RollupEngine(AsyncSessionLocal)
+regional_forecasts = RegionalForecastAggregate(AsyncSessionLocal)
+relearn_runner = RelearnJobRunner(AsyncSessionLocal, on_forecasts_replaced=regional_forecasts.wake)
+forecast_accuracy = ForecastAccuracyTracker(AsyncSessionLocal)
+residual_detector.add_slot_listener(forecast_accuracy.observe)
+
+
+@app.on_event("startup")
+async def prepare_districts():
+    """Реестр районов и секционирование таблиц по району — до остальных хуков, которые читают region_id"""
+    try:
+        async with AsyncSessionLocal() as db:
+            await district_registry.ensure_schema(db)
+            await district_registry.reload(db)
+    except Exception as e:
+        print(f"Error preparing district partitions: {e}")
+
+
+@app.on_event("startup")
+async def start_notification_sender():
+    """Таблица notification_outbox нужна до warm_up_incident_pipeline: он ставит в неё уведомления"""
+    if not notifications_enabled():
+        print("NOTIFICATION_EMAILS not set, email notifications disabled")
         return
-    
-    # Определяем, нужно ли отправлять уведомление (только для проблемных статусов)
-    if status.lower() not in ['red', 'yellow']:
-        print(f"Skipping notification for status: {status}")
+    try:
+        await notification_sender.ensure_schema()
+    except Exception as e:
+        print(f"Error preparing notification_outbox table: {e}")
         return
-    
-    # Маппинг статусов на русский
-    status_mapping = {
-        'red': 'Критический',
-        'yellow': 'Проблемный', 
-        'green': 'В норме'
-    }
-    
-    # Маппинг статусов инцидента на русский
-    incident_mapping = {
-        'New': 'Новый',
-        'Work': 'В работе',
-        'Repair': 'В ремонте',
-        'Resolved': 'Решен',
-        'None': 'Статус не задан'
-    }
-    
-    # Преобразуем статусы в русские
-    russian_status = status_mapping.get(status.lower(), status)
-    russian_incident_status = incident_mapping.get(incident_status, incident_status)
-    
-    subject = f"🚨 Новый инцидент в доме - {address}"
-    
-    body = f"""
-    <html>
-    <body>
-        <h2>🚨 Новый инцидент в доме</h2>
-        <p><strong>ID дома:</strong> {house_id}</p>
-        <p><strong>Адрес:</strong> {address}</p>
-        <p><strong>Статус дома:</strong> {russian_status}</p>
-        <p><strong>Статус инцидента:</strong> {russian_incident_status}</p>
-        <p><strong>Время:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
-        <hr>
-        <p>Это автоматическое уведомление от системы мониторинга ГВС.</p>
-    </body>
-    </html>
-    """
-    
+    _background_tasks.append(asyncio.create_task(notification_sender.run()))
+
+
+@app.on_event("startup")
+async def warm_up_incident_pipeline():
+    """Восстанавливаем окна потокового детектора инцидентов и классификатора состояния домов"""
     try:
-        print(f"Attempting to send email to: {NOTIFICATION_EMAILS}")
-        
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_USER
-        msg['To'] = ", ".join(NOTIFICATION_EMAILS)
-        msg['Subject'] = subject
-        
-        msg.attach(MIMEText(body, 'html'))
-        
-        # Выбираем метод подключения в зависимости от порта
-        if SMTP_PORT == 465:
-            # SSL
-            print(f"Using SSL connection to {SMTP_SERVER}:{SMTP_PORT}")
-            with smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT) as server:
-                server.login(EMAIL_USER, EMAIL_PASSWORD)
-                server.send_message(msg)
-        else:
-            # TLS
-            print(f"Using TLS connection to {SMTP_SERVER}:{SMTP_PORT}")
-            with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-                server.starttls()
-                server.login(EMAIL_USER, EMAIL_PASSWORD)
-                server.send_message(msg)
-        
-        print(f"Email notification sent successfully for house {house_id}")
-        
-    except smtplib.SMTPAuthenticationError as e:
-        print(f"SMTP Authentication Error: {e}")
-        print("Check your email credentials and app password settings")
-    except smtplib.SMTPRecipientsRefused as e:
-        print(f"SMTP Recipients Refused Error: {e}")
-        print(f"Check if recipient emails are valid: {NOTIFICATION_EMAILS}")
-    except smtplib.SMTPConnectError as e:
-        print(f"SMTP Connection Error: {e}")
-        print(f"Check if {SMTP_SERVER}:{SMTP_PORT} is accessible")
+        async with AsyncSessionLocal() as db:
+            await ensure_readings_schema(db)
+            await db.commit()
     except Exception as e:
-        print(f"Failed to send email notification: {e}")
-        import traceback
-        traceback.print_exc()
-        
+        print(f"Error creating unique key of water_consump_hot: {e}")
+    changes = []
+    try:
+        async with AsyncSessionLocal() as db:
+            await detector.warm_up(db)
+            await classifier.warm_up(db)
+            changes = await update_house_health(db)
+            await enqueue_health_changes(db, changes)
+            await commit_status_changes(db)
+            apply_health_changes(changes)
+        notification_sender.wake()
+        print(f"[health] Reconciled house_health on startup: {len(changes)} houses changed")
+    except Exception as e:
+        classifier.discard(changes)
+        print(f"Error warming up incident detector: {e}")
+    _background_tasks.append(asyncio.create_task(run_health_ticker(AsyncSessionLocal)))
+
+
+@app.on_event("startup")
+async def load_address_index():
+    """Индекс адресов он же реестр домов в памяти; пересобирается, если lublino_houses_id изменилась"""
+    try:
+        async with AsyncSessionLocal() as db:
+            await address_index.rebuild(db)
+    except Exception as e:
+        print(f"Error building address index: {e}")
+    _background_tasks.append(asyncio.create_task(address_index.run_refresher(AsyncSessionLocal)))
+
+
+@app.on_event("startup")
+async def load_regional_forecasts():
+    """Прогнозы районов в память для контекста LLM; перечитываются, когда water_forecast_all перезаписывают"""
+    try:
+        await regional_forecasts.ensure_schema()
+        await regional_forecasts.refresh()
+    except Exception as e:
+        print(f"Error loading regional forecast aggregates: {e}")
+    _background_tasks.append(asyncio.create_task(regional_forecasts.run()))
+
+
+@app.on_event("startup")
+async def warm_up_residual_detector():
+    """Прогноз, факт и история остатков всех домов для детектора отклонений от прогноза"""
+    try:
+        async with AsyncSessionLocal() as db:
+            await residual_detector.warm_up(db)
+    except Exception as e:
+        print(f"Error warming up forecast residual detector: {e}")
+    _background_tasks.append(asyncio.create_task(run_residual_detector(AsyncSessionLocal)))
+
+
+@app.on_event("startup")
+async def start_forecast_accuracy():
+    """Суточные накопители ошибок прогноза по домам; пополняются по пятиминуткам детектора отклонений"""
+    try:
+        await forecast_accuracy.ensure_schema()
+    except Exception as e:
+        print(f"Error preparing forecast_accuracy_daily table: {e}")
+        return
+    _background_tasks.append(asyncio.create_task(forecast_accuracy.run()))
+
+
+@app.on_event("startup")
+async def load_timeseries_store():
+    """Последние часы рядов расхода/отклонений в память (или в общие memory-mapped файлы TS_STORE_DIR)"""
+    try:
+        await timeseries_store.load()
+    except Exception as e:
+        print(f"Error loading time series store: {e}")
+        return
+    _background_tasks.append(asyncio.create_task(timeseries_store.run_refresher()))
+
+
+@app.on_event("startup")
+async def start_rollup_engine():
+    """Агрегаты 1h/1d/1w: триггеры и таблицы, досчёт часов новее водяных знаков, фоновый пересчёт"""
+    try:
+        await rollup_engine.ensure_schema()
+        pending = await rollup_engine.catch_up()
+        print(f"[rollup] {pending} house-hours queued after watermark catch-up")
+    except Exception as e:
+        print(f"Error preparing consumption rollups: {e}")
+        return
+    _background_tasks.append(asyncio.create_task(rollup_engine.run()))
+    rollup_engine.wake()
+
+
+@app.on_event("startup")
+async def prepare_relearn_jobs():
+    try:
+        await relearn_runner.ensure_schema()
+    except Exception as e:
+        print(f"Error preparing model_relearn table: {e}")
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
+    try:
+        await forecast_accuracy.flush()
+    except Exception as e:
+        print(f"Error flushing forecast accuracy on shutdown: {e}")
+    await relearn_runner.shutdown()
+    await notification_sender.close()
+    await close_client()
+
+
+def format_regional_forecast_for_llm(summary: Optional[Dict]) -> str:
+    """
+    Форматирует сводку прогноза ХВС по району для LLM контекста.
+    """
+    if not summary or not summary["hours"]:
+        return "Нет прогнозных данных по ХВС для домов района на ближайшие 24 часа (1-час интервал)."
+    house_totals = summary["house_totals"]
+    lines = [
+        f"Домов с прогнозом: {summary['houses']}. Сумма по району за {summary['hours']} ч "
+        f"({summary['first_hour']} — {summary['last_hour']}, UTC): {summary['total']}. "
+        f"Пиковый час: {summary['peak_hour']} ({summary['peak_total']}).",
+        f"Сумма за сутки по дому: медиана {house_totals['p50']}, p10 {house_totals['p10']}, p90 {house_totals['p90']}.",
+        "По часам (сумма по району [нижняя–верхняя граница]; по домам медиана / p90 / максимум):",
+    ]
+    for item in summary["hourly"]:
+        lines.append(
+            f"- {item['time'][11:16]} {item['time'][8:10]}/{item['time'][5:7]}: {item['total']} "
+            f"[{item['total_lower']}–{item['total_upper']}]; {item['p50']} / {item['p90']} / {item['max']}"
+        )
+    lines.append("Дома с наибольшим прогнозом за сутки:")
+    for house in summary["top_houses"]:
+        lines.append(f"- {house['address']}: {house['total']}")
+    return "\n".join(lines)
+
 
 def format_regional_incidents_for_llm(incidents_list: List[Dict]) -> str:
     """
@@ -201,25 +306,35 @@ def format_incident_history(history: List[Dict]) -> str:
     return "\n".join(lines)
 
 
-@app.post("/api/houses/{house_id}/ask-llm")
-async def ask_llm_about_house(house_id: str, payload: LLMQuestionRequest, db: AsyncSession = Depends(get_db)):
-    question = payload.question.strip()
-    if not question:
-        raise HTTPException(status_code=400, detail="Question is required")
-
-    # Получаем данные дома из реальной БД
-    house = await get_real_house_detail(db, house_id)
-    if not house:
-        raise HTTPException(status_code=404, detail="House not found")
+def format_water_data(data: List[Dict]) -> str:
+    """
+    Форматирует данные для LLM контекста
+    """
+    if not data:
+        return "Нет данных"
+    # Показываем ВСЕ записи за день
+    lines = []
+    for item in data:  # Убрали [:5]
+        time_str = item["time"]
+        values = item.get("values", {})
+        # Форматирование может зависеть от структуры values
+        # Если есть 'series_type', можно его учитывать
+        values_str_parts = []
+        for k, v in values.items():
+            if v is not None:
+                if k == 'series_type':
+                    values_str_parts.append(f"{v}") # Добавляем тип серии, например, (прогноз)
+                else:
+                    values_str_parts.append(f"{k}: {v}")
+        values_str = ", ".join(values_str_parts)
+        lines.append(f"- {time_str}: {values_str}")
+    return "\n".join(lines)
 
-    if not OPENROUTER_API_KEY:
-        raise HTTPException(status_code=500, detail="OPENROUTER_API_KEY не задан в .env")
 
-    # Получаем данные по расходу и отклонениям
-    water_data = await get_water_data_for_llm(db, house_id)
-    incident_history = await get_incident_history_for_llm(db, house_id, hours_back=720)
+def build_house_context(house: HouseDetail, water_data: Dict, incident_history: List[Dict]) -> str:
+    """Контекст для вопроса о конкретном доме"""
     # Подготавливаем краткий контекст для экономии токенов
-    context = f"""Дом: {house.address}
+    return f"""Дом: {house.address}
 Статус: {house.status}
 Инцидент: {house.incident_status}
 УНОМ: {house.unom}
@@ -233,7 +348,10 @@ async def ask_llm_about_house(house_id: str, payload: LLMQuestionRequest, db: As
 {format_incident_history(incident_history)}
 """
 
-    prompt = f"""Ты — эксперт по мониторингу ГВС. Ответь кратко на русском языке.
+
+def build_house_prompt(context: str, question: str) -> str:
+    """Промпт для вопроса о конкретном доме"""
+    return f"""Ты — эксперт по мониторингу ГВС. Ответь кратко на русском языке.
 
 Названия статусов нужно возвращать на русском Repair - В ремонте, New - Новый, Resolved - Решен. Work - В работе. None - Статус не задан.
 
@@ -251,72 +369,111 @@ async def ask_llm_about_house(house_id: str, payload: LLMQuestionRequest, db: As
 Вопрос: "{question}"
 """
 
-    try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.post(
-                "https://openrouter.ai/api/v1/chat/completions",  # УБРАЛ ПРОБЕЛЫ
-                headers={
-                    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": "deepseek/deepseek-chat-v3.1:free",
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.3,
-                    "max_tokens": 1500
-                }
-            )
-            if resp.status_code != 200:
-                error_msg = resp.json().get("error", {}).get("message", "Unknown error")
-                print(f"OpenRouter error {resp.status_code}: {error_msg}")
-                raise HTTPException(status_code=502, detail=f"OpenRouter error: {error_msg}")
 
-            answer = resp.json()["choices"][0]["message"]["content"].strip()
-            return {"answer": answer}
+async def prepare_house_prompt(house_id: str, payload: LLMQuestionRequest) -> Tuple[str, str, List[str]]:
+    """Возвращает (промпт, ключ кэша ответов, области кэша)"""
+    question = payload.question.strip()
+    if not question:
+        raise HTTPException(status_code=400, detail="Question is required")
+
+    if not OPENROUTER_API_KEY:
+        raise HTTPException(status_code=500, detail="OPENROUTER_API_KEY не задан в .env")
+
+    # Карточка дома, данные по расходу и отклонениям и история инцидентов читаются параллельно
+    house, water_data, incident_history = await load_house_llm_context(house_id, hours_back=720)
+    if not house:
+        raise HTTPException(status_code=404, detail="House not found")
+
+    with span("context_format"):
+        context = build_house_context(house, water_data, incident_history)
+        prompt = build_house_prompt(context, question)
+    cache_key = llm_cache.make_key(question, context)
+    return prompt, cache_key, [
+        house_scope(house.house_id),
+        region_scope(district_registry.region_of(house.house_id)),
+    ]
+
 
+async def ask_llm(prompt: str, max_tokens: int, cache_key: str, cache_scopes: List[str]) -> Dict:
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        return {"answer": cached, "cached": True}
+    try:
+        answer = await llm_complete(prompt, max_tokens=max_tokens)
+    except LLMUpstreamError as e:
+        print(f"OpenRouter error {e.status_code}: {e.message}")
+        raise HTTPException(status_code=502, detail=f"OpenRouter error: {e.message}")
     except Exception as e:
         print(f"Unexpected error: {e}")
         raise HTTPException(status_code=500, detail="Ошибка генерации ответа")
+    llm_cache.put(cache_key, answer, cache_scopes)
+    return {"answer": answer}
+
+
+def stream_llm_answer(prompt: str, max_tokens: int, cache_key: str, cache_scopes: List[str]) -> StreamingResponse:
+    """Ответ LLM в виде Server-Sent Events: token-события по мере генерации, затем done"""
+
+    async def events():
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            yield sse_event({"token": cached})
+            yield sse_event({"cached": True}, event="done")
+            return
+        parts = []
+        try:
+            async for token in stream_completion(prompt, max_tokens=max_tokens):
+                parts.append(token)
+                yield sse_event({"token": token})
+        except LLMUpstreamError as e:
+            print(f"OpenRouter error {e.status_code}: {e.message}")
+            yield sse_event({"detail": f"OpenRouter error: {e.message}"}, event="error")
+            return
+        except Exception as e:
+            print(f"Unexpected error: {e}")
+            yield sse_event({"detail": "Ошибка генерации ответа"}, event="error")
+            return
+        answer = "".join(parts).strip()
+        if answer:
+            llm_cache.put(cache_key, answer, cache_scopes)
+        yield sse_event({}, event="done")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
-def format_water_data(data: List[Dict]) -> str:
-    """
-    Форматирует данные для LLM контекста
-    """
-    if not data:
-        return "Нет данных"
-    # Показываем ВСЕ записи за день
-    lines = []
-    for item in data:  # Убрали [:5]
-        time_str = item["time"]
-        values = item.get("values", {})
-        # Форматирование может зависеть от структуры values
-        # Если есть 'series_type', можно его учитывать
-        values_str_parts = []
-        for k, v in values.items():
-            if v is not None:
-                if k == 'series_type':
-                    values_str_parts.append(f"{v}") # Добавляем тип серии, например, (прогноз)
-                else:
-                    values_str_parts.append(f"{k}: {v}")
-        values_str = ", ".join(values_str_parts)
-        lines.append(f"- {time_str}: {values_str}")
-    return "\n".join(lines)
+@app.post("/api/houses/{house_id}/ask-llm")
+async def ask_llm_about_house(house_id: str, payload: LLMQuestionRequest):
+    prompt, cache_key, cache_scopes = await prepare_house_prompt(house_id, payload)
+    return await ask_llm(prompt, 1500, cache_key, cache_scopes)
 
-@app.post("/api/ask-llm")
-async def ask_llm_about_all_houses(payload: LLMQuestionRequest, db: AsyncSession = Depends(get_db)):
+
+@app.post("/api/houses/{house_id}/ask-llm/stream")
+async def ask_llm_about_house_stream(house_id: str, payload: LLMQuestionRequest):
+    prompt, cache_key, cache_scopes = await prepare_house_prompt(house_id, payload)
+    return stream_llm_answer(prompt, 1500, cache_key, cache_scopes)
+
+
+async def prepare_region_prompt(payload: LLMQuestionRequest, db: AsyncSession) -> Tuple[str, str, List[str]]:
+    """Возвращает (промпт, ключ кэша ответов, области кэша)"""
     question = payload.question.strip()
     if not question:
         raise HTTPException(status_code=400, detail="Question is required")
     if not OPENROUTER_API_KEY:
         raise HTTPException(status_code=500, detail="OPENROUTER_API_KEY не задан в .env")
+    region_id = payload.region_id
+    if not district_registry.exists(region_id):
+        raise HTTPException(status_code=404, detail="Region not found")
     # Получаем ПОЛНЫЙ контекст
-    ctx = await get_full_llm_context(db, "lublino")
+    ctx = await get_full_llm_context(db, region_id)
     # Получаем ТОП-10 последних инцидентов по региону
-    incident_stats = await get_regional_incident_stats(db, "lublino", hours_back=24)
-    forecast_stats = await get_regional_forecast_cold_water_24h_hourly_random(db, num_houses=5)
-    print(forecast_stats)
+    incident_stats = await get_regional_incident_stats(db, region_id, hours_back=24)
+    # Сводка прогноза по всему району — из памяти, без запросов к water_forecast_all
+    forecast_summary = regional_forecasts.summary(region_id)
     # Формируем информативный контекст
+    context_started = time.perf_counter()
     stats = ctx["status_breakdown"]
     context = f"""Район: {ctx['region']}
 Всего домов: {ctx['total_houses']}
@@ -329,11 +486,15 @@ async def ask_llm_about_all_houses(payload: LLMQuestionRequest, db: AsyncSession
 Названия статусов нужно возвращать на русском Repair - В ремонте, New - Новый, Resolved - Решен. Work - В работе. None - Статус не задан.
 ТОП-10 последних инцидентов и предупреждений (последние 24 часа):
 {format_regional_incidents_for_llm(incident_stats.get('recent_incidents_list', []))}
-Прогнозные данные ХВС (на ближайшие 24 часа, 1-час интервал): {forecast_stats.get('summary', 'Нет данных')}
-Примеры прогнозов (первые 20):
-{format_regional_forecasts_for_llm(forecast_stats.get('forecast_list', []))}
+Прогноз ХВС по району (на ближайшие 24 часа, 1-час интервал):
+{format_regional_forecast_for_llm(forecast_summary)}
 Дома с проблемами (примеры):
 {chr(10).join(ctx['problem_houses_list']) if ctx['problem_houses_list'] else 'Нет домов с проблемами'}"""
+    # Сводка прогноза одна на час и версию прогноза, поэтому её версия и первый час входят в ключ кэша
+    forecast_key = [forecast_summary["version"], forecast_summary["first_hour"]] if forecast_summary else None
+    cache_key = llm_cache.make_key(
+        question, json.dumps([ctx, incident_stats, forecast_key], sort_keys=True, default=str)
+    )
     prompt = f"""Ты — эксперт по мониторингу ГВС. Ответь кратко на русском языке.
 Ответ должен быть кратким и не превышать 1000 токенов. Если информация объёмная — сожми её, сохранив суть.
 Если вопрос не относится к теме ГВС или дома — вежливо откажись отвечать.
@@ -346,88 +507,223 @@ async def ask_llm_about_all_houses(payload: LLMQuestionRequest, db: AsyncSession
 ВОПРОС:
 "{question}"
 """
-    try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.post(
-                "https://openrouter.ai/api/v1/chat/completions",  
-                headers={
-                    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": "deepseek/deepseek-chat-v3.1:free",
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.3,
-                    "max_tokens": 500
-                }
-            )
-            if resp.status_code != 200:
-                error_msg = resp.json().get("error", {}).get("message", "Unknown error")
-                print(f"OpenRouter error {resp.status_code}: {error_msg}")
-                raise HTTPException(status_code=502, detail=f"OpenRouter error: {error_msg}")
-            answer = resp.json()["choices"][0]["message"]["content"].strip()
-            return {"answer": answer}
-    except Exception as e:
-        print(f"Unexpected error: {e}")
-        raise HTTPException(status_code=500, detail="Ошибка генерации ответа")
+    add_span("context_format", time.perf_counter() - context_started)
+    return prompt, cache_key, [region_scope(region_id)]
+
+
+@app.post("/api/ask-llm")
+async def ask_llm_about_all_houses(payload: LLMQuestionRequest, db: AsyncSession = Depends(get_db)):
+    prompt, cache_key, cache_scopes = await prepare_region_prompt(payload, db)
+    return await ask_llm(prompt, 500, cache_key, cache_scopes)
+
+
+@app.post("/api/ask-llm/stream")
+async def ask_llm_about_all_houses_stream(payload: LLMQuestionRequest, db: AsyncSession = Depends(get_db)):
+    prompt, cache_key, cache_scopes = await prepare_region_prompt(payload, db)
+    return stream_llm_answer(prompt, 500, cache_key, cache_scopes)
 
 
 
 
+@app.get("/api/notifications/stats")
+async def get_notification_stats():
+    """Состояние outbox email-уведомлений (pending / sent / failed) и счётчики отправителя"""
+    if not notifications_enabled():
+        return {"enabled": False}
+    return await notification_sender.stats()
+
+
+@app.get("/api/llm-cache/stats")
+async def get_llm_cache_stats():
+    """Счётчики кэша ответов LLM (попадания, промахи, вытеснения) для подбора размера и TTL"""
+    return llm_cache.stats()
+
+
+@app.delete("/api/llm-cache")
+async def clear_llm_cache():
+    llm_cache.clear()
+    return {"message": "Кэш ответов LLM очищен"}
+
+
+@app.get("/api/regions", response_model=List[RegionInfo])
+async def api_list_regions():
+    return [
+        RegionInfo(region_id=d.region_id, name=d.name, registry_district=d.registry_district)
+        for d in district_registry.all()
+    ]
+
+
+@app.post("/api/regions", response_model=RegionInfo, dependencies=[Depends(require_admin)])
+async def api_register_region(payload: RegionCreate, db: AsyncSession = Depends(get_db)):
+    """
+    Зарегистрировать район: секции таблиц и дома из реестра адресов lublino_houses,
+    у которых DISTRICT содержит registry_district (реестр загружается db.import_lublino).
+    """
+    try:
+        added = await district_registry.register(db, payload.region_id, payload.name, payload.registry_district)
+        await address_index.rebuild(db)
+    except InvalidDistrict as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        await db.rollback()
+        print(f"Error registering region {payload.region_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка регистрации района: {str(e)}")
+    print(f"Region {payload.region_id} registered with {added} new houses")
+    return RegionInfo(region_id=payload.region_id, name=payload.name.strip(), registry_district=payload.registry_district.strip())
+
+
 @app.get("/api/regions/{region_id}/dashboard", response_model=DashboardMetrics)
 async def api_get_dashboard(region_id: str, days: int = Query(14, ge=1, le=90), db: AsyncSession = Depends(get_db)):
-    if region_id not in REGION_ID_TO_NAME:
+    if not district_registry.exists(region_id):
         raise HTTPException(status_code=404, detail="Region not found")
     return await get_real_dashboard_metrics(db, region_id, days)
 
 
-@app.get("/api/regions/{region_id}/houses", response_model=List[HouseListItem])
+@app.get("/api/regions/{region_id}/houses", response_model=HouseListPage)
 async def api_get_houses(
+    region_id: str,
+    status: Optional[str] = Query(None, regex="^(red|yellow|green|in_work)$"),
+    incident_status: Optional[str] = Query(None),
+    search: Optional[str] = Query(None),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor из предыдущей страницы"),
+    sort_by: str = Query("address", regex="^(address|unom)$"),
+    sort_dir: str = Query("asc", regex="^(asc|desc)$"),
+    db: AsyncSession = Depends(get_db),
+):
+    if not district_registry.exists(region_id):
+        raise HTTPException(status_code=404, detail="Region not found")
+    try:
+        items, next_cursor = await get_real_house_list(
+            db=db,
+            region_id=region_id,
+            status=status,
+            incident_status=incident_status,
+            search=search,
+            limit=limit,
+            cursor=cursor,
+            sort_by=sort_by,
+            sort_dir=sort_dir,
+        )
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return HouseListPage(items=items, next_cursor=next_cursor)
+
+
+@app.get("/api/regions/{region_id}/houses/count")
+async def api_count_houses(
     region_id: str,
     status: Optional[str] = Query(None, regex="^(red|yellow|green|in_work)$"),
     incident_status: Optional[str] = Query(None),
     search: Optional[str] = Query(None),
     db: AsyncSession = Depends(get_db),
 ):
-    if region_id not in REGION_ID_TO_NAME:
+    """Общее число домов под фильтрами списка (отдельно от страниц, чтобы не считать на каждую страницу)"""
+    if not district_registry.exists(region_id):
         raise HTTPException(status_code=404, detail="Region not found")
-    return await get_real_house_list(
+    total = await count_real_houses(
         db=db,
         region_id=region_id,
         status=status,
         incident_status=incident_status,
         search=search,
     )
+    return {"total": total}
+
+
+@app.get("/api/regions/{region_id}/status/stream")
+async def api_status_stream(region_id: str):
+    """
+    Изменения статусов домов района (Server-Sent Events) вместо опроса дашборда и списка:
+    сначала snapshot (все дома района и счётчики), затем changes; heartbeat при простое.
+    """
+    if not district_registry.exists(region_id):
+        raise HTTPException(status_code=404, detail="Region not found")
+    try:
+        subscriber = await status_hub.subscribe(region_id, AsyncSessionLocal)
+    except Exception as e:
+        print(f"Error subscribing to status push for {region_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка подписки на статусы: {str(e)}")
+
+    async def events():
+        try:
+            async for message in status_hub.messages(subscriber):
+                yield message.sse()
+        finally:
+            status_hub.unsubscribe(subscriber)
+
+    async def unsubscribe():
+        # Корутина, а не sync-функция: BackgroundTask выполнил бы её в пуле потоков, а хаб не потокобезопасен
+        status_hub.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Отписка и при отключении клиента до первого сообщения, когда генератор ещё не запущен
+        background=BackgroundTask(unsubscribe),
+    )
+
+
+@app.websocket("/api/regions/{region_id}/status/ws")
+async def ws_status(websocket: WebSocket, region_id: str):
+    """То же через WebSocket: JSON-сообщения с type snapshot / changes / heartbeat"""
+    if not district_registry.exists(region_id):
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    try:
+        subscriber = await status_hub.subscribe(region_id, AsyncSessionLocal)
+    except Exception as e:
+        print(f"Error subscribing to status push for {region_id}: {e}")
+        await websocket.close(code=1011)
+        return
+
+    async def send_messages():
+        async for message in status_hub.messages(subscriber):
+            await websocket.send_text(message.data)
+
+    async def wait_disconnect():
+        # Входящие сообщения не нужны — читаем, только чтобы сразу заметить отключение
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [asyncio.create_task(send_messages()), asyncio.create_task(wait_disconnect())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        status_hub.unsubscribe(subscriber)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 
-@app.get("/api/v2/houses/options")
-async def get_houses_options_v2(db: AsyncSession = Depends(get_db)):
+@app.get("/api/status-push/stats")
+async def get_status_push_stats():
+    """Подписчики push-канала статусов по районам"""
+    return status_hub.stats()
+
+
+@app.get("/api/v2/houses/options", response_model=HouseOptionsPage)
+async def get_houses_options_v2(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor из предыдущей страницы"),
+    region_id: Optional[str] = Query(None, description="только дома района"),
+    db: AsyncSession = Depends(get_db),
+):
     """
-    Получить список ВСЕХ домов для создания инцидента (v2).
+    Список домов для создания инцидента (v2), постранично по адресу.
     Использует lublino_houses_id.
     """
     try:
-        # Используем SQLAlchemy для более гибкого запроса, убираем LIMIT
-        # или устанавливаем очень большой LIMIT, если担心 слишком большого объема данных
-        # можно рассмотреть пагинацию в будущем
-        result = await db.execute(
-            select(LublinoHousesId.id_house, LublinoHousesId.unom, LublinoHousesId.simple_address)
-            # .limit(10000) # Пример увеличения лимита, если нужно ограничить
-            .order_by(LublinoHousesId.simple_address, LublinoHousesId.unom) # Сортировка для предсказуемого порядка
-        )
-        houses = result.fetchall()
-        return [
-            {
-                "id_house": house.id_house,
-                "unom": house.unom,
-                "simple_address": house.simple_address
-            }
-            for house in houses
-        ]
+        items, next_cursor = await get_house_options(db, limit=limit, cursor=cursor, region_id=region_id)
+        return HouseOptionsPage(items=items, next_cursor=next_cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     except Exception as e:
         print(f"Error getting houses options (v2): {e}")
         # Возвращаем тестовые данные если таблица не существует или произошла другая ошибка
-        return [
+        return HouseOptionsPage(items=[
             {
                 "id_house": 1,
                 "unom": 12345,
@@ -438,7 +734,21 @@ async def get_houses_options_v2(db: AsyncSession = Depends(get_db)):
                 "unom": 12346,
                 "simple_address": "ул. Тестовая, д. 2"
             }
-        ]
+        ])
+
+
+@app.get("/api/v2/houses/autocomplete")
+async def autocomplete_houses(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(10, ge=1, le=50),
+    region_id: Optional[str] = Query(None, description="только дома района"),
+):
+    """
+    Автодополнение адреса: дома, отсортированные по качеству совпадения.
+    Понимает сокращения (ул./улица, д./дом, корп./к), незаконченное последнее слово и опечатки.
+    """
+    return address_index.autocomplete(q, limit, region_id)
+
 
 @app.post("/api/v2/incidents/create")
 async def create_incident_v2(
@@ -458,25 +768,31 @@ async def create_incident_v2(
         raise HTTPException(status_code=400, detail="Missing required fields: id_house, status_incident, house_health")
 
     try:
-        # Проверяем, существует ли id_house в lublino_houses_id
-        house_result = await db.execute(
-            select(LublinoHousesId.unom, LublinoHousesId.address).where(LublinoHousesId.id_house == id_house)
-        )
-        house_info = house_result.fetchone()
+        # Проверяем, существует ли id_house в lublino_houses_id: сначала реестр в памяти, затем БД
+        house_info = address_index.house(id_house)
+        if house_info is None:
+            house_result = await db.execute(
+                select(LublinoHousesId.unom, LublinoHousesId.address, LublinoHousesId.region_id)
+                .where(LublinoHousesId.id_house == id_house)
+            )
+            house_info = house_result.fetchone()
 
         if house_info is None:
             # id_house не найден в lublino_houses_id
             raise HTTPException(status_code=404, detail=f"House with id_house {id_house} not found in lublino_houses_id table")
 
         unom = house_info.unom
-        full_address = house_info.address
+        region_id = house_info.region_id
 
-        # Проверяем, существует ли запись в status_houses
+        # Проверяем, существует ли запись в status_houses (в секции района дома)
         result = await db.execute(
-            select(StatusHealth).where(StatusHealth.id_house == id_house)
+            select(StatusHealth).where(StatusHealth.region_id == region_id, StatusHealth.id_house == id_house)
         )
         existing = result.scalar_one_or_none()
 
+        old_health = existing.house_health if existing else None
+        old_status = existing.status_incident if existing else None
+
         if existing:
             # Обновляем существующую запись
             existing.status_incident = status_incident
@@ -487,6 +803,7 @@ async def create_incident_v2(
             # Создаем новую запись
             new_incident = StatusHealth(
                 id_house=id_house,
+                region_id=region_id,
                 unom=unom,
                 status_incident=status_incident,
                 house_health=house_health
@@ -494,19 +811,21 @@ async def create_incident_v2(
             db.add(new_incident)
             print(f"[v2] Created new incident for house {id_house}: status={status_incident}, health={house_health}, unom={unom}")
 
-        await db.commit()
-        
-        # Отправляем email уведомление если статус проблемный
-        if house_health.lower() in ['red', 'yellow']:
-            if full_address:
-                send_email_notification(
-                    house_id=id_house,
-                    address=full_address,
-                    status=house_health,
-                    incident_status=status_incident
-                )
-            else:
-                print(f"Could not get address for house {id_house}, skipping email notification")
+        # Email-уведомление ставится в outbox в той же транзакции, отправляет его фоновый отправитель
+        notify = await enqueue_house_notification(db, id_house, house_health, status_incident)
+        await commit_status_changes(db)
+        apply_status_change(
+            region_id,
+            old_health=old_health,
+            old_status=old_status,
+            new_health=house_health,
+            new_status=status_incident,
+            is_new_row=existing is None,
+            id_house=id_house,
+        )
+        classifier.set_current_health(id_house, house_health)
+        if notify:
+            notification_sender.wake()
 
         return {"message": "Инцидент (v2) успешно создан или обновлён"}
 
@@ -554,6 +873,60 @@ async def get_houses_options(db: AsyncSession = Depends(get_db)):
             }
         ]
 
+@app.post("/api/readings")
+async def api_ingest_readings(payload: WaterReadingsBatch, db: AsyncSession = Depends(get_db)):
+    """
+    Принять новые 5-минутные показания ХВС/ГВС.
+    Показания сохраняются в water_consump_hot, переходы инцидентов сразу пишутся в incident_hist_2.
+    """
+    readings = [reading.model_dump() for reading in payload.readings]
+    async with detector.lock:
+        result = IngestResult([], [], {})
+        health_changes = []
+        try:
+            result = await ingest_readings(db, readings)
+            classifier.add_events(result.incidents)
+            health_changes = await update_house_health(db)
+            notify = await enqueue_health_changes(db, health_changes)
+            await commit_status_changes(db)
+        except Exception as e:
+            await db.rollback()
+            # Детектор не менялся (его состояние применяется после коммита), классификатор откатываем
+            classifier.remove_events(result.incidents)
+            classifier.discard(health_changes)
+            print(f"Error ingesting readings: {e}")
+            raise HTTPException(status_code=500, detail=f"Ошибка приёма показаний: {str(e)}")
+        detector.apply(result.staged)
+        apply_health_changes(health_changes)
+    incidents = result.incidents
+    if notify:
+        notification_sender.wake()
+    rollup_engine.wake()
+    residual_detector.add_readings(result.readings)
+    for id_house in {reading.id_house for reading in payload.readings}:
+        llm_cache.invalidate(house_scope(id_house))
+    for region_id in {district_registry.region_of(incident["id_house"]) for incident in incidents}:
+        llm_cache.invalidate(region_scope(region_id))
+
+    return {
+        "readings": len(payload.readings),
+        "inserted": len(result.readings),
+        "health_changes": [
+            {"id_house": id_house, "old_health": old_health, "new_health": new_health}
+            for id_house, old_health, new_health in health_changes
+        ],
+        "incidents": [
+            {
+                "id_house": incident["id_house"],
+                "time_5min": incident["time_5min"].isoformat(),
+                "type_incdnt": incident["type_incdnt"],
+                "comment_incdnt": incident["comment_incdnt"],
+            }
+            for incident in incidents
+        ],
+    }
+
+
 @app.get("/api/houses/{house_id}", response_model=HouseDetail)
 async def api_get_house_detail(house_id: str, db: AsyncSession = Depends(get_db)):
     try:
@@ -610,14 +983,17 @@ async def api_update_house_status(
             print(f"Обновляем house_health на: {payload['house_health']}")
         
         if update_sql_parts:
-            update_sql = f"UPDATE status_houses SET {', '.join(update_sql_parts)} WHERE id_house = :id_house"
+            update_sql = (
+                f"UPDATE status_houses SET {', '.join(update_sql_parts)} "
+                "WHERE region_id = :region_id AND id_house = :id_house"
+            )
             update_fields['id_house'] = house_id_int
+            update_fields['region_id'] = district_registry.region_of(house_id_int)
             
             print(f"Выполняем SQL: {update_sql} с параметрами: {update_fields}")
             
             result = await db.execute(text(update_sql), update_fields)
             print(f"Обновлено строк: {result.rowcount}")
-            await db.commit()
         
         # Проверим, что данные действительно обновились
         check_result = await db.execute(
@@ -626,27 +1002,29 @@ async def api_update_house_status(
         )
         updated = check_result.fetchone()
         print(f"После обновления: house_health={updated.house_health}, status_incident={updated.status_incident}")
-        
-        # Отправляем email уведомление если статус стал проблемным (только если изменился)
+
+        # Email-уведомление, если статус стал проблемным (только если изменился), — в outbox той же транзакцией
+        notify = False
         if (updated.house_health and updated.house_health.lower() in ['red', 'yellow'] and 
             (old_health != updated.house_health or old_status != updated.status_incident)):
-            
-            # Получаем полный адрес из lublino_houses_id
-            address_result = await db.execute(
-                text("SELECT address FROM lublino_houses_id WHERE id_house = :id_house"),
-                {"id_house": house_id_int}
+            notify = await enqueue_house_notification(
+                db, house_id_int, updated.house_health, updated.status_incident
             )
-            full_address = address_result.scalar_one_or_none()
-            
-            if full_address:
-                send_email_notification(
-                    house_id=house_id_int,
-                    address=full_address,
-                    status=updated.house_health,
-                    incident_status=updated.status_incident
-                )
-            else:
-                print(f"Could not get address for house {house_id_int}, skipping email notification")
+
+        if update_sql_parts:
+            await commit_status_changes(db)
+            apply_status_change(
+                district_registry.region_of(house_id_int),
+                old_health=old_health,
+                old_status=old_status,
+                new_health=updated.house_health,
+                new_status=updated.status_incident,
+                id_house=house_id_int,
+            )
+            classifier.set_current_health(house_id_int, updated.house_health)
+        
+        if notify:
+            notification_sender.wake()
         
         return {
             "ok": True, 
@@ -666,6 +1044,144 @@ async def api_update_house_status(
         await db.rollback()
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
 
+@app.post("/api/houses/status/bulk")
+async def api_bulk_update_house_status(payload: HouseStatusBulkUpdate, db: AsyncSession = Depends(get_db)):
+    """
+    Массовая смена статусов домов (закрытие пачки инцидентов): один UPDATE в одной транзакции,
+    в ответе прежние и новые значения изменившихся домов, уведомления — одной пачкой на запрос.
+    """
+    if not payload.items:
+        raise HTTPException(status_code=400, detail="No items to update")
+    if len(payload.items) > BULK_STATUS_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Too many items, max {BULK_STATUS_MAX_ITEMS}")
+
+    # Повторы одного дома сливаются: поля более поздних элементов перекрывают ранние
+    updates: Dict[int, Dict] = {}
+    for item in payload.items:
+        fields = {name: getattr(item, name) for name in item.model_fields_set if name != "house_id"}
+        updates.setdefault(item.house_id, {}).update(fields)
+
+    try:
+        rows, not_found = await bulk_update_house_status(db, updates)
+        changed = [
+            row for row in rows
+            if (row["old_health"], row["old_status"]) != (row["new_health"], row["new_status"])
+        ]
+        notify = await enqueue_house_notifications(
+            db, [(row["id_house"], row["new_health"], row["new_status"]) for row in changed]
+        )
+        await commit_status_changes(db)
+    except Exception as e:
+        await db.rollback()
+        print(f"Error in bulk status update: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка массового обновления статусов: {str(e)}")
+
+    for row in changed:
+        apply_status_change(
+            row["region_id"],
+            old_health=row["old_health"],
+            old_status=row["old_status"],
+            new_health=row["new_health"],
+            new_status=row["new_status"],
+            id_house=row["id_house"],
+        )
+        classifier.set_current_health(row["id_house"], row["new_health"])
+    if notify:
+        notification_sender.wake()
+    print(f"[status] Bulk update: {len(rows)} houses matched, {len(changed)} changed, {len(not_found)} not found")
+
+    return {
+        "matched": len(rows),
+        "changed": [
+            {
+                "house_id": row["id_house"],
+                "old": {"house_health": row["old_health"], "incident_status": row["old_status"]},
+                "new": {"house_health": row["new_health"], "incident_status": row["new_status"]},
+            }
+            for row in changed
+        ],
+        "not_found": not_found,
+    }
+
+
+@app.get("/api/houses/{house_id}/water-series")
+async def api_get_house_water_series(
+    house_id: int,
+    series: str = Query("consumption_1h", regex="^(consumption_1h|diffr_1h)$"),
+    hours: int = Query(24, ge=1, le=24 * 90),
+    db: AsyncSession = Depends(get_db),
+):
+    """Часовой ряд дома за последние hours часов: недавние окна из памяти, более старые — из БД"""
+    return {
+        "house_id": house_id,
+        "series": series,
+        "points": await get_house_water_series(db, str(house_id), series, hours),
+    }
+
+
+@app.get("/api/houses/{house_id}/water-rollup")
+async def api_get_house_water_rollup(
+    house_id: int,
+    resolution: str = Query("1d", regex="^(1d|1w)$"),
+    periods: int = Query(30, ge=1, le=3650),
+    db: AsyncSession = Depends(get_db),
+):
+    """Суточный или недельный расход ХВС/ГВС дома из инкрементальных агрегатов"""
+    return {
+        "house_id": house_id,
+        "resolution": resolution,
+        "points": await get_house_rollup_series(db, str(house_id), resolution, periods),
+    }
+
+
+@app.get("/api/rollups/stats")
+async def get_rollup_stats():
+    try:
+        return await rollup_engine.stats()
+    except Exception as e:
+        print(f"Error getting rollup stats: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка получения состояния агрегатов: {str(e)}")
+
+
+@app.get("/api/export/{table}")
+async def api_export_series(
+    table: str,
+    format: str = Query("ndjson", regex="^(ndjson|arrow)$"),
+    house_id: Optional[List[int]] = Query(None),
+    region_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    """
+    Потоковая выгрузка water_consump_hot / water_diffr_coldhot / water_forecast_all
+    по дому (house_id, можно несколько) или району (region_id) за [start, end) в NDJSON или Arrow IPC.
+    """
+    if format == "arrow" and not arrow_available():
+        raise HTTPException(status_code=501, detail="Arrow export requires pyarrow")
+    try:
+        stream = await open_export(table, format, house_id, region_id, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExportBusy:
+        raise HTTPException(status_code=429, detail="Too many concurrent exports, try again later")
+    except Exception as e:
+        print(f"Error starting export of {table}: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка выгрузки: {str(e)}")
+
+    return StreamingResponse(
+        stream.iter_bytes(),
+        media_type=stream.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{stream.filename}"'},
+        # Если клиент отключился до начала передачи, подключение закроет фоновая задача
+        background=BackgroundTask(stream.close),
+    )
+
+
+@app.get("/api/ts-store/stats")
+async def get_timeseries_store_stats():
+    return timeseries_store.stats()
+
+
 @app.get("/api/houses/{house_id}/status-detail")
 async def api_get_house_status_detail(house_id: str, db: AsyncSession = Depends(get_db)):
     """Получить детали статуса дома из таблицы status_houses"""
@@ -714,7 +1230,7 @@ async def api_get_house_status_detail(house_id: str, db: AsyncSession = Depends(
             "house_id": str(status_info.id_house),
             "address": house_info.address if house_info else "",
             "simple_address": house_info.simple_address if house_info else "",
-            "region": "lublino",
+            "region": district_registry.region_of(status_info.id_house),
             "status": health_reverse_mapping.get(status_info.house_health, 'green'),
             "incident_status": status_reverse_mapping.get(status_info.status_incident, 'Новый'),
             "fias": house_info.n_fias,
@@ -733,16 +1249,125 @@ async def api_get_house_status_detail(house_id: str, db: AsyncSession = Depends(
 
 @app.get("/api/regions/{region_id}/llm-context")
 async def api_llm_context(region_id: str, db: AsyncSession = Depends(get_db)):
-    if region_id not in REGION_ID_TO_NAME:
+    if not district_registry.exists(region_id):
         raise HTTPException(status_code=404, detail="Region not found")
     return await get_real_llm_context(db, region_id)
 
 
+@app.get("/api/regions/{region_id}/forecast-24h")
+async def api_region_forecast(region_id: str):
+    """Прогноз ХВС по району на ближайшие 24 часа: сумма, распределение по домам, дома с наибольшим прогнозом"""
+    if not district_registry.exists(region_id):
+        raise HTTPException(status_code=404, detail="Region not found")
+    summary = regional_forecasts.summary(region_id)
+    if summary is None:
+        raise HTTPException(status_code=503, detail="Прогноз района ещё не загружен")
+    return summary
+
+
+@app.get("/api/regional-forecasts/stats")
+async def get_regional_forecasts_stats():
+    """Прогнозы районов в памяти: версия, начало, число домов и часов"""
+    return regional_forecasts.stats()
+
+
+@app.get("/api/regions/{region_id}/forecast-accuracy")
+async def api_region_forecast_accuracy(
+    region_id: str,
+    days: int = Query(7, ge=1, le=FORECAST_ACCURACY_RETENTION_DAYS),
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Точность прогноза ХВС по домам района за days суток: распределение MAE/RMSE/MAPE/WAPE/смещения
+    по домам, дома с наибольшим MAPE и с наибольшим ростом ошибки за последние сутки.
+    """
+    if not district_registry.exists(region_id):
+        raise HTTPException(status_code=404, detail="Region not found")
+    try:
+        return await forecast_accuracy.region_distribution(db, region_id, days, limit)
+    except Exception as e:
+        print(f"Error getting forecast accuracy for {region_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка получения точности прогноза: {str(e)}")
+
+
+@app.get("/api/houses/{house_id}/forecast-accuracy")
+async def api_house_forecast_accuracy(
+    house_id: int,
+    days: int = Query(7, ge=1, le=FORECAST_ACCURACY_RETENTION_DAYS),
+    db: AsyncSession = Depends(get_db),
+):
+    """Точность прогноза ХВС дома по суткам (MAE, RMSE, MAPE, WAPE, смещение)"""
+    try:
+        daily = await forecast_accuracy.house_daily(db, house_id, days)
+    except Exception as e:
+        print(f"Error getting forecast accuracy for house {house_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка получения точности прогноза: {str(e)}")
+    return {"id_house": house_id, "daily": daily}
+
+
+@app.get("/api/forecast-accuracy/stats")
+async def get_forecast_accuracy_stats():
+    """Трекер точности прогноза: точек в памяти до записи и записано с запуска"""
+    return forecast_accuracy.stats()
+
+
+@app.get("/api/residual-detector/stats")
+async def get_residual_detector_stats():
+    """Детектор отклонений от прогноза: домов, открытых отклонений, время последней проверки"""
+    return residual_detector.stats()
+
+
 @app.get("/health")
 def health():
     return {"status": "ok", "time": datetime.utcnow().isoformat()}
 
 
+@app.get("/metrics")
+def prometheus_metrics():
+    """Метрики процесса в формате Prometheus: время SQL-запросов по функциям, пул подключений"""
+    return Response(content=metrics.render(), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+
+@app.get("/api/db/slow-queries", dependencies=[Depends(require_admin)])
+def get_slow_queries(limit: int = Query(20, ge=1, le=db_metrics.DB_SLOW_QUERY_LOG_SIZE)):
+    """Последние запросы дольше DB_SLOW_QUERY_MS с параметрами, новые первыми (в параметрах — данные жителей)"""
+    return {
+        "threshold_ms": db_metrics.DB_SLOW_QUERY_MS,
+        "queries": db_metrics.recent_slow_queries(limit),
+    }
+
+
+@app.get("/api/admin/latency", dependencies=[Depends(require_admin)])
+def get_latency_report():
+    """p50/p95/p99 по маршрутам (скользящее окно) и по участкам: db, context_format, llm_upstream, smtp"""
+    return latency_report()
+
+
+@app.get("/api/admin/profile", dependencies=[Depends(require_admin)])
+async def profile_process(
+    seconds: float = Query(10, gt=0, le=profiler.PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(10, ge=1, le=1000),
+    format: str = Query("json", regex="^(json|folded)$"),
+    include_idle: bool = False,
+):
+    """
+    Сэмплирующий CPU-профиль живого процесса за seconds секунд.
+    format=folded — стеки для flamegraph.pl / speedscope, json — топ функций по собственному и полному времени.
+    """
+    try:
+        result = await asyncio.to_thread(profiler.sample, seconds, interval_ms, include_idle)
+    except profiler.ProfilerBusy:
+        raise HTTPException(status_code=409, detail="Profiling is already running")
+    stacks = result.pop("stacks")
+    if format == "folded":
+        return PlainTextResponse(profiler.folded(stacks))
+    result["top_stacks"] = [
+        {"stack": list(stack), "samples": count} for stack, count in stacks.most_common(20)
+    ]
+    return result
+
+
 @app.get("/db-health")
 async def db_health_check(db: AsyncSession = Depends(get_db)):
     try:
@@ -760,16 +1385,30 @@ async def get_model_history(db: AsyncSession = Depends(get_db)):
     """Получить историю обучения моделей"""
     try:
         # Получаем все записи из таблицы
-        result = await db.execute(text("SELECT date_relearn, model_name, status_relearn FROM model_relearn ORDER BY date_relearn DESC"))
+        result = await db.execute(text("""
+            SELECT id, date_relearn, model_name, status_relearn, progress,
+                   started_at, finished_at, houses_processed, error
+            FROM model_relearn
+            ORDER BY date_relearn DESC, id DESC
+        """))
         records = result.fetchall()
         return [
             {
-                "id": i,  # Используем индекс как id
+                "id": record.id,
                 "date": record.date_relearn.isoformat() if record.date_relearn else None,
                 "model_name": record.model_name,
-                "status_relearn": record.status_relearn
+                "status_relearn": record.status_relearn,
+                "progress": record.progress,
+                "started_at": record.started_at.isoformat() if record.started_at else None,
+                "finished_at": record.finished_at.isoformat() if record.finished_at else None,
+                "duration_seconds": (
+                    round((record.finished_at - record.started_at).total_seconds(), 1)
+                    if record.started_at and record.finished_at else None
+                ),
+                "houses_processed": record.houses_processed,
+                "error": record.error,
             }
-            for i, record in enumerate(records)
+            for record in records
         ]
     except Exception as e:
         print(f"Error getting model history: {e}")
@@ -777,30 +1416,29 @@ async def get_model_history(db: AsyncSession = Depends(get_db)):
         return []
 
 @app.post("/api/model-relearn/start")
-async def start_model_retraining(
-    payload: dict,
-    db: AsyncSession = Depends(get_db)
-):
-    """Запустить переобучение модели"""
+async def start_model_retraining(payload: dict):
+    """Запустить переобучение модели (пересчёт прогнозов идёт в фоне)"""
+    model_name = payload.get("model_name") or DEFAULT_MODEL_NAME
+    params = {
+        "days_forecast": payload.get("days_forecast", 7),
+        "house_ids": payload.get("house_ids"),
+    }
     try:
-        model_name = payload.get("model_name", f"model_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
-        status_relearn = payload.get("status_relearn", "started")
-        current_date = datetime.now()
-        
-        # Создаем запись напрямую через SQL
-        await db.execute(text("""
-            INSERT INTO model_relearn (model_name, status_relearn, date_relearn) 
-            VALUES (:model_name, :status_relearn, :date_relearn)
-        """), {
-            "model_name": model_name, 
-            "status_relearn": status_relearn,
-            "date_relearn": current_date
-        })
-        await db.commit()
-        return {"message": "Переобучение модели запущено"}
+        job_id = await relearn_runner.start(model_name, params)
+    except RelearnJobConflict:
+        raise HTTPException(status_code=409, detail=f"Переобучение модели {model_name} уже выполняется")
     except Exception as e:
         print(f"Error starting model retraining: {e}")
         return {"message": f"Ошибка: {str(e)}"}
+    return {"message": "Переобучение модели запущено", "job_id": job_id}
+
+
+@app.post("/api/model-relearn/{job_id}/cancel")
+async def cancel_model_retraining(job_id: int):
+    """Отменить выполняющееся или ожидающее переобучение"""
+    if not await relearn_runner.cancel(job_id):
+        raise HTTPException(status_code=404, detail="Active relearn job not found")
+    return {"message": "Отмена переобучения запрошена", "job_id": job_id}
 
 
 @app.get("/api/forecast-overall")
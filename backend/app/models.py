@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, BigInteger
+from sqlalchemy import Column, Integer, String, Text, DateTime, BigInteger, Date, Float
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from db.database import Base
@@ -10,6 +10,7 @@ class StatusHealth(Base):
     unom = Column(BigInteger, nullable=False, index=True)
     status_incident = Column(String(50), nullable=True)  # Work, Repair, Null, New, Resolved
     house_health = Column(Text, nullable=True)  # Green, Yellow, Red
+    region_id = Column(Text, nullable=False, default="lublino")  # ключ секционирования
 
 class LublinoHousesId(Base):
     __tablename__ = "lublino_houses_id"
@@ -21,11 +22,17 @@ class LublinoHousesId(Base):
     simple_address = Column(String(255), nullable=True)
     address = Column(String(255), nullable=True)
     district = Column(String(100), nullable=True)
+    region_id = Column(Text, nullable=False, default="lublino")  # ключ секционирования
 
 class ModelRelearn(Base):
     __tablename__ = "model_relearn"
     
     id = Column(Integer, primary_key=True, index=True)
-    date = Column(DateTime, nullable=False, default=datetime.utcnow)
-    model_name = Column(String(100), nullable=False)
-    status_relearn = Column(String(50), nullable=False)
+    date_relearn = Column(Date, nullable=False, default=datetime.utcnow)
+    model_name = Column(String(50), nullable=False)
+    status_relearn = Column(String(20), nullable=False)  # queued, running, done, failed, cancelled
+    progress = Column(Float, nullable=True)  # 0..100
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    houses_processed = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
@@ -0,0 +1,412 @@
+"""
+Email-уведомления о проблемных домах через outbox.
+
+Обработчики не ходят в SMTP сами: в той же транзакции, что и изменение статуса, они
+добавляют строку в notification_outbox и после коммита будят NotificationSender.
+Отправитель забирает все накопившиеся уведомления, склеивает всплеск (например,
+десятки домов, ставших Red за один прогон детектора) в одно письмо-дайджест и
+отправляет его через одно долгоживущее авторизованное SMTP-соединение.
+smtplib блокирующий, поэтому разговор с сервером идёт в отдельном потоке, а не в event loop.
+Неудачная отправка повторяется с экспоненциальной задержкой; после NOTIFY_MAX_ATTEMPTS
+попыток уведомление помечается failed.
+
+Проверка с локальным SMTP-приёмником (например, `python -m aiosmtpd -n -l 127.0.0.1:1025`):
+SMTP_SERVER=127.0.0.1, SMTP_PORT=1025, SMTP_STARTTLS=false, EMAIL_USER/EMAIL_PASSWORD пустые.
+"""
+import asyncio
+import html
+import os
+import smtplib
+import time
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.tracing import span
+from db.database import AsyncSessionLocal
+
+load_dotenv()
+
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.mail.ru")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() in ("1", "true", "yes")
+# Сколько секунд простоя соединение считается живым без проверки NOOP
+SMTP_IDLE_CHECK_SECONDS = float(os.getenv("SMTP_IDLE_CHECK_SECONDS", "60"))
+EMAIL_USER = os.getenv("EMAIL_USER")
+EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
+EMAIL_FROM = os.getenv("EMAIL_FROM") or EMAIL_USER or "gvs-monitoring@localhost"
+NOTIFICATION_EMAILS = [email.strip() for email in os.getenv("NOTIFICATION_EMAILS", "").split(",") if email.strip()]
+
+# Сколько ждать после первого уведомления, чтобы собрать всплеск в один дайджест
+NOTIFY_DIGEST_WINDOW_SECONDS = float(os.getenv("NOTIFY_DIGEST_WINDOW_SECONDS", "5"))
+NOTIFY_DIGEST_MAX_ITEMS = int(os.getenv("NOTIFY_DIGEST_MAX_ITEMS", "200"))
+NOTIFY_POLL_SECONDS = float(os.getenv("NOTIFY_POLL_SECONDS", "30"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "8"))
+NOTIFY_RETRY_BASE_SECONDS = float(os.getenv("NOTIFY_RETRY_BASE_SECONDS", "30"))
+NOTIFY_RETRY_MAX_SECONDS = float(os.getenv("NOTIFY_RETRY_MAX_SECONDS", "3600"))
+
+NOTIFY_HEALTH = ("Red", "Yellow")
+HEALTH_RANK = {"Green": 0, "Yellow": 1, "Red": 2}
+
+# Маппинг статусов на русский
+STATUS_NAMES = {
+    "red": "Критический",
+    "yellow": "Проблемный",
+    "green": "В норме",
+}
+
+# Маппинг статусов инцидента на русский
+INCIDENT_STATUS_NAMES = {
+    "New": "Новый",
+    "Work": "В работе",
+    "Repair": "В ремонте",
+    "Resolved": "Решен",
+    "None": "Статус не задан",
+}
+
+SCHEMA_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS notification_outbox (
+        id BIGSERIAL PRIMARY KEY,
+        id_house INTEGER NOT NULL,
+        house_health VARCHAR(10) NOT NULL,
+        status_incident VARCHAR(20),
+        created_at TIMESTAMP NOT NULL DEFAULT now(),
+        status VARCHAR(10) NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at TIMESTAMP NOT NULL DEFAULT now(),
+        sent_at TIMESTAMP,
+        last_error TEXT
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_notification_outbox_pending
+        ON notification_outbox (next_attempt_at)
+        WHERE status = 'pending'
+    """,
+]
+
+HealthChange = Tuple[int, Optional[str], str]
+
+
+def notifications_enabled() -> bool:
+    return bool(NOTIFICATION_EMAILS)
+
+
+async def enqueue_house_notification(
+    db: AsyncSession, id_house: int, house_health: str, status_incident: Optional[str]
+) -> bool:
+    """
+    Ставит уведомление о доме в outbox (в транзакции вызывающего; коммит — на его стороне,
+    после коммита нужно вызвать notification_sender.wake()).
+    """
+    if not notifications_enabled() or house_health not in NOTIFY_HEALTH:
+        return False
+    await db.execute(
+        text("""
+            INSERT INTO notification_outbox (id_house, house_health, status_incident)
+            VALUES (:id_house, :house_health, :status_incident)
+        """),
+        {"id_house": int(id_house), "house_health": house_health, "status_incident": status_incident},
+    )
+    return True
+
+
+async def enqueue_house_notifications(
+    db: AsyncSession, items: Iterable[Tuple[int, str, Optional[str]]]
+) -> int:
+    """
+    Ставит в outbox пачку домов (id_house, house_health, status_incident) одним запросом —
+    для массовой смены статусов; дома без проблемного состояния пропускаются.
+    """
+    if not notifications_enabled():
+        return 0
+    rows = [(int(id_house), health, status) for id_house, health, status in items if health in NOTIFY_HEALTH]
+    if not rows:
+        return 0
+    ids, healths, statuses = zip(*rows)
+    await db.execute(
+        text("""
+            INSERT INTO notification_outbox (id_house, house_health, status_incident)
+            SELECT * FROM unnest(CAST(:ids AS integer[]), CAST(:healths AS text[]), CAST(:statuses AS text[]))
+        """),
+        {"ids": list(ids), "healths": list(healths), "statuses": list(statuses)},
+    )
+    return len(rows)
+
+
+async def enqueue_health_changes(db: AsyncSession, changes: Iterable[HealthChange]) -> int:
+    """Ставит в outbox дома, состояние которых ухудшилось до Yellow/Red (изменения классификатора)"""
+    if not notifications_enabled():
+        return 0
+    worsened = [
+        id_house
+        for id_house, old_health, new_health in changes
+        if new_health in NOTIFY_HEALTH and HEALTH_RANK.get(new_health, 0) > HEALTH_RANK.get(old_health, 0)
+    ]
+    if not worsened:
+        return 0
+    await db.execute(
+        text("""
+            INSERT INTO notification_outbox (id_house, house_health, status_incident)
+            SELECT id_house, house_health, status_incident
+            FROM status_houses
+            WHERE id_house = ANY(:ids)
+        """),
+        {"ids": worsened},
+    )
+    return len(worsened)
+
+
+def _status_name(house_health: str) -> str:
+    return STATUS_NAMES.get(house_health.lower(), house_health)
+
+
+def _incident_status_name(status_incident: Optional[str]) -> str:
+    return INCIDENT_STATUS_NAMES.get(str(status_incident), str(status_incident))
+
+
+def build_message(items: List[Dict]) -> MIMEMultipart:
+    """Одно уведомление — письмо о доме, несколько — дайджест одной таблицей"""
+    now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if len(items) == 1:
+        item = items[0]
+        address = html.escape(item["address"] or "Адрес не найден")
+        subject = f"🚨 Новый инцидент в доме - {item['address'] or item['id_house']}"
+        body = f"""
+    <html>
+    <body>
+        <h2>🚨 Новый инцидент в доме</h2>
+        <p><strong>ID дома:</strong> {item['id_house']}</p>
+        <p><strong>Адрес:</strong> {address}</p>
+        <p><strong>Статус дома:</strong> {_status_name(item['house_health'])}</p>
+        <p><strong>Статус инцидента:</strong> {_incident_status_name(item['status_incident'])}</p>
+        <p><strong>Время:</strong> {now_str}</p>
+        <hr>
+        <p>Это автоматическое уведомление от системы мониторинга ГВС.</p>
+    </body>
+    </html>
+    """
+    else:
+        red = sum(1 for item in items if item["house_health"] == "Red")
+        subject = f"🚨 Проблемные дома: {len(items)} (критических: {red})"
+        rows = "\n".join(
+            f"<tr><td>{item['id_house']}</td><td>{html.escape(item['address'] or '')}</td>"
+            f"<td>{_status_name(item['house_health'])}</td>"
+            f"<td>{_incident_status_name(item['status_incident'])}</td>"
+            f"<td>{item['created_at'].strftime('%H:%M:%S')}</td></tr>"
+            for item in items
+        )
+        body = f"""
+    <html>
+    <body>
+        <h2>🚨 Проблемные дома: {len(items)}</h2>
+        <table border="1" cellpadding="4" cellspacing="0">
+            <tr><th>ID дома</th><th>Адрес</th><th>Статус дома</th><th>Статус инцидента</th><th>Время</th></tr>
+            {rows}
+        </table>
+        <p><strong>Сформировано:</strong> {now_str}</p>
+        <hr>
+        <p>Это автоматическое уведомление от системы мониторинга ГВС.</p>
+    </body>
+    </html>
+    """
+
+    msg = MIMEMultipart()
+    msg["From"] = EMAIL_FROM
+    msg["To"] = ", ".join(NOTIFICATION_EMAILS)
+    msg["Subject"] = subject
+    msg.attach(MIMEText(body, "html"))
+    return msg
+
+
+class NotificationSender:
+    """Фоновая отправка outbox одним SMTP-соединением"""
+
+    def __init__(self, session_factory):
+        self._session_factory = session_factory
+        self._wakeup = asyncio.Event()
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self.sent_messages = 0
+        self.sent_notifications = 0
+        self.failed_attempts = 0
+
+    async def ensure_schema(self) -> None:
+        async with self._session_factory() as db:
+            for statement in SCHEMA_STATEMENTS:
+                await db.execute(text(statement))
+            await db.commit()
+
+    def wake(self) -> None:
+        """Сообщает, что в outbox появились новые уведомления"""
+        self._wakeup.set()
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=NOTIFY_POLL_SECONDS)
+                # Даём всплеску уведомлений собраться, чтобы отправить его одним письмом
+                await asyncio.sleep(NOTIFY_DIGEST_WINDOW_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                while await self._send_due():
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[notify] Error processing notification outbox: {e}")
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self._disconnect)
+
+    async def _send_due(self) -> bool:
+        """Отправляет одну пачку готовых к отправке уведомлений; False — если отправлять нечего или не удалось"""
+        async with self._session_factory() as db:
+            # SKIP LOCKED — чтобы несколько воркеров uvicorn не отправили одну пачку дважды
+            result = await db.execute(
+                text("""
+                    SELECT o.id, o.id_house, o.house_health, o.status_incident, o.created_at, h.address
+                    FROM notification_outbox o
+                    LEFT JOIN lublino_houses_id h ON h.id_house = o.id_house
+                    WHERE o.status = 'pending' AND o.next_attempt_at <= now()
+                    ORDER BY o.id
+                    LIMIT :limit
+                    FOR UPDATE OF o SKIP LOCKED
+                """),
+                {"limit": NOTIFY_DIGEST_MAX_ITEMS},
+            )
+            rows = result.mappings().all()
+            if not rows:
+                return False
+
+            ids = [row["id"] for row in rows]
+            # Несколько уведомлений об одном доме в пачке — в письмо идёт последнее
+            latest: Dict[int, Dict] = {}
+            for row in rows:
+                latest.pop(row["id_house"], None)
+                latest[row["id_house"]] = dict(row)
+            items = list(latest.values())
+
+            try:
+                with span("smtp"):
+                    await asyncio.to_thread(self._deliver, build_message(items))
+            except Exception as e:
+                self.failed_attempts += 1
+                self._log_error(e)
+                await db.execute(
+                    text("""
+                        UPDATE notification_outbox
+                        SET attempts = attempts + 1,
+                            last_error = :error,
+                            status = CASE WHEN attempts + 1 >= :max_attempts THEN 'failed' ELSE 'pending' END,
+                            next_attempt_at = now() + make_interval(
+                                secs => LEAST(:base * power(2, attempts), :max_delay)
+                            )
+                        WHERE id = ANY(:ids)
+                    """),
+                    {
+                        "ids": ids,
+                        "error": str(e)[:1000],
+                        "max_attempts": NOTIFY_MAX_ATTEMPTS,
+                        "base": NOTIFY_RETRY_BASE_SECONDS,
+                        "max_delay": NOTIFY_RETRY_MAX_SECONDS,
+                    },
+                )
+                await db.commit()
+                return False
+
+            await db.execute(
+                text("""
+                    UPDATE notification_outbox
+                    SET status = 'sent', sent_at = now(), attempts = attempts + 1
+                    WHERE id = ANY(:ids)
+                """),
+                {"ids": ids},
+            )
+            await db.commit()
+
+        self.sent_messages += 1
+        self.sent_notifications += len(ids)
+        print(f"[notify] Sent {'digest' if len(items) > 1 else 'notification'} for {len(items)} houses")
+        return True
+
+    # Методы ниже выполняются в отдельном потоке (asyncio.to_thread)
+
+    def _connect(self) -> smtplib.SMTP:
+        if SMTP_PORT == 465:
+            smtp = smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT, timeout=30)
+        else:
+            smtp = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=30)
+            if SMTP_STARTTLS:
+                smtp.starttls()
+        if EMAIL_USER and EMAIL_PASSWORD:
+            smtp.login(EMAIL_USER, EMAIL_PASSWORD)
+        print(f"[notify] Connected to {SMTP_SERVER}:{SMTP_PORT}")
+        return smtp
+
+    def _connection(self) -> smtplib.SMTP:
+        if self._smtp is not None and time.monotonic() - self._last_used > SMTP_IDLE_CHECK_SECONDS:
+            # Сервер мог закрыть простаивающее соединение
+            try:
+                if self._smtp.noop()[0] != 250:
+                    self._disconnect()
+            except smtplib.SMTPException:
+                self._disconnect()
+        if self._smtp is None:
+            self._smtp = self._connect()
+        return self._smtp
+
+    def _deliver(self, msg: MIMEMultipart) -> None:
+        try:
+            try:
+                self._connection().send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                # Одна повторная попытка на свежем соединении, дальше — backoff через outbox
+                self._disconnect()
+                self._connection().send_message(msg)
+        except Exception:
+            self._disconnect()
+            raise
+        self._last_used = time.monotonic()
+
+    def _disconnect(self) -> None:
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        self._smtp = None
+
+    def _log_error(self, e: Exception) -> None:
+        if isinstance(e, smtplib.SMTPAuthenticationError):
+            print(f"[notify] SMTP Authentication Error: {e}. Check your email credentials and app password settings")
+        elif isinstance(e, smtplib.SMTPRecipientsRefused):
+            print(f"[notify] SMTP Recipients Refused Error: {e}. Check if recipient emails are valid: {NOTIFICATION_EMAILS}")
+        elif isinstance(e, (smtplib.SMTPConnectError, OSError)):
+            print(f"[notify] SMTP Connection Error: {e}. Check if {SMTP_SERVER}:{SMTP_PORT} is accessible")
+        else:
+            print(f"[notify] Failed to send email notification: {e}")
+
+    async def stats(self) -> Dict:
+        async with self._session_factory() as db:
+            result = await db.execute(text("SELECT status, count(*) AS cnt FROM notification_outbox GROUP BY status"))
+            outbox = {row.status: row.cnt for row in result}
+        return {
+            "enabled": notifications_enabled(),
+            "outbox": outbox,
+            "sent_messages": self.sent_messages,
+            "sent_notifications": self.sent_notifications,
+            "failed_attempts": self.failed_attempts,
+        }
+
+
+notification_sender = NotificationSender(AsyncSessionLocal)
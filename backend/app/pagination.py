@@ -0,0 +1,73 @@
+"""
+Курсорная (keyset) пагинация списков.
+
+Курсор — значения ключа сортировки последней строки страницы, упакованные в
+url-safe base64. Следующая страница выбирается условием (ключ, id) > курсор, поэтому
+стоимость запроса не зависит от номера страницы и размера района, а добавление или
+удаление строк между запросами не даёт пропусков и дублей.
+"""
+import base64
+import json
+import os
+from typing import Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Select, tuple_
+
+DEFAULT_PAGE_SIZE = int(os.getenv("HOUSE_LIST_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidCursor(ValueError):
+    """Курсор повреждён или выдан для другой сортировки"""
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps(list(values), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursor(str(e))
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor("unexpected cursor shape")
+    return values
+
+
+def _check_types(values: Sequence[Any], keys: Sequence) -> None:
+    """Курсор другой сортировки (строка вместо числа) должен давать 400, а не ошибку Postgres"""
+    for value, key in zip(values, keys):
+        try:
+            expected = key.type.python_type
+        except NotImplementedError:
+            continue
+        if not isinstance(value, expected) or (isinstance(value, bool) and expected is not bool):
+            raise InvalidCursor(f"cursor value {value!r} does not match sort key type {expected.__name__}")
+        if expected is int and not -2 ** 63 <= value < 2 ** 63:
+            raise InvalidCursor(f"cursor value {value!r} is out of bigint range")
+
+
+def apply_keyset(query: Select, keys: Sequence, cursor: Optional[str], limit: int, descending: bool = False) -> Select:
+    """
+    Добавляет к запросу стабильную сортировку по keys (последний ключ должен быть уникальным)
+    и условие «после курсора». Выбирается limit + 1 строк, чтобы понять, есть ли следующая страница.
+    """
+    if cursor:
+        values = decode_cursor(cursor, len(keys))
+        _check_types(values, keys)
+        row_key, cursor_key = tuple_(*keys), tuple_(*values)
+        query = query.where(row_key < cursor_key if descending else row_key > cursor_key)
+    order = [key.desc() for key in keys] if descending else list(keys)
+    return query.order_by(*order).limit(limit + 1)
+
+
+def split_page(rows: Sequence, limit: int, key_names: Sequence[str]) -> Tuple[Sequence, Optional[str]]:
+    """Отрезает лишнюю строку и строит курсор следующей страницы по полям key_names последней строки"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, name) for name in key_names])
@@ -0,0 +1,105 @@
+"""
+Сэмплирующий профилировщик живого процесса (без перезапуска и сторонних инструментов).
+
+Отдельный поток каждые interval_ms снимает стеки всех потоков (sys._current_frames) и считает,
+сколько раз встретился каждый стек и каждая функция. Стеки простоя (event loop ждёт в select,
+пул потоков ждёт задач) по умолчанию отбрасываются, поэтому доли показывают, на что уходит CPU.
+Результат — сводка по функциям или стеки в folded-формате для flamegraph.pl / speedscope.
+Одновременно идёт не больше одного профилирования; потери на сэмплирование — единицы процентов
+при интервале 5–10 мс.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_TOP_FUNCTIONS = 40
+# Кадры, на которых поток ничего не делает, а ждёт
+IDLE_FUNCTIONS = {
+    ("selectors", "select"),
+    ("threading", "wait"),
+    ("concurrent.futures.thread", "_worker"),
+    ("queue", "get"),
+    ("socket", "accept"),
+}
+
+_running = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Профилирование уже идёт"""
+
+
+def _frame_name(frame) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}"
+
+
+def _is_idle(frame) -> bool:
+    return (frame.f_globals.get("__name__", ""), frame.f_code.co_name) in IDLE_FUNCTIONS
+
+
+def _stack(frame) -> Tuple[str, ...]:
+    names: List[str] = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    return tuple(names)
+
+
+def sample(seconds: float, interval_ms: float = 10.0, include_idle: bool = False) -> Dict:
+    """Блокирует вызывающий поток на seconds (вызывать через asyncio.to_thread)"""
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+        interval = max(interval_ms, 1.0) / 1000
+        own_thread = threading.get_ident()
+        thread_names = {t.ident: t.name for t in threading.enumerate()}
+
+        stacks: Counter = Counter()
+        ticks = 0
+        started = time.perf_counter()
+        deadline = started + seconds
+        while time.perf_counter() < deadline:
+            ticks += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread or (not include_idle and _is_idle(frame)):
+                    continue
+                thread = thread_names.get(thread_id) or f"thread-{thread_id}"
+                stacks[(thread, *_stack(frame))] += 1
+            time.sleep(interval)
+        elapsed = time.perf_counter() - started
+    finally:
+        _running.release()
+
+    samples = sum(stacks.values())
+    own: Counter = Counter()
+    total: Counter = Counter()
+    for stack, count in stacks.items():
+        own[stack[-1]] += count
+        for name in set(stack[1:]):
+            total[name] += count
+
+    def top(counter: Counter) -> List[Dict]:
+        return [
+            {"function": name, "samples": count, "share": round(count / samples, 4)}
+            for name, count in counter.most_common(PROFILE_TOP_FUNCTIONS)
+        ]
+
+    return {
+        "seconds": round(elapsed, 2),
+        "ticks": ticks,
+        "samples": samples,
+        "self": top(own) if samples else [],
+        "total": top(total) if samples else [],
+        "stacks": stacks,
+    }
+
+
+def folded(stacks: Counter) -> str:
+    """Стеки в формате 'поток;модуль.функция;... число' (flamegraph.pl, speedscope)"""
+    return "".join(f"{';'.join(stack)} {count}\n" for stack, count in stacks.most_common())
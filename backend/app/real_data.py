@@ -1,19 +1,64 @@
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, or_
 from datetime import datetime, timedelta
-import random
-from sqlalchemy import text, select, func, or_
+from sqlalchemy import text, select, func, or_, and_
+from sqlalchemy import BigInteger, any_, literal
+from sqlalchemy.dialects.postgresql import ARRAY
 from app.models import StatusHealth, LublinoHousesId
 from app.schemas import (
     DashboardMetrics,
     HouseListItem,
     HouseDetail
 )
+from app.address_search import address_index
+from app.districts import district_registry
+from app.pagination import DEFAULT_PAGE_SIZE, apply_keyset, split_page
+from app.status_snapshot import get_status_snapshot
+from app.rollups import ROLLUP_TABLES
+from app.timeseries_store import SERIES, timeseries_store
+
+# Маппинг house_health на цвет статуса в API
+HEALTH_TO_COLOR: Dict[str, str] = {
+    "Red": "red",
+    "Yellow": "yellow",
+    "Green": "green",
+}
+COLOR_TO_HEALTH: Dict[str, str] = {color: health for health, color in HEALTH_TO_COLOR.items()}
+
+# Маппинг статуса инцидента на русский и обратно (для фильтра)
+INCIDENT_STATUS_TO_RU: Dict[Optional[str], str] = {
+    "Work": "В работе",
+    "Repair": "В ремонте",
+    "New": "Новый",
+    "Resolved": "Решен",
+    None: "Статус не задан",
+}
+INCIDENT_STATUS_FROM_RU: Dict[str, Optional[str]] = {ru: en for en, ru in INCIDENT_STATUS_TO_RU.items()}
 
-REGION_ID_TO_NAME: Dict[str, str] = {
-    "lublino": "Район Люблино",
+# Названия type_incdnt из incident_hist_2 для контекста LLM
+INCIDENT_TYPE_NAMES: Dict[int, str] = {
+    1: "Инцидент",
+    3: "Предупреждение",
+    4: "Отклонение от прогноза",
 }
+
+# Соединение статусов с домами по секции района и id_house
+HOUSE_JOIN = and_(
+    StatusHealth.region_id == LublinoHousesId.region_id,
+    StatusHealth.id_house == LublinoHousesId.id_house,
+)
+
+# Дома без УНОМ идут в конце списка: сравнение с NULL в условии курсора потеряло бы их строки
+UNOM_NULLS_LAST = 9223372036854775807
+
+# Ключи сортировки списка домов; второй ключ пагинации — id_house.
+# Ключ не бывает NULL: одно и то же выражение стоит в ORDER BY и в условии курсора
+HOUSE_SORT_KEYS = {
+    "address": func.coalesce(LublinoHousesId.simple_address, LublinoHousesId.address, ""),
+    "unom": func.coalesce(StatusHealth.unom, UNOM_NULLS_LAST),
+}
+
 async def get_incident_history_for_llm(db: AsyncSession, house_id: str, hours_back: int = 24) -> List[Dict]:
     """
     Получает историю инцидентов для конкретного дома за последние N часов.
@@ -25,24 +70,27 @@ async def get_incident_history_for_llm(db: AsyncSession, house_id: str, hours_ba
           type_incdnt,
           comment_incdnt AS "comment"
         FROM public.incident_hist_2
-        WHERE id_house = :house_id
+        WHERE region_id = :region_id
+          AND id_house = :house_id
           AND time_5min >= now()
           AND time_5min <= now() 
-          AND type_incdnt IN (1, 3) 
+          AND type_incdnt IN (1, 3, 4) 
         ORDER BY time_5min DESC; 
     """)
     try:
         query_formatted = query.text.replace(':hours_back', str(int(hours_back)))
         query_final = text(query_formatted)
 
-        result = await db.execute(query_final, {"house_id": int(house_id)})
+        result = await db.execute(
+            query_final, {"region_id": district_registry.region_of(house_id), "house_id": int(house_id)}
+        )
         rows = result.fetchall()
         return [
             {
                 "time_str": row.time_str,
                 "change_1h_percent": row.change_1h_percent,
                 "type_incdnt_num": row.type_incdnt,
-                "type_incdnt_str": "Инцидент" if row.type_incdnt == 1 else "Предупреждение" if row.type_incdnt == 3 else f"Тип {row.type_incdnt}",
+                "type_incdnt_str": INCIDENT_TYPE_NAMES.get(row.type_incdnt, f"Тип {row.type_incdnt}"),
                 "comment": row.comment
             }
             for row in rows
@@ -56,7 +104,8 @@ async def get_regional_incident_stats(db: AsyncSession, region_id: str, hours_ba
     Получает ТОП-10 последних инцидентов и предупреждений по региону за последние N часов.
     Использует серверное время PostgreSQL для фильтрации, исключая будущие даты.
     Возвращает список событий с адресом, временем, типом и комментарием.
-    type_incdnt: 1 - Инцидент, 3 - Предупреждение, 2 - Нет отклонения (не включается).
+    type_incdnt: 1 - Инцидент, 3 - Предупреждение, 4 - Отклонение от прогноза,
+    2 и 5 - Нет отклонения (не включаются).
     """
     query = text("""
         SELECT
@@ -66,11 +115,11 @@ async def get_regional_incident_stats(db: AsyncSession, region_id: str, hours_ba
           ih.type_incdnt, -- Тип инцидента (число)
           ih.comment_incdnt -- Комментарий
         FROM public.incident_hist_2 ih
-        JOIN lublino_houses_id lhi ON ih.id_house = lhi.id_house
-        WHERE ih.id_house IN (SELECT id_house FROM lublino_houses_id) -- Ограничение регионом
+        JOIN lublino_houses_id lhi ON lhi.region_id = ih.region_id AND ih.id_house = lhi.id_house
+        WHERE ih.region_id = :region_id -- Ограничение регионом (только секция района)
           AND ih.time_5min >= now() - INTERVAL ':hours_back hours' -- Фильтр по времени: не раньше N часов назад
           AND ih.time_5min <= now() -- Фильтр по времени: не позже текущего времени (исключаем будущее)
-          AND ih.type_incdnt IN (1, 3) -- Только инциденты (1) и предупреждения (3)
+          AND ih.type_incdnt IN (1, 3, 4) -- Только инциденты (1), предупреждения (3) и отклонения от прогноза (4)
         ORDER BY ih.time_5min DESC -- Сортировка от новых (ближе к now()) к старым
         LIMIT 10 -- Ограничиваем 10 последними (в пределах фильтра)
     """)
@@ -79,12 +128,13 @@ async def get_regional_incident_stats(db: AsyncSession, region_id: str, hours_ba
         query_formatted = query.text.replace(':hours_back', str(int(hours_back)))
         query_final = text(query_formatted)
 
-        result = await db.execute(query_final)
+        result = await db.execute(query_final, {"region_id": region_id})
         rows = result.fetchall()
 
         recent_incidents_list = []
         incident_count = 0
         warning_count = 0
+        deviation_count = 0
         latest_time_obj = None # Храним как datetime object
 
         for row in rows:
@@ -93,6 +143,8 @@ async def get_regional_incident_stats(db: AsyncSession, region_id: str, hours_ba
                 incident_count += 1
             elif row.type_incdnt == 3:
                 warning_count += 1
+            elif row.type_incdnt == 4:
+                deviation_count += 1
 
             # Отслеживаем самое последнее время (первый элемент из-за ORDER BY DESC)
             # row.time_str - строка в формате 'DD/MM HH24:MI'
@@ -105,8 +157,7 @@ async def get_regional_incident_stats(db: AsyncSession, region_id: str, hours_ba
                     print(f"Warning: Could not parse time string '{row.time_str}': {ve}")
                     continue 
 
-            type_str_map = {1: "Инцидент", 3: "Предупреждение"}
-            type_str = type_str_map.get(row.type_incdnt, f"Тип {row.type_incdnt}")
+            type_str = INCIDENT_TYPE_NAMES.get(row.type_incdnt, f"Тип {row.type_incdnt}")
 
             recent_incidents_list.append({
                 "address": row.simple_address or "Адрес не указан",
@@ -120,7 +171,8 @@ async def get_regional_incident_stats(db: AsyncSession, region_id: str, hours_ba
         total_events = len(recent_incidents_list)
         latest_time_str_for_summary = latest_time_obj.strftime('%d/%m %H:%M') if latest_time_obj else 'Нет данных'
         summary = f"Всего инцидентов и предупреждений за последние {hours_back} ч: {total_events}. " \
-                  f"Инциденты (1): {incident_count}, Предупреждения (3): {warning_count}. " \
+                  f"Инциденты (1): {incident_count}, Предупреждения (3): {warning_count}, " \
+                  f"Отклонения от прогноза (4): {deviation_count}. " \
                   f"Последний инцидент/предупреждение: {latest_time_str_for_summary}."
 
         return {
@@ -143,230 +195,195 @@ async def get_regional_incident_stats(db: AsyncSession, region_id: str, hours_ba
             "summary": f"Ошибка получения статистики инцидентов за последние {hours_back} ч."
         }
 
-async def get_water_data_for_llm(db: AsyncSession, house_id: str) -> Dict:
-    """
-    Получает последние данные по расходу и отклонениям и прогноз ХВС для LLM
+WATER_DATA_QUERIES = {
+    "consumption_1h": """
+        SELECT time_1hour, water_cold, water_hot
+        FROM public.water_consump_hot_1h
+        WHERE id_house = :house_id
+        ORDER BY time_1hour DESC
+        LIMIT 24
+    """,
+    "diffr_1h": """
+        SELECT time_1hour, diffr_ratio
+        FROM public.water_diffr_coldhot_1h
+        WHERE id_house = :house_id
+        ORDER BY time_1hour DESC
+        LIMIT 24
+    """,
+    "forecast_cold_water_24h_hourly": """
+        SELECT
+          ds AS "time",
+          yhat AS "forecast_cold_water_value",
+          '(прогноз)' AS "series_type"
+        FROM public.water_forecast_all
+        WHERE region_id = :region_id
+          AND id_house = :house_id
+          AND ds >= now() AT TIME ZONE 'UTC' -- Только будущие
+          AND ds < now() AT TIME ZONE 'UTC' + INTERVAL '1 day' -- Ограничение 24 часами вперед
+          AND EXTRACT(MINUTE FROM ds AT TIME ZONE 'UTC') = 0 -- Только на полный час (00 минут)
+        ORDER BY ds ASC -- Сортировка по возрастанию времени
+        -- LIMIT 24 -- Необязательно, так как фильтр по 24ч и по часам даст максимум 24 записи
     """
-    queries = {
-        "consumption_1h": f"""
-            SELECT time_1hour, water_cold, water_hot
-            FROM public.water_consump_hot_1h
-            WHERE id_house = :house_id
-            ORDER BY time_1hour DESC
-            LIMIT 24
-        """,
-        "diffr_1h": f"""
-            SELECT time_1hour, diffr_ratio
-            FROM public.water_diffr_coldhot_1h
-            WHERE id_house = :house_id
-            ORDER BY time_1hour DESC
-            LIMIT 24
-        """,
-        "forecast_cold_water_24h_hourly": f"""
-            SELECT
-              ds AS "time",
-              yhat AS "forecast_cold_water_value",
-              '(прогноз)' AS "series_type"
-            FROM public.water_forecast_all
-            WHERE id_house = :house_id
-              AND ds >= now() AT TIME ZONE 'UTC' -- Только будущие
-              AND ds < now() AT TIME ZONE 'UTC' + INTERVAL '1 day' -- Ограничение 24 часами вперед
-              AND EXTRACT(MINUTE FROM ds AT TIME ZONE 'UTC') = 0 -- Только на полный час (00 минут)
-            ORDER BY ds ASC -- Сортировка по возрастанию времени
-            -- LIMIT 24 -- Необязательно, так как фильтр по 24ч и по часам даст максимум 24 записи
-        """
-    }
-    data = {}
-    for key, query in queries.items():
-        try:
-            result = await db.execute(text(query), {"house_id": int(house_id)})
-            rows = result.fetchall()
-            # Обработка результата
-            if key == "forecast_cold_water_24h_hourly":
-                # Для прогноза структура строки может отличаться
-                data[key] = [
-                    {
-                        "time": row.time.isoformat() if hasattr(row.time, 'isoformat') else str(row.time),
-                        "values": {"forecast_cold_water_value": row.forecast_cold_water_value, "series_type": row.series_type}
-                    }
-                    for row in rows
-                ]
-            else:
-                # Существующая логика для других типов данных
-                # Используем result.keys()._keys для получения имен столбцов
-                column_names = list(result.keys())
-                data[key] = [
-                    {
-                        "time": row[0].isoformat() if hasattr(row[0], 'isoformat') else str(row[0]),
-                        "values": {k: v for k, v in zip(column_names[1:], row[1:])} 
-                    }
-                    for row in rows
-                ]
-        except Exception as e:
-            print(f"Error getting {key} data: {e}")
-            data[key] = []
-    return data
-
-async def get_regional_forecast_cold_water_24h_hourly_random(db: AsyncSession, num_houses: int = 5) -> Dict:
+}
+
+async def get_water_series_for_llm(db: AsyncSession, house_id: str, key: str) -> List[Dict]:
     """
-    Получает прогнозные значения ХВС для N рандомных домов из lublino_houses_id на ближайшие 24 часа, отфильтрованные по полным часам.
+    Получает один ряд для LLM (consumption_1h, diffr_1h или forecast_cold_water_24h_hourly).
+    Ряды не зависят друг от друга, поэтому их можно читать параллельно в разных сессиях.
     """
-    # Шаг 1: Получить список всех id_house из lublino_houses_id
+    # Последние 24 часа по расходу и отклонениям — из колоночного хранилища в памяти, если оно их покрывает
+    if key in SERIES:
+        cached = timeseries_store.recent(key, int(house_id), 24)
+        if cached is not None:
+            return cached
     try:
-        all_houses_query = text("SELECT id_house FROM lublino_houses_id")
-        all_houses_result = await db.execute(all_houses_query)
-        all_house_ids = [row.id_house for row in all_houses_result.fetchall()]
-
-        if not all_house_ids:
-            print("No houses found in lublino_houses_id.")
-            return {
-                "total_forecasts": 0,
-                "min_forecast_time": None,
-                "max_forecast_time": None,
-                "forecast_list": [],
-                "summary": "Нет домов для получения прогноза.",
-                "selected_house_ids": [] # Добавим список выбранных ID для прозрачности
-            }
-
-        # Шаг 2: Выбрать N рандомных id_house (или все, если их меньше N)
-        selected_house_ids = random.sample(all_house_ids, min(num_houses, len(all_house_ids)))
-        print(f"Selected random house IDs for forecast: {selected_house_ids}") # Логирование
-
-        # Шаг 3: Подготовить параметры для IN в основном запросе
-        # SQLAlchemy не очень любит списки напрямую в text(), поэтому используем строку
-        house_ids_str = ','.join(map(str, selected_house_ids))
-
-        # Шаг 4: Основной запрос к water_forecast_all с фильтрацией по выбранным ID
-        query = text(f"""
-            SELECT
-              lhi.simple_address, -- Адрес дома
-              to_char(wf.ds, 'DD/MM HH24:MI') AS "time_str", -- Время прогноза (строка!)
-              wf.yhat AS "forecast_cold_water_value"
-            FROM public.water_forecast_all wf
-            JOIN lublino_houses_id lhi ON wf.id_house = lhi.id_house
-            WHERE lhi.id_house IN ({house_ids_str}) -- Фильтр по выбранным рандомным ID
-              AND wf.ds >= now() AT TIME ZONE 'UTC' -- Только будущие
-              AND wf.ds < now() AT TIME ZONE 'UTC' + INTERVAL '1 day' -- Ограничение 24 часами вперед
-              AND EXTRACT(MINUTE FROM wf.ds AT TIME ZONE 'UTC') = 0 -- Только на полный час (00 минут)
-            ORDER BY wf.ds ASC, lhi.simple_address ASC -- Сортировка по времени, затем по адресу
-            -- LIMIT 100 -- Опционально: ограничить количество возвращаемых записей, если слишком много
-        """)
-        result = await db.execute(query)
+        # region_id нужен только запросу прогноза (секционированная таблица), остальные его не используют
+        result = await db.execute(
+            text(WATER_DATA_QUERIES[key]),
+            {"region_id": district_registry.region_of(house_id), "house_id": int(house_id)},
+        )
         rows = result.fetchall()
-
-        forecast_list = []
-        min_forecast_time = None
-        max_forecast_time = None
-        total_forecasts = 0
-
-        for row in rows:
-            total_forecasts += 1
-            # Отслеживаем временные границы прогноза
-            if min_forecast_time is None:
-                min_forecast_time = row.time_str
-            # max_forecast_time обновляется на последнюю строку после сортировки ASC
-            max_forecast_time = row.time_str
-
-            forecast_list.append({
-                "address": row.simple_address or "Адрес не указан",
-                "time_str": row.time_str,
-                "forecast_value": row.forecast_cold_water_value,
-            })
-
-        summary = f"Всего прогнозов ХВС для {len(selected_house_ids)} рандомных домов на ближайшие 24 ч (1-час интервал): {total_forecasts}. Прогноз с {min_forecast_time} до {max_forecast_time}."
-
-        return {
-            "total_forecasts": total_forecasts,
-            "min_forecast_time": min_forecast_time,
-            "max_forecast_time": max_forecast_time,
-            "forecast_list": forecast_list,
-            "summary": summary,
-            "selected_house_ids": selected_house_ids # Возвращаем для информации
-        }
+        # Обработка результата
+        if key == "forecast_cold_water_24h_hourly":
+            # Для прогноза структура строки может отличаться
+            return [
+                {
+                    "time": row.time.isoformat() if hasattr(row.time, 'isoformat') else str(row.time),
+                    "values": {"forecast_cold_water_value": row.forecast_cold_water_value, "series_type": row.series_type}
+                }
+                for row in rows
+            ]
+        # Существующая логика для других типов данных
+        column_names = list(result.keys())
+        return [
+            {
+                "time": row[0].isoformat() if hasattr(row[0], 'isoformat') else str(row[0]),
+                "values": {k: v for k, v in zip(column_names[1:], row[1:])} 
+            }
+            for row in rows
+        ]
     except Exception as e:
-        print(f"Error getting regional forecast stats for random houses: {e}")
-        return {
-            "total_forecasts": 0,
-            "min_forecast_time": None,
-            "max_forecast_time": None,
-            "forecast_list": [],
-            "summary": f"Ошибка получения прогнозных данных ХВС для рандомных домов: {e}",
-            "selected_house_ids": []
-        }
-
+        print(f"Error getting {key} data: {e}")
+        return []
 
-async def get_real_dashboard_metrics(db: AsyncSession, region_id: str, days: int) -> DashboardMetrics:
-    """Получить метрики дашборда из реальных данных"""
-    
-    # Подсчет домов по статусу здоровья
-    red_count = await db.execute(
-        select(func.count(StatusHealth.id_house)).where(StatusHealth.house_health == "Red")
-    )
-    red = red_count.scalar() or 0
-    
-    yellow_count = await db.execute(
-        select(func.count(StatusHealth.id_house)).where(StatusHealth.house_health == "Yellow")
-    )
-    yellow = yellow_count.scalar() or 0
-    
-    green_count = await db.execute(
-        select(func.count(StatusHealth.id_house)).where(StatusHealth.house_health == "Green")
-    )
-    green = green_count.scalar() or 0
-    
-    in_work_count = await db.execute(
-        select(func.count(StatusHealth.id_house)).where(
-            StatusHealth.status_incident.in_(["New", "Work", "Repair"])
-        )
+async def get_house_water_series(db: AsyncSession, house_id: str, key: str, hours: int = 24) -> List[Dict]:
+    """
+    Часовой ряд дома (consumption_1h или diffr_1h) за последние hours часов его данных, по возрастанию времени.
+    Окно, которое покрывает хранилище в памяти, читается оттуда, более старые диапазоны — из Postgres.
+    """
+    latest = timeseries_store.latest_time(key, int(house_id))
+    if latest is not None:
+        cached = timeseries_store.window(key, int(house_id), latest - timedelta(hours=hours - 1))
+        if cached is not None:
+            return cached
+
+    spec = SERIES[key]
+    result = await db.execute(
+        text(f"""
+            SELECT time_1hour, {", ".join(spec.columns)}
+            FROM public.{spec.table}
+            WHERE id_house = :house_id
+              AND time_1hour > (
+                  SELECT max(time_1hour) FROM public.{spec.table} WHERE id_house = :house_id
+              ) - make_interval(hours => :hours)
+            ORDER BY time_1hour
+        """),
+        {"house_id": int(house_id), "hours": hours},
     )
-    in_work = in_work_count.scalar() or 0
-    
-    # Сбои только за текущий день (сегодня)
-    from datetime import date
-    today = date.today()
-    
-    # Подсчитываем только сбои за сегодня
-    today_failures = await db.execute(
-        select(func.count(StatusHealth.id_house)).where(
-            StatusHealth.house_health.in_(["Red", "Yellow"])
-        )
+    return [
+        {
+            "time": row.time_1hour.isoformat(),
+            "values": {column: getattr(row, column) for column in spec.columns},
+        }
+        for row in result
+    ]
+
+async def get_house_rollup_series(db: AsyncSession, house_id: str, resolution: str, periods: int) -> List[Dict]:
+    """Суточный (1d) или недельный (1w) расход дома за последние periods периодов его данных"""
+    table, time_column = ROLLUP_TABLES[resolution]
+    result = await db.execute(
+        text(f"""
+            SELECT {time_column} AS time, water_cold, water_hot
+            FROM public.{table}
+            WHERE id_house = :house_id
+            ORDER BY {time_column} DESC
+            LIMIT :periods
+        """),
+        {"house_id": int(house_id), "periods": periods},
     )
-    total_current_failures = today_failures.scalar() or 0
+    return [
+        {"time": row.time.isoformat(), "values": {"water_cold": row.water_cold, "water_hot": row.water_hot}}
+        for row in reversed(result.fetchall())
+    ]
+
+async def get_real_dashboard_metrics(db: AsyncSession, region_id: str, days: int) -> DashboardMetrics:
+    """Получить метрики дашборда из снимка статусов региона"""
     
-    # Обработанные сегодня
-    processed_current = await db.execute(
-        select(func.count(StatusHealth.id_house)).where(
-            or_(
-                StatusHealth.status_incident == "Work",
-                StatusHealth.status_incident == "Repair"
-            )
-        )
-    )
-    processed = processed_current.scalar() or 0
+    snapshot = await get_status_snapshot(db, region_id)
     
     return DashboardMetrics(
         region_id=region_id,
-        region_name=REGION_ID_TO_NAME.get(region_id, "Неизвестный район"),
-        counts={
-            "red": red,
-            "yellow": yellow,
-            "green": green,
-            "in_work": in_work,
-            "total_current_failures": total_current_failures,
-            "processed_current": processed,
-        },
+        region_name=district_registry.name(region_id),
+        counts=dict(snapshot["counts"]),
         period_days=days,
     )
 
+def _house_list_filters(
+    region_id: str,
+    status: Optional[str] = None,
+    incident_status: Optional[str] = None,
+    search: Optional[str] = None,
+) -> List:
+    """Условия WHERE для списка домов района (общие для страницы и для подсчёта)"""
+    # region_id по обеим таблицам — чтобы читались только секции района
+    conditions = [StatusHealth.region_id == region_id, LublinoHousesId.region_id == region_id]
+    if status:
+        if status == "in_work":
+            conditions.append(StatusHealth.status_incident.in_(["New", "Work", "Repair"]))
+        elif status in COLOR_TO_HEALTH:
+            conditions.append(StatusHealth.house_health == COLOR_TO_HEALTH[status])
+
+    if incident_status:
+        english_status = INCIDENT_STATUS_FROM_RU.get(incident_status, incident_status)
+        if english_status is None:
+            conditions.append(StatusHealth.status_incident.is_(None))
+        else:
+            conditions.append(StatusHealth.status_incident == english_status)
+
+    if search:
+        if address_index.loaded:
+            # Поиск по индексу адресов в памяти вместо полного прохода ILIKE;
+            # id передаются одним массивом (= ANY), а не тысячами параметров IN
+            ids = address_index.search_ids(search, region_id)
+            if ids is not None:
+                conditions.append(StatusHealth.id_house == any_(literal(ids, ARRAY(BigInteger))))
+        else:
+            conditions.append(
+                or_(
+                    LublinoHousesId.simple_address.ilike(f"%{search}%"),
+                    LublinoHousesId.address.ilike(f"%{search}%")
+                )
+            )
+    return conditions
+
+
 async def get_real_house_list(
     db: AsyncSession,
     region_id: str,
     status: Optional[str] = None,
     incident_status: Optional[str] = None,
     search: Optional[str] = None,
-) -> List[HouseListItem]:
-    """Получить список домов из реальных данных с объединением таблиц"""
-    
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    sort_by: str = "address",
+    sort_dir: str = "asc",
+) -> Tuple[List[HouseListItem], Optional[str]]:
+    """
+    Страница списка домов из реальных данных с объединением таблиц.
+    Возвращает (дома, курсор следующей страницы или None).
+    """
+    sort_key = HOUSE_SORT_KEYS[sort_by].label("sort_key")
+
     # Базовый запрос с объединением таблиц (включаем все статусы)
     query = select(
         StatusHealth.id_house,
@@ -375,95 +392,83 @@ async def get_real_house_list(
         StatusHealth.house_health,
         LublinoHousesId.simple_address,
         LublinoHousesId.address,
-        LublinoHousesId.district
+        sort_key,
     ).select_from(
         StatusHealth
     ).join(
-        LublinoHousesId, StatusHealth.id_house == LublinoHousesId.id_house
+        LublinoHousesId, HOUSE_JOIN
+    ).where(*_house_list_filters(region_id, status, incident_status, search))
+
+    query = apply_keyset(
+        query, [HOUSE_SORT_KEYS[sort_by], StatusHealth.id_house], cursor, limit, descending=sort_dir == "desc"
     )
-    
-    # Применяем фильтры
-    if status:
-        if status == "red":
-            query = query.where(StatusHealth.house_health == "Red")
-        elif status == "yellow":
-            query = query.where(StatusHealth.house_health == "Yellow")
-        elif status == "green":
-            query = query.where(StatusHealth.house_health == "Green")
-        elif status == "in_work":
-            query = query.where(
-                StatusHealth.status_incident.in_(["New", "Work", "Repair"])
-            )
-    
-    if incident_status:
-        # Маппинг русских статусов на английские
-        status_mapping = {
-            "В работе": "Work",
-            "В ремонте": "Repair",
-            "Новый": "New",
-            "Решен": "Resolved",
-            "Статус не задан": None
-        }
-        english_status = status_mapping.get(incident_status, incident_status)
-        if english_status is None:
-            query = query.where(StatusHealth.status_incident.is_(None))
-        else:
-            query = query.where(StatusHealth.status_incident == english_status)
-    
-    if search:
-        query = query.where(
-            or_(
-                LublinoHousesId.simple_address.ilike(f"%{search}%"),
-                LublinoHousesId.address.ilike(f"%{search}%")
-            )
-        )
-    
-    result = await db.execute(query)
-    rows = result.fetchall()
-    
-    # Преобразуем в формат HouseListItem
+    rows, next_cursor = split_page((await db.execute(query)).fetchall(), limit, ["sort_key", "id_house"])
+
+    region_name = district_registry.name(region_id)
     houses = []
     for row in rows:
-        # Маппинг статусов
-        status_mapping = {
-            "Red": "red",
-            "Yellow": "yellow", 
-            "Green": "green"
-        }
-        
-        # Маппинг статусов
-        status_mapping = {
-            "Red": "red",
-            "Yellow": "yellow", 
-            "Green": "green"
-        }
-        
         # Если есть инцидент, то статус "in_work"
         if row.status_incident in ("New", "Work", "Repair"):
             mapped_status = "in_work"
         else:
-            mapped_status = status_mapping.get(row.house_health, "green")
-        
-        # Маппинг статуса инцидента для валидации
-        incident_status_mapping = {
-            "Work": "В работе",
-            "Repair": "В ремонте",
-            "New": "Новый",
-            "Resolved": "Решен",
-            None: "Статус не задан"
-        }
-        
+            mapped_status = HEALTH_TO_COLOR.get(row.house_health, "green")
+
         houses.append(HouseListItem(
             house_id=str(row.id_house),
             address=row.simple_address or row.address or "Адрес не указан",
-            region=REGION_ID_TO_NAME.get(region_id, "Неизвестный район"),
+            region=region_name,
             status=mapped_status,
             last_failure_date=None,  # В реальных данных нет даты последней проблемы
-            incident_status=incident_status_mapping.get(row.status_incident, "В работе"),
+            incident_status=INCIDENT_STATUS_TO_RU.get(row.status_incident, "В работе"),
             unom=str(row.unom),
         ))
-    
-    return houses
+
+    return houses, next_cursor
+
+
+async def count_real_houses(
+    db: AsyncSession,
+    region_id: str,
+    status: Optional[str] = None,
+    incident_status: Optional[str] = None,
+    search: Optional[str] = None,
+) -> int:
+    """Число домов под теми же фильтрами, что и get_real_house_list (отдельным запросом, только по требованию)"""
+    query = select(func.count()).select_from(
+        StatusHealth
+    ).join(
+        LublinoHousesId, HOUSE_JOIN
+    ).where(*_house_list_filters(region_id, status, incident_status, search))
+    return (await db.execute(query)).scalar_one()
+
+
+async def get_house_options(
+    db: AsyncSession,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    region_id: Optional[str] = None,
+) -> Tuple[List[Dict], Optional[str]]:
+    """Страница списка домов для выбора при создании инцидента, по адресу (всех или одного района)"""
+    sort_key = func.coalesce(LublinoHousesId.simple_address, "")
+    query = select(
+        LublinoHousesId.id_house,
+        LublinoHousesId.unom,
+        LublinoHousesId.simple_address,
+        sort_key.label("sort_key"),
+    )
+    if region_id:
+        query = query.where(LublinoHousesId.region_id == region_id)
+    query = apply_keyset(query, [sort_key, LublinoHousesId.id_house], cursor, limit)
+    rows, next_cursor = split_page((await db.execute(query)).fetchall(), limit, ["sort_key", "id_house"])
+    return [
+        {
+            "id_house": row.id_house,
+            "unom": row.unom,
+            "simple_address": row.simple_address
+        }
+        for row in rows
+    ], next_cursor
+
 
 async def get_real_house_detail(db: AsyncSession, house_id: str) -> Optional[HouseDetail]:
     """Получить детальную информацию о доме из реальных данных"""
@@ -477,12 +482,17 @@ async def get_real_house_detail(db: AsyncSession, house_id: str) -> Optional[Hou
         LublinoHousesId.address,
         LublinoHousesId.district,
         LublinoHousesId.n_fias,
-        LublinoHousesId.nreg
+        LublinoHousesId.nreg,
+        LublinoHousesId.region_id,
     ).select_from(
         StatusHealth,
     ).join(
-        LublinoHousesId, StatusHealth.id_house == LublinoHousesId.id_house
-    ).where(StatusHealth.id_house == int(house_id))
+        LublinoHousesId, HOUSE_JOIN
+    ).where(
+        # Район из реестра — читается только секция дома, а не все секции status_houses
+        StatusHealth.region_id == district_registry.region_of(house_id),
+        StatusHealth.id_house == int(house_id),
+    )
     
     result = await db.execute(query)
     row = result.fetchone()
@@ -490,26 +500,10 @@ async def get_real_house_detail(db: AsyncSession, house_id: str) -> Optional[Hou
     if not row:
         return None
     
-    # Маппинг статусов
-    status_mapping = {
-        "Red": "red",
-        "Yellow": "yellow", 
-        "Green": "green"
-    }
-    
-    # Маппинг статуса инцидента
-    incident_status_mapping = {
-        "Work": "В работе",
-        "Repair": "В ремонте",
-        "New": "Новый",
-        "Resolved": "Решен",
-        None: "Статус не задан"
-    }
-    
     if row.status_incident in ("New", "Work", "Repair"):
         mapped_status = "in_work"
     else:
-        mapped_status = status_mapping.get(row.house_health, "green")
+        mapped_status = HEALTH_TO_COLOR.get(row.house_health, "green")
     
     # Убираем фиктивные данные для серий
     
@@ -517,9 +511,9 @@ async def get_real_house_detail(db: AsyncSession, house_id: str) -> Optional[Hou
         house_id=house_id,
         address=row.simple_address or row.address or "Адрес не указан",
         simple_address=row.simple_address,
-        region=REGION_ID_TO_NAME.get("lublino", "Район Люблино"),
+        region=district_registry.name(row.region_id),
         status=mapped_status,
-        incident_status=incident_status_mapping.get(row.status_incident, "Статус не задан"),
+        incident_status=INCIDENT_STATUS_TO_RU.get(row.status_incident, "Статус не задан"),
         last_failure_date=None,
         status_valid_until=None,
         status_reason=None,
@@ -531,31 +525,9 @@ async def get_real_house_detail(db: AsyncSession, house_id: str) -> Optional[Hou
 async def get_full_llm_context(db: AsyncSession, region_id: str):
     """Получить полный контекст для LLM: статистика + проблемные дома"""
     
-    # 1. Общее количество домов в районе
-    total_houses = await db.execute(
-        select(func.count(LublinoHousesId.id_house))
-    )
-    total = total_houses.scalar() or 0
-
-    # 2. Количество домов по статусу здоровья
-    red = (await db.execute(
-        select(func.count(StatusHealth.id_house)).where(StatusHealth.house_health == "Red")
-    )).scalar() or 0
-
-    yellow = (await db.execute(
-        select(func.count(StatusHealth.id_house)).where(StatusHealth.house_health == "Yellow")
-    )).scalar() or 0
-
-    green = (await db.execute(
-        select(func.count(StatusHealth.id_house)).where(StatusHealth.house_health == "Green")
-    )).scalar() or 0
-
-    # 3. Дома с активными инцидентами
-    in_work = (await db.execute(
-        select(func.count(StatusHealth.id_house)).where(
-            StatusHealth.status_incident.in_(["New", "Work", "Repair"])
-        )
-    )).scalar() or 0
+    # 1-3. Общее количество домов и разбивка по статусам — из снимка статусов региона
+    snapshot = await get_status_snapshot(db, region_id)
+    counts = snapshot["counts"]
 
     # 4. Проблемные дома (как раньше)
     query = select(
@@ -566,8 +538,9 @@ async def get_full_llm_context(db: AsyncSession, region_id: str):
         LublinoHousesId.simple_address,
         LublinoHousesId.address,
     ).select_from(StatusHealth).join(
-        LublinoHousesId, StatusHealth.id_house == LublinoHousesId.id_house
+        LublinoHousesId, HOUSE_JOIN
     ).where(
+        StatusHealth.region_id == region_id,
         or_(
             StatusHealth.house_health.in_(["Red", "Yellow"]),
             StatusHealth.status_incident.in_(["New", "Work", "Repair"])
@@ -585,13 +558,13 @@ async def get_full_llm_context(db: AsyncSession, region_id: str):
         problem_houses.append(f"{addr} (УНОМ: {row.unom}) — {status_text}, инцидент: {incident_text}")
 
     return {
-        "region": REGION_ID_TO_NAME.get(region_id, "Неизвестный район"),
-        "total_houses": total,
+        "region": district_registry.name(region_id),
+        "total_houses": snapshot["total_houses"],
         "status_breakdown": {
-            "red": red,
-            "yellow": yellow,
-            "green": green,
-            "in_work": in_work,
+            "red": counts["red"],
+            "yellow": counts["yellow"],
+            "green": counts["green"],
+            "in_work": counts["in_work"],
         },
         "problem_houses_list": problem_houses,
     }
@@ -612,8 +585,9 @@ async def get_real_llm_context(db: AsyncSession, region_id: str):
     ).select_from(
         StatusHealth
     ).join(
-        LublinoHousesId, StatusHealth.id_house == LublinoHousesId.id_house
+        LublinoHousesId, HOUSE_JOIN
     ).where(
+        StatusHealth.region_id == region_id,
         or_(
             StatusHealth.house_health.in_(["Red", "Yellow"]),
             StatusHealth.status_incident.isnot(None)
@@ -633,7 +607,7 @@ async def get_real_llm_context(db: AsyncSession, region_id: str):
         houses.append(f"{row.simple_address or row.address} - {status_text} ({incident_text})")
     
     return {
-        "region": REGION_ID_TO_NAME.get(region_id, "Неизвестный район"),
+        "region": district_registry.name(region_id),
         "total_problem_houses": len(houses),
         "houses": houses[:100]  # Увеличиваем до 100 домов для более полной информации
     }
@@ -0,0 +1,265 @@
+"""
+Прогноз ХВС по району целиком для контекста LLM — без запросов к БД на каждый вопрос.
+
+Раньше на каждый /api/ask-llm выбирались пять случайных домов района и их прогнозы читались
+из water_forecast_all. Теперь почасовые прогнозы всех домов района (точки на полный час, как
+и раньше) держатся в памяти матрицей дома x часы на FORECAST_AGGREGATE_HOURS вперёд. Сводка
+на ближайшие 24 часа — сумма по району с интервалом, распределение прогноза по домам (p10/p50/p90,
+максимум) для каждого часа, распределение суточных сумм домов и дома с наибольшим прогнозом —
+считается по матрице numpy один раз в час и кэшируется.
+
+Матрица перечитывается, когда water_forecast_all перезаписывают: триггеры по оператору
+увеличивают версию района в water_forecast_versions, а фоновый цикл раз в
+FORECAST_AGGREGATE_POLL_SECONDS сверяет версии (или сразу после wake(), например по завершении
+переобучения).
+"""
+import asyncio
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+
+from app.address_search import address_index
+from app.districts import district_registry
+
+FORECAST_AGGREGATE_HOURS = int(os.getenv("FORECAST_AGGREGATE_HOURS", "168"))
+FORECAST_AGGREGATE_POLL_SECONDS = float(os.getenv("FORECAST_AGGREGATE_POLL_SECONDS", "30"))
+SUMMARY_HOURS = 24
+TOP_HOUSES = 5
+QUANTILES = (10, 50, 90)
+HOUR = np.timedelta64(1, "h")
+
+SCHEMA_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS water_forecast_versions (
+        region_id TEXT PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 1,
+        updated_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+    """,
+    """
+    CREATE OR REPLACE FUNCTION water_forecast_bump_version() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO water_forecast_versions (region_id)
+        SELECT DISTINCT region_id FROM changed_rows
+        ON CONFLICT (region_id) DO UPDATE
+            SET version = water_forecast_versions.version + 1, updated_at = now();
+        RETURN NULL;
+    END
+    $$
+    """,
+    "DROP TRIGGER IF EXISTS trg_forecast_version_insert ON water_forecast_all",
+    """
+    CREATE TRIGGER trg_forecast_version_insert AFTER INSERT ON water_forecast_all
+        REFERENCING NEW TABLE AS changed_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION water_forecast_bump_version()
+    """,
+    "DROP TRIGGER IF EXISTS trg_forecast_version_delete ON water_forecast_all",
+    """
+    CREATE TRIGGER trg_forecast_version_delete AFTER DELETE ON water_forecast_all
+        REFERENCING OLD TABLE AS changed_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION water_forecast_bump_version()
+    """,
+    "DROP TRIGGER IF EXISTS trg_forecast_version_update ON water_forecast_all",
+    """
+    CREATE TRIGGER trg_forecast_version_update AFTER UPDATE ON water_forecast_all
+        REFERENCING NEW TABLE AS changed_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION water_forecast_bump_version()
+    """,
+]
+
+# Номер часа от :start считает Postgres — разбор сотен тысяч datetime в Python занял бы секунды
+FORECAST_QUERY = """
+    SELECT id_house, CAST(EXTRACT(EPOCH FROM ds - CAST(:start AS timestamp)) / 3600 AS integer) AS hour, yhat, yhat_lower, yhat_upper
+    FROM public.water_forecast_all
+    WHERE region_id = :region_id
+      AND ds >= CAST(:start AS timestamp) AND ds < CAST(:end AS timestamp)
+      AND EXTRACT(MINUTE FROM ds) = 0
+"""
+
+
+@dataclass
+class RegionForecast:
+    """Почасовой прогноз домов района: строки — дома, столбцы — часы от start (NaN — нет прогноза)"""
+    version: int
+    start: np.datetime64
+    house_ids: np.ndarray
+    yhat: np.ndarray
+    yhat_lower: np.ndarray
+    yhat_upper: np.ndarray
+
+
+def build_region_forecast(rows, start: datetime, hours: int, version: int = 0) -> RegionForecast:
+    """rows: (id_house, номер часа от start, yhat, yhat_lower, yhat_upper) -> матрицы дома x часы"""
+    start64 = np.datetime64(start, "h")
+    if not rows:
+        empty = np.empty((0, hours), dtype=np.float32)
+        return RegionForecast(version, start64, np.empty(0, dtype=np.int64), empty, empty, empty)
+    columns = np.array(rows, dtype=np.float64)
+    house_ids, house_index = np.unique(columns[:, 0].astype(np.int64), return_inverse=True)
+    hour_index = columns[:, 1].astype(np.int64)
+    matrices = []
+    for values in columns[:, 2:].T:
+        matrix = np.full((len(house_ids), hours), np.nan, dtype=np.float32)
+        matrix[house_index, hour_index] = values
+        matrices.append(matrix)
+    return RegionForecast(version, start64, house_ids, *matrices)
+
+
+def _round(value) -> Optional[float]:
+    return None if value is None or np.isnan(value) else round(float(value), 3)
+
+
+def summarize(forecast: RegionForecast, first_hour: np.datetime64, hours: int = SUMMARY_HOURS) -> Dict:
+    """Сводка района на hours часов от first_hour по матрице прогноза"""
+    offset = max(int((first_hour - forecast.start) // HOUR), 0)
+    yhat = forecast.yhat[:, offset:offset + hours]
+    lower = forecast.yhat_lower[:, offset:offset + hours]
+    upper = forecast.yhat_upper[:, offset:offset + hours]
+    present = ~np.isnan(yhat)
+    houses_per_hour = present.sum(axis=0)
+    columns = np.flatnonzero(houses_per_hour)
+
+    hourly = []
+    if len(columns):
+        quantiles = np.nanpercentile(yhat[:, columns], QUANTILES, axis=0)
+        maxima = np.nanmax(yhat[:, columns], axis=0)
+        totals = np.nansum(yhat[:, columns], axis=0)
+        totals_lower = np.nansum(lower[:, columns], axis=0)
+        totals_upper = np.nansum(upper[:, columns], axis=0)
+        for i, column in enumerate(columns):
+            hourly.append({
+                "time": str((forecast.start + (offset + int(column)) * HOUR).astype("datetime64[m]")),
+                "houses": int(houses_per_hour[column]),
+                "total": _round(totals[i]),
+                "total_lower": _round(totals_lower[i]),
+                "total_upper": _round(totals_upper[i]),
+                **{f"p{q}": _round(quantiles[j, i]) for j, q in enumerate(QUANTILES)},
+                "max": _round(maxima[i]),
+            })
+
+    # Суточные суммы по домам, у которых есть хотя бы один час прогноза
+    house_rows = np.flatnonzero(present.any(axis=1))
+    house_totals = np.nansum(yhat[house_rows], axis=1)
+    top = house_rows[np.argsort(-house_totals)[:TOP_HOUSES]] if len(house_rows) else house_rows
+    top_houses = []
+    for row in top:
+        id_house = int(forecast.house_ids[row])
+        entry = address_index.house(id_house)
+        top_houses.append({
+            "id_house": id_house,
+            "address": (entry.simple_address if entry else None) or "Адрес не указан",
+            "total": _round(np.nansum(yhat[row])),
+        })
+
+    peak = max(hourly, key=lambda item: item["total"]) if hourly else None
+    return {
+        "version": forecast.version,
+        "hours": len(hourly),
+        "houses": int(len(house_rows)),
+        "first_hour": hourly[0]["time"] if hourly else None,
+        "last_hour": hourly[-1]["time"] if hourly else None,
+        "total": _round(float(np.nansum(yhat))) if len(house_rows) else None,
+        "peak_hour": peak["time"] if peak else None,
+        "peak_total": peak["total"] if peak else None,
+        "house_totals": {
+            f"p{q}": _round(value)
+            for q, value in zip(QUANTILES, np.percentile(house_totals, QUANTILES) if len(house_totals) else [None] * 3)
+        },
+        "hourly": hourly,
+        "top_houses": top_houses,
+    }
+
+
+class RegionalForecastAggregate:
+    """Прогнозы районов в памяти и часовой кэш сводок"""
+
+    def __init__(self, session_factory):
+        self._session_factory = session_factory
+        self._regions: Dict[str, RegionForecast] = {}
+        self._summaries: Dict[str, Tuple[Tuple[int, np.datetime64], Dict]] = {}
+        self._wakeup = asyncio.Event()
+
+    async def ensure_schema(self) -> None:
+        async with self._session_factory() as db:
+            for statement in SCHEMA_STATEMENTS:
+                await db.execute(text(statement))
+            await db.commit()
+
+    async def _load_region(self, db, region_id: str, version: int) -> RegionForecast:
+        # Как и прежний запрос: ds в UTC, только полные часы начиная с текущего
+        start = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        result = await db.execute(
+            text(FORECAST_QUERY),
+            {"region_id": region_id, "start": start, "end": start + timedelta(hours=FORECAST_AGGREGATE_HOURS)},
+        )
+        rows = [tuple(row) for row in result]
+        return await asyncio.to_thread(build_region_forecast, rows, start, FORECAST_AGGREGATE_HOURS, version)
+
+    async def refresh(self) -> List[str]:
+        """Перечитывает районы, прогноз которых изменился (и ещё не загруженные); возвращает их список"""
+        reloaded = []
+        async with self._session_factory() as db:
+            result = await db.execute(text("SELECT region_id, version FROM water_forecast_versions"))
+            versions = {row.region_id: row.version for row in result}
+            region_ids = {district.region_id for district in district_registry.all()} | set(versions)
+            for region_id in sorted(region_ids):
+                version = versions.get(region_id, 0)
+                loaded = self._regions.get(region_id)
+                if loaded is not None and loaded.version == version:
+                    continue
+                self._regions[region_id] = await self._load_region(db, region_id, version)
+                self._summaries.pop(region_id, None)
+                reloaded.append(region_id)
+        if reloaded:
+            print(f"[forecast] Regional forecast aggregates loaded for {', '.join(reloaded)}")
+        return reloaded
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    async def run(self, interval: float = FORECAST_AGGREGATE_POLL_SECONDS) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[forecast] Error refreshing regional forecast aggregates: {e}")
+
+    def summary(self, region_id: str, now: Optional[datetime] = None) -> Optional[Dict]:
+        """Сводка на ближайшие 24 часа (с первого полного часа не раньше now, UTC); None — район не загружен"""
+        forecast = self._regions.get(region_id)
+        if forecast is None:
+            return None
+        now = np.datetime64(now or datetime.utcnow(), "m")
+        first_hour = now.astype("datetime64[h]")
+        if now > first_hour:
+            first_hour += HOUR
+        key = (forecast.version, first_hour)
+        cached = self._summaries.get(region_id)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        result = summarize(forecast, first_hour)
+        self._summaries[region_id] = (key, result)
+        return result
+
+    def stats(self) -> Dict:
+        return {
+            region_id: {
+                "version": forecast.version,
+                "start": str(forecast.start.astype("datetime64[m]")),
+                "houses": int(len(forecast.house_ids)),
+                "hours": int(forecast.yhat.shape[1]),
+                "bytes": int(forecast.yhat.nbytes * 3),
+            }
+            for region_id, forecast in self._regions.items()
+        }
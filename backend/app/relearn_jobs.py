@@ -0,0 +1,182 @@
+"""
+Фоновый запуск переобучения моделей (/api/model-relearn/start).
+
+Задание записывается в model_relearn и проходит статусы
+queued -> running (с процентом выполнения) -> done / failed / cancelled.
+Сам пересчёт прогнозов (app.forecasting) идёт вне обработчика запроса, в пуле процессов.
+Два одновременных переобучения одной модели не допускаются: это проверяется
+в памяти и уникальным частичным индексом в БД (на случай нескольких воркеров uvicorn).
+"""
+import asyncio
+import os
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from app.forecasting import run_fleet_forecast
+
+DEFAULT_MODEL_NAME = "Prophet_5min"
+ACTIVE_STATUSES = ("queued", "running")
+MAX_CONCURRENT_JOBS = int(os.getenv("RELEARN_MAX_CONCURRENT_JOBS", "1"))
+RELEARN_WORKERS = int(os.getenv("RELEARN_WORKERS", str(os.cpu_count() or 1)))
+PROGRESS_FLUSH_SECONDS = 5.0
+
+SCHEMA_STATEMENTS = [
+    "ALTER TABLE model_relearn ADD COLUMN IF NOT EXISTS id SERIAL",
+    "ALTER TABLE model_relearn ADD COLUMN IF NOT EXISTS progress REAL",
+    "ALTER TABLE model_relearn ADD COLUMN IF NOT EXISTS started_at TIMESTAMP",
+    "ALTER TABLE model_relearn ADD COLUMN IF NOT EXISTS finished_at TIMESTAMP",
+    "ALTER TABLE model_relearn ADD COLUMN IF NOT EXISTS houses_processed INTEGER",
+    "ALTER TABLE model_relearn ADD COLUMN IF NOT EXISTS error TEXT",
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_model_relearn_active
+        ON model_relearn (model_name)
+        WHERE status_relearn IN ('queued', 'running')
+    """,
+]
+
+
+class RelearnJobConflict(Exception):
+    """Переобучение этой модели уже запущено"""
+
+
+class RelearnJobRunner:
+    """Очередь заданий переобучения в рамках одного процесса API"""
+
+    def __init__(self, session_factory, on_forecasts_replaced: Optional[Callable[[], None]] = None):
+        self._session_factory = session_factory
+        # Вызывается после того, как задание перезаписало water_forecast_all
+        self._on_forecasts_replaced = on_forecasts_replaced
+        self._semaphore = asyncio.Semaphore(MAX_CONCURRENT_JOBS)
+        self._jobs: Dict[int, Dict] = {}
+
+    async def ensure_schema(self) -> None:
+        """Добавляет в model_relearn колонки заданий и снимает «зависшие» задания после рестарта"""
+        async with self._session_factory() as db:
+            for statement in SCHEMA_STATEMENTS:
+                await db.execute(text(statement))
+            await db.execute(text("""
+                UPDATE model_relearn
+                SET status_relearn = 'failed', finished_at = now(), error = 'Прервано перезапуском сервиса'
+                WHERE status_relearn IN ('queued', 'running')
+            """))
+            await db.commit()
+
+    async def start(self, model_name: str, params: Optional[Dict] = None) -> int:
+        """Ставит задание в очередь и возвращает его id"""
+        if any(job["model_name"] == model_name for job in self._jobs.values()):
+            raise RelearnJobConflict(model_name)
+
+        async with self._session_factory() as db:
+            try:
+                result = await db.execute(
+                    text("""
+                        INSERT INTO model_relearn (model_name, status_relearn, date_relearn, progress)
+                        VALUES (:model_name, 'queued', :date_relearn, 0)
+                        RETURNING id
+                    """),
+                    {"model_name": model_name, "date_relearn": datetime.now()},
+                )
+                job_id = result.scalar_one()
+                await db.commit()
+            except IntegrityError:
+                await db.rollback()
+                raise RelearnJobConflict(model_name)
+
+        job = {
+            "model_name": model_name,
+            "params": params or {},
+            "progress": 0.0,
+            "houses_processed": 0,
+            "cancel_event": asyncio.Event(),
+        }
+        self._jobs[job_id] = job
+        job["task"] = asyncio.create_task(self._run(job_id, job))
+        return job_id
+
+    async def cancel(self, job_id: int) -> bool:
+        """Запрашивает отмену задания; False — если такого активного задания нет"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return False
+        job["cancel_event"].set()
+        return True
+
+    async def shutdown(self) -> None:
+        for job in self._jobs.values():
+            job["cancel_event"].set()
+        tasks: List[asyncio.Task] = [job["task"] for job in self._jobs.values()]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _update(self, job_id: int, **fields) -> None:
+        assignments = ", ".join(f"{name} = :{name}" for name in fields)
+        async with self._session_factory() as db:
+            await db.execute(
+                text(f"UPDATE model_relearn SET {assignments} WHERE id = :job_id"),
+                {**fields, "job_id": job_id},
+            )
+            await db.commit()
+
+    async def _flush_progress(self, job_id: int, job: Dict) -> None:
+        last_flushed = None
+        while True:
+            await asyncio.sleep(PROGRESS_FLUSH_SECONDS)
+            progress = round(job["progress"], 1)
+            if progress != last_flushed:
+                last_flushed = progress
+                await self._update(job_id, progress=progress, houses_processed=job["houses_processed"])
+
+    async def _run(self, job_id: int, job: Dict) -> None:
+        flusher: Optional[asyncio.Task] = None
+        try:
+            async with self._semaphore:
+                if job["cancel_event"].is_set():
+                    await self._update(job_id, status_relearn="cancelled", finished_at=datetime.now())
+                    return
+
+                await self._update(job_id, status_relearn="running", started_at=datetime.now())
+                print(f"[relearn] Job {job_id} ({job['model_name']}) started")
+
+                def on_progress(finished: int, total: int) -> None:
+                    job["houses_processed"] = finished
+                    job["progress"] = 100.0 * finished / total if total else 100.0
+
+                flusher = asyncio.create_task(self._flush_progress(job_id, job))
+                params = job["params"]
+                stats = await run_fleet_forecast(
+                    house_ids=params.get("house_ids"),
+                    days_forecast=int(params.get("days_forecast", 7)),
+                    workers=RELEARN_WORKERS,
+                    progress_callback=on_progress,
+                    cancel_event=job["cancel_event"],
+                )
+                flusher.cancel()
+
+                await self._update(
+                    job_id,
+                    status_relearn="cancelled" if stats["cancelled"] else "done",
+                    progress=round(job["progress"], 1) if stats["cancelled"] else 100.0,
+                    houses_processed=stats["houses_processed"],
+                    finished_at=datetime.now(),
+                )
+                print(f"[relearn] Job {job_id} finished: {stats}")
+                if not stats["cancelled"] and self._on_forecasts_replaced:
+                    self._on_forecasts_replaced()
+        except Exception as e:
+            print(f"[relearn] Job {job_id} failed: {e}")
+            try:
+                await self._update(
+                    job_id,
+                    status_relearn="failed",
+                    error=str(e)[:1000],
+                    houses_processed=job["houses_processed"],
+                    finished_at=datetime.now(),
+                )
+            except Exception as update_error:
+                print(f"[relearn] Could not mark job {job_id} as failed: {update_error}")
+        finally:
+            if flusher is not None:
+                flusher.cancel()
+            self._jobs.pop(job_id, None)
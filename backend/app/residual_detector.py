@@ -0,0 +1,493 @@
+"""
+Детектор отклонений фактического расхода ХВС от прогноза (water_forecast_all) по всем домам сразу.
+
+Правило incident_hist_2 сравнивает ГВС с ХВС и не видит утечку, которая одинаково поднимает обе
+линии, или счётчик, который начал показывать ноль. Здесь факт сравнивается с прогнозом Prophet:
+раз в RESIDUAL_TICK_SECONDS для каждой новой пятиминутки по всем домам одной операцией numpy
+считаются часовые (12 пятиминуток, как в incident_hist_2) суммы факта и прогноза с интервалом
+yhat_lower..yhat_upper и остаток факт - прогноз.
+
+Пятиминутка дома отклоняется, если часовой факт вышел за интервал прогноза и остаток необычен
+для этого дома: |z| >= RESIDUAL_Z_THRESHOLD, где z считается по остаткам дома за последние
+RESIDUAL_HISTORY_HOURS часов (без уже отклонившихся пятиминуток). Пока истории меньше
+RESIDUAL_MIN_HISTORY_HOURS, достаточно выхода за интервал. Отклонение открывается (type_incdnt 4)
+и закрывается (type_incdnt 5) после RESIDUAL_PERSIST_SLOTS пятиминуток подряд, поэтому
+единичный всплеск инцидента не даёт. Правила house_health считают открытое отклонение Yellow.
+
+Факт приходит из /api/readings (add_readings) в кольцевую матрицу дома x пятиминутки, прогноз на
+ближайшие часы держится матрицей в памяти и перечитывается, когда его окно заканчивается или
+water_forecast_all перезаписали (версии water_forecast_versions, см. app.regional_forecast).
+При старте остатки за историю восстанавливаются из water_consump_hot одним векторным проходом.
+
+Состояние проверки (остатки, серии, открытые отклонения, последняя пятиминутка) меняется до
+записи событий; перед проверкой цикл берёт checkpoint() и, если запись или коммит не удались,
+возвращает его restore(), чтобы следующий тик проверил те же пятиминутки заново.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.districts import district_registry
+from app.house_health import LONG_WINDOW, apply_health_changes, classifier, update_house_health
+from app.incident_detector import (
+    FORECAST_DEVIATION_END,
+    FORECAST_DEVIATION_START,
+    MIN_COLD_1H,
+    WINDOW_SIZE,
+    format_percent,
+)
+from app.metrics import gauge, histogram
+from app.notifications import enqueue_health_changes, notification_sender
+from app.status_snapshot import commit_status_changes
+
+RESIDUAL_TICK_SECONDS = float(os.getenv("RESIDUAL_TICK_SECONDS", "300"))
+RESIDUAL_Z_THRESHOLD = float(os.getenv("RESIDUAL_Z_THRESHOLD", "3.0"))
+RESIDUAL_HISTORY_HOURS = int(os.getenv("RESIDUAL_HISTORY_HOURS", "24"))
+RESIDUAL_MIN_HISTORY_HOURS = int(os.getenv("RESIDUAL_MIN_HISTORY_HOURS", "6"))
+RESIDUAL_PERSIST_SLOTS = int(os.getenv("RESIDUAL_PERSIST_SLOTS", "3"))
+RESIDUAL_FORECAST_HOURS = int(os.getenv("RESIDUAL_FORECAST_HOURS", "6"))
+# Пятиминутка проверяется, когда после неё прошла ещё одна: запоздавшие показания успевают прийти
+RESIDUAL_LAG_SLOTS = int(os.getenv("RESIDUAL_LAG_SLOTS", "1"))
+
+SLOT_MINUTES = 5
+SLOT = timedelta(minutes=SLOT_MINUTES)
+SLOTS_PER_HOUR = 60 // SLOT_MINUTES
+SLOT_EPOCH = datetime(2000, 1, 1)
+HISTORY_SLOTS = RESIDUAL_HISTORY_HOURS * SLOTS_PER_HOUR
+MIN_HISTORY_SLOTS = RESIDUAL_MIN_HISTORY_HOURS * SLOTS_PER_HOUR
+# Кольцо факта: час окна и запас на запоздавшие показания и пропущенные тики
+ACTUAL_SLOTS = 4 * SLOTS_PER_HOUR
+# Часовая сумма факта считается, если в часе есть хотя бы 3/4 показаний (пропуски — средним)
+MIN_READINGS_1H = WINDOW_SIZE * 3 // 4
+
+FORECAST_QUERY = """
+    SELECT id_house, CAST(EXTRACT(EPOCH FROM ds - CAST(:start AS timestamp)) / 300 AS integer) AS slot,
+           yhat, yhat_lower, yhat_upper
+    FROM public.water_forecast_all
+    WHERE ds >= CAST(:start AS timestamp) AND ds < CAST(:end AS timestamp)
+"""
+
+ACTUAL_QUERY = """
+    SELECT id_house, CAST(EXTRACT(EPOCH FROM time_5min - CAST(:start AS timestamp)) / 300 AS integer) AS slot,
+           water_consumption
+    FROM public.water_consump_hot
+    WHERE id_house = ANY(:ids)
+      AND time_5min >= CAST(:start AS timestamp) AND time_5min < CAST(:end AS timestamp)
+      AND water_consumption IS NOT NULL
+"""
+
+# listener(id_house домов, время пятиминутки, факт ХВС за пятиминутку, yhat) — NaN, где значения нет
+SlotListener = Callable[[np.ndarray, datetime, np.ndarray, np.ndarray], None]
+
+tick_duration = histogram(
+    "residual_detector_tick_seconds",
+    "Время проверки пятиминуток всех домов против прогноза",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+
+def slot_of(moment: datetime) -> int:
+    """Номер пятиминутки от SLOT_EPOCH (время без часового пояса, как time_5min)"""
+    return (moment - SLOT_EPOCH) // SLOT
+
+
+def slot_time(slot: int) -> datetime:
+    return SLOT_EPOCH + slot * SLOT
+
+
+def hourly_sums(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(дома, S) -> суммы и число непустых значений по скользящим окнам из WINDOW_SIZE, (дома, S - 11)"""
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+    sums = np.cumsum(np.pad(filled, ((0, 0), (1, 0))), axis=1, dtype=np.float64)
+    counts = np.cumsum(np.pad(present, ((0, 0), (1, 0))), axis=1, dtype=np.int32)
+    return sums[:, WINDOW_SIZE:] - sums[:, :-WINDOW_SIZE], counts[:, WINDOW_SIZE:] - counts[:, :-WINDOW_SIZE]
+
+
+def hourly_residuals(actual: np.ndarray, yhat: np.ndarray, lower: np.ndarray, upper: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Часовые суммы факта и прогноза по выровненным матрицам дома x пятиминутки.
+    Для каждого окна: actual_1h, forecast_1h, остаток, выход за интервал и ok — окно можно оценивать
+    (прогноз на все пятиминутки и не меньше MIN_READINGS_1H показаний).
+    """
+    actual_sum, actual_count = hourly_sums(actual)
+    forecast_1h, forecast_count = hourly_sums(yhat)
+    lower_1h, _ = hourly_sums(lower)
+    upper_1h, _ = hourly_sums(upper)
+    ok = (actual_count >= MIN_READINGS_1H) & (forecast_count == WINDOW_SIZE)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        actual_1h = np.where(ok, actual_sum * WINDOW_SIZE / actual_count, np.nan)
+    residual = actual_1h - forecast_1h
+    return {
+        "ok": ok,
+        "actual_1h": actual_1h,
+        "forecast_1h": forecast_1h,
+        "residual": residual,
+        "breach": ok & ((actual_1h > upper_1h) | (actual_1h < lower_1h)),
+    }
+
+
+def _history_stats(history: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Среднее, стандартное отклонение и число непустых остатков по строкам"""
+    present = ~np.isnan(history)
+    filled = np.where(present, history, 0.0).astype(np.float64)
+    count = present.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = filled.sum(axis=1) / count
+        variance = (filled * filled).sum(axis=1) / count - mean * mean
+    return mean, np.sqrt(np.maximum(variance, 0.0)), count
+
+
+class ResidualDetector:
+    """Факт, прогноз и остатки всех домов в матрицах numpy; строки — дома из прогноза"""
+
+    def __init__(self):
+        self._house_ids = np.empty(0, dtype=np.int64)
+        self._actual = np.empty((0, ACTUAL_SLOTS), dtype=np.float32)
+        self._actual_slots = np.full(ACTUAL_SLOTS, -1, dtype=np.int64)
+        self._residuals = np.empty((0, HISTORY_SLOTS), dtype=np.float32)
+        self._residual_slots = np.full(HISTORY_SLOTS, -1, dtype=np.int64)
+        self._open = np.empty(0, dtype=bool)
+        self._streak = np.empty(0, dtype=np.int16)
+        self._forecast_start = 0
+        self._yhat = np.empty((0, 0), dtype=np.float32)
+        self._lower = self._yhat
+        self._upper = self._yhat
+        self._forecast_version: Optional[int] = None
+        self._evaluated_slot: Optional[int] = None
+        # Не откатывается restore(): повторная проверка пятиминутки не должна второй раз попасть в слушатели
+        self._observed_slot: Optional[int] = None
+        self._last_tick_seconds = 0.0
+        self._slot_listeners: List[SlotListener] = []
+
+    def add_slot_listener(self, listener: SlotListener) -> None:
+        """Регистрирует обработчик, получающий факт и прогноз всех домов по каждой проверенной пятиминутке"""
+        self._slot_listeners.append(listener)
+
+    def _reindex(self, house_ids: np.ndarray) -> None:
+        """Переносит состояние домов на новый набор строк (дома без прогноза выбывают)"""
+        if np.array_equal(house_ids, self._house_ids):
+            return
+        _, old_rows, new_rows = np.intersect1d(self._house_ids, house_ids, return_indices=True)
+        actual = np.full((len(house_ids), ACTUAL_SLOTS), np.nan, dtype=np.float32)
+        residuals = np.full((len(house_ids), HISTORY_SLOTS), np.nan, dtype=np.float32)
+        is_open = np.zeros(len(house_ids), dtype=bool)
+        streak = np.zeros(len(house_ids), dtype=np.int16)
+        actual[new_rows] = self._actual[old_rows]
+        residuals[new_rows] = self._residuals[old_rows]
+        is_open[new_rows] = self._open[old_rows]
+        streak[new_rows] = self._streak[old_rows]
+        self._house_ids, self._actual, self._residuals, self._open, self._streak = (
+            house_ids, actual, residuals, is_open, streak
+        )
+
+    async def _forecast_fingerprint(self, db: AsyncSession) -> int:
+        result = await db.execute(text("SELECT COALESCE(sum(version), 0) FROM water_forecast_versions"))
+        return int(result.scalar())
+
+    async def _load_forecast(self, db: AsyncSession, start_slot: int, end_slot: int, version: int) -> None:
+        result = await db.execute(
+            text(FORECAST_QUERY), {"start": slot_time(start_slot), "end": slot_time(end_slot)}
+        )
+        rows = np.array([tuple(row) for row in result], dtype=np.float64).reshape(-1, 5)
+        house_ids, rows_index = np.unique(rows[:, 0].astype(np.int64), return_inverse=True)
+        slots = rows[:, 1].astype(np.int64)
+        matrices = []
+        for values in rows[:, 2:].T:
+            matrix = np.full((len(house_ids), end_slot - start_slot), np.nan, dtype=np.float32)
+            matrix[rows_index, slots] = values
+            matrices.append(matrix)
+        self._reindex(house_ids)
+        self._yhat, self._lower, self._upper = matrices
+        self._forecast_start = start_slot
+        self._forecast_version = version
+        print(f"[residual] Loaded forecasts for {len(house_ids)} houses, {end_slot - start_slot} slots from {slot_time(start_slot)}")
+
+    async def refresh_forecast(self, db: AsyncSession, now: Optional[datetime] = None) -> bool:
+        """Перечитывает прогноз, если его перезаписали или до конца окна меньше часа"""
+        current = slot_of(now or datetime.now())
+        version = await self._forecast_fingerprint(db)
+        forecast_end = self._forecast_start + self._yhat.shape[1]
+        if version == self._forecast_version and current + SLOTS_PER_HOUR < forecast_end:
+            return False
+        # Окно захватывает час до текущей пятиминутки — он нужен для часовой суммы
+        await self._load_forecast(
+            db, current - 2 * SLOTS_PER_HOUR, current + RESIDUAL_FORECAST_HOURS * SLOTS_PER_HOUR, version
+        )
+        return True
+
+    def add_readings(self, readings: List[Dict]) -> int:
+        """Кладёт показания ХВС в кольцо факта; возвращает число принятых (дома с прогнозом, свежие)"""
+        if not readings or not len(self._house_ids):
+            return 0
+        ids = np.fromiter((r["id_house"] for r in readings), dtype=np.int64, count=len(readings))
+        slots = np.fromiter((slot_of(r["time_5min"]) for r in readings), dtype=np.int64, count=len(readings))
+        values = np.array(
+            [np.nan if r.get("water_consumption") is None else r["water_consumption"] for r in readings],
+            dtype=np.float32,
+        )
+        rows = np.minimum(np.searchsorted(self._house_ids, ids), len(self._house_ids) - 1)
+        newest = max(int(slots.max()), int(self._actual_slots.max()))
+        accepted = (self._house_ids[rows] == ids) & (slots > newest - ACTUAL_SLOTS) & ~np.isnan(values)
+        rows, slots, values = rows[accepted], slots[accepted], values[accepted]
+        columns = slots % ACTUAL_SLOTS
+        for column, slot in set(zip(columns.tolist(), slots.tolist())):
+            if self._actual_slots[column] != slot:
+                # Столбец занят пятиминуткой, которая старше кольца, — освобождаем его
+                self._actual[:, column] = np.nan
+                self._actual_slots[column] = slot
+        self._actual[rows, columns] = values
+        return int(accepted.sum())
+
+    def evaluate(self, slot: int) -> List[Dict]:
+        """Проверяет пятиминутку slot по всем домам; возвращает строки incident_hist_2 (типы 4 и 5)"""
+        window = np.arange(slot - WINDOW_SIZE + 1, slot + 1)
+        forecast_columns = window - self._forecast_start
+        if not len(self._house_ids) or forecast_columns[0] < 0 or forecast_columns[-1] >= self._yhat.shape[1]:
+            return []
+        actual_columns = window % ACTUAL_SLOTS
+        actual = np.where(self._actual_slots[actual_columns] == window, self._actual[:, actual_columns], np.nan)
+        hourly = hourly_residuals(
+            actual,
+            self._yhat[:, forecast_columns],
+            self._lower[:, forecast_columns],
+            self._upper[:, forecast_columns],
+        )
+        ok, residual = hourly["ok"][:, 0], hourly["residual"][:, 0]
+        if self._observed_slot is None or slot > self._observed_slot:
+            self._observed_slot = slot
+            for listener in self._slot_listeners:
+                try:
+                    listener(self._house_ids, slot_time(slot), actual[:, -1], self._yhat[:, forecast_columns[-1]])
+                except Exception as e:
+                    print(f"[residual] Error in slot listener {listener}: {e}")
+
+        history_columns = np.flatnonzero(
+            (self._residual_slots > slot - HISTORY_SLOTS) & (self._residual_slots < slot)
+        )
+        mean, std, count = _history_stats(self._residuals[:, history_columns])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            z = np.where((count >= MIN_HISTORY_SLOTS) & (std > 1e-6), (residual - mean) / std, np.nan)
+        anomalous = hourly["breach"][:, 0] & (np.isnan(z) | (np.abs(z) >= RESIDUAL_Z_THRESHOLD))
+
+        # В историю идут только обычные остатки: долгая утечка не должна становиться нормой
+        column = slot % HISTORY_SLOTS
+        self._residual_slots[column] = slot
+        self._residuals[:, column] = np.where(ok & ~anomalous, residual, np.nan)
+
+        # Состояние меняется после RESIDUAL_PERSIST_SLOTS несогласных пятиминуток подряд;
+        # пятиминутки без данных серию не прерывают
+        disagree = ok & (anomalous != self._open)
+        self._streak[disagree] += 1
+        self._streak[ok & ~disagree] = 0
+        flipped = np.flatnonzero(self._streak >= RESIDUAL_PERSIST_SLOTS)
+        if not len(flipped):
+            return []
+        self._open[flipped] = ~self._open[flipped]
+        self._streak[flipped] = 0
+
+        forecast_1h = hourly["forecast_1h"][flipped, 0]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            relative = np.where(forecast_1h > MIN_COLD_1H, residual[flipped] / forecast_1h, 0.0)
+        moment = slot_time(slot)
+        incidents = []
+        for row, diffr_prcnt_1h, z_value in zip(flipped.tolist(), relative.tolist(), z[flipped].tolist()):
+            if self._open[row]:
+                type_incdnt = FORECAST_DEVIATION_START
+                comment = "Отклонение ХВС от прогноза за 1 час на" + format_percent(diffr_prcnt_1h)
+                if not np.isnan(z_value):
+                    comment += f" (z = {z_value:.1f})"
+            else:
+                type_incdnt = FORECAST_DEVIATION_END
+                comment = "Расход ХВС за 1 час вернулся в интервал прогноза"
+            incidents.append({
+                "id_house": int(self._house_ids[row]),
+                "time_5min": moment,
+                "diffr_prcnt_1h": diffr_prcnt_1h,
+                "type_incdnt": type_incdnt,
+                "comment_incdnt": comment,
+            })
+        return incidents
+
+    def evaluate_until(self, slot: int) -> List[Dict]:
+        """Проверяет все пятиминутки после последней проверенной до slot включительно"""
+        if self._evaluated_slot is None:
+            self._evaluated_slot = slot - 1
+        # Старше кольца факта проверять нечего — после долгой паузы начинаем с доступных данных
+        first = max(self._evaluated_slot + 1, slot - ACTUAL_SLOTS + WINDOW_SIZE)
+        started = time.perf_counter()
+        incidents = []
+        for current in range(first, slot + 1):
+            incidents.extend(self.evaluate(current))
+        self._evaluated_slot = max(self._evaluated_slot, slot)
+        if slot >= first:
+            self._last_tick_seconds = time.perf_counter() - started
+            tick_duration.observe(self._last_tick_seconds)
+        return incidents
+
+    def checkpoint(self) -> Tuple:
+        """Копия состояния, которое меняет evaluate_until(); факт и прогноз в неё не входят"""
+        return (
+            self._house_ids,
+            self._residuals.copy(),
+            self._residual_slots.copy(),
+            self._open.copy(),
+            self._streak.copy(),
+            self._evaluated_slot,
+        )
+
+    def restore(self, state: Tuple) -> None:
+        """Возвращает состояние checkpoint(), если события проверки не закоммитились"""
+        house_ids, residuals, residual_slots, is_open, streak, evaluated_slot = state
+        if not np.array_equal(house_ids, self._house_ids):
+            # Прогноз успели перечитать с другим набором домов — строки уже не совпадают
+            return
+        self._residuals, self._residual_slots, self._open, self._streak = residuals, residual_slots, is_open, streak
+        self._evaluated_slot = evaluated_slot
+
+    async def warm_up(self, db: AsyncSession, now: Optional[datetime] = None) -> int:
+        """
+        Загружает прогноз и факт за RESIDUAL_HISTORY_HOURS и одним проходом восстанавливает историю
+        остатков; открытые отклонения берутся из incident_hist_2. Событий при этом не пишется.
+        """
+        now = now or datetime.now()
+        current = slot_of(now) - RESIDUAL_LAG_SLOTS
+        # Ровно HISTORY_SLOTS часовых окон, последнее заканчивается на current
+        start = current - HISTORY_SLOTS - WINDOW_SIZE + 2
+        end = current + RESIDUAL_FORECAST_HOURS * SLOTS_PER_HOUR
+        await self._load_forecast(db, start, end, await self._forecast_fingerprint(db))
+        houses = len(self._house_ids)
+        self._actual[:] = np.nan
+        self._actual_slots[:] = -1
+        self._residuals[:] = np.nan
+        self._residual_slots[:] = -1
+        self._open[:] = False
+        self._streak[:] = 0
+        self._evaluated_slot = current
+        if not houses:
+            return 0
+
+        result = await db.execute(
+            text(ACTUAL_QUERY),
+            {"ids": self._house_ids.tolist(), "start": slot_time(start), "end": slot_time(current + 1)},
+        )
+        rows = np.array([tuple(row) for row in result], dtype=np.float64).reshape(-1, 3)
+        span = current + 1 - start
+        actual = np.full((houses, span), np.nan, dtype=np.float32)
+        actual[np.searchsorted(self._house_ids, rows[:, 0].astype(np.int64)), rows[:, 1].astype(np.int64)] = rows[:, 2]
+
+        hourly = hourly_residuals(actual, self._yhat[:, :span], self._lower[:, :span], self._upper[:, :span])
+        # Последовательный z для истории не считаем: в неё не попадают окна вне интервала прогноза
+        history = np.where(hourly["ok"] & ~hourly["breach"], hourly["residual"], np.nan)
+        history_slots = np.arange(start + WINDOW_SIZE - 1, current + 1)
+        self._residuals[:, history_slots % HISTORY_SLOTS] = history
+        self._residual_slots[history_slots % HISTORY_SLOTS] = history_slots
+        actual_slots = np.arange(max(start, current - ACTUAL_SLOTS + 1), current + 1)
+        self._actual[:, actual_slots % ACTUAL_SLOTS] = actual[:, actual_slots - start]
+        self._actual_slots[actual_slots % ACTUAL_SLOTS] = actual_slots
+
+        result = await db.execute(
+            text("""
+                SELECT DISTINCT ON (id_house) id_house, type_incdnt
+                FROM public.incident_hist_2
+                WHERE type_incdnt IN (:start_type, :end_type) AND time_5min >= :since
+                ORDER BY id_house, time_5min DESC
+            """),
+            {"start_type": FORECAST_DEVIATION_START, "end_type": FORECAST_DEVIATION_END, "since": now - LONG_WINDOW},
+        )
+        opened = np.array(
+            [row.id_house for row in result if row.type_incdnt == FORECAST_DEVIATION_START], dtype=np.int64
+        )
+        self._open[:] = np.isin(self._house_ids, opened)
+        print(
+            f"[residual] Warmed up {houses} houses from {len(rows)} readings, "
+            f"{int(self._open.sum())} open forecast deviations"
+        )
+        return houses
+
+    def stats(self) -> Dict:
+        return {
+            "houses": int(len(self._house_ids)),
+            "open_deviations": int(self._open.sum()),
+            "evaluated_until": slot_time(self._evaluated_slot).isoformat() if self._evaluated_slot is not None else None,
+            "forecast_version": self._forecast_version,
+            "forecast_start": slot_time(self._forecast_start).isoformat() if self._yhat.size else None,
+            "forecast_slots": int(self._yhat.shape[1]),
+            "last_tick_ms": round(self._last_tick_seconds * 1000, 2),
+            "bytes": int(
+                self._actual.nbytes + self._residuals.nbytes + self._yhat.nbytes + self._lower.nbytes + self._upper.nbytes
+            ),
+        }
+
+
+residual_detector = ResidualDetector()
+
+gauge(
+    "residual_detector_open_deviations",
+    "Домов с открытым отклонением ХВС от прогноза",
+    lambda: [((), int(residual_detector._open.sum()))],
+)
+
+
+async def record_deviations(db: AsyncSession, incidents: List[Dict]) -> None:
+    """Записывает события детектора в incident_hist_2 одним запросом (коммит — на вызывающей стороне)"""
+    await db.execute(
+        text("""
+            INSERT INTO public.incident_hist_2
+                (region_id, id_house, time_5min, diffr_prcnt_1h, type_incdnt, comment_incdnt)
+            SELECT *
+            FROM unnest(
+                CAST(:region_ids AS text[]), CAST(:house_ids AS bigint[]), CAST(:times AS timestamp[]),
+                CAST(:diffrs AS double precision[]), CAST(:types AS integer[]), CAST(:comments AS text[])
+            )
+        """),
+        {
+            "region_ids": [district_registry.region_of(incident["id_house"]) for incident in incidents],
+            "house_ids": [incident["id_house"] for incident in incidents],
+            "times": [incident["time_5min"] for incident in incidents],
+            "diffrs": [incident["diffr_prcnt_1h"] for incident in incidents],
+            "types": [incident["type_incdnt"] for incident in incidents],
+            "comments": [incident["comment_incdnt"] for incident in incidents],
+        },
+    )
+
+
+async def run_residual_detector(session_factory, interval: float = RESIDUAL_TICK_SECONDS) -> None:
+    """Фоновый цикл: проверяет новые пятиминутки, пишет отклонения и пересчитывает house_health"""
+    while True:
+        await asyncio.sleep(interval)
+        checkpoint = None
+        incidents: List[Dict] = []
+        changes = []
+        try:
+            async with session_factory() as db:
+                await residual_detector.refresh_forecast(db)
+                checkpoint = residual_detector.checkpoint()
+                incidents = residual_detector.evaluate_until(slot_of(datetime.now()) - RESIDUAL_LAG_SLOTS)
+                if not incidents:
+                    continue
+                await record_deviations(db, incidents)
+                classifier.add_events(incidents)
+                changes = await update_house_health(db)
+                notify = await enqueue_health_changes(db, changes)
+                await commit_status_changes(db)
+                apply_health_changes(changes)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # События не записаны: пятиминутки будут проверены заново на следующем тике
+            if checkpoint is not None:
+                residual_detector.restore(checkpoint)
+            classifier.remove_events(incidents)
+            classifier.discard(changes)
+            print(f"[residual] Error checking forecast residuals: {e}")
+            continue
+        if notify:
+            notification_sender.wake()
+        print(f"[residual] {len(incidents)} forecast deviation events, house_health changed for {len(changes)} houses")
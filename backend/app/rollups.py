@@ -0,0 +1,374 @@
+"""
+Инкрементальные агрегаты расхода: часы, сутки, недели.
+
+Раньше water_consump_hot_1h, water_diffr_coldhot_1h и water_diffr_coldhot строились
+CREATE TABLE ... AS полным проходом по всем 5-минутным данным. Теперь пересчитываются
+только затронутые часы:
+  - триггеры на water_consump_hot (INSERT/UPDATE/DELETE, по оператору, с transition-таблицами)
+    пишут (id_house, час) изменённых строк в rollup_dirty_hours — так учитываются и опоздавшие
+    показания за прошлые часы, и исправления, от кого бы они ни пришли (API, COPY, SQL);
+  - rollup_watermark хранит для каждого дома последний агрегированный час; при старте
+    часы новее водяного знака досчитываются (на случай загрузки с отключёнными триггерами);
+  - RollupEngine забирает пачку грязных часов (FOR UPDATE SKIP LOCKED), в одной транзакции
+    заменяет эти часы в часовых таблицах и 5-минутной water_diffr_coldhot, затем затронутые
+    сутки и недели в water_consump_hot_1d / water_consump_hot_1w.
+Стоимость пропорциональна объёму новых данных, а не всей истории.
+"""
+import asyncio
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from app.timeseries_store import timeseries_store
+
+ROLLUP_INTERVAL_SECONDS = float(os.getenv("ROLLUP_INTERVAL_SECONDS", "60"))
+ROLLUP_BATCH_HOURS = int(os.getenv("ROLLUP_BATCH_HOURS", "5000"))
+
+# Агрегаты крупнее часа: разрешение -> (таблица, столбец времени)
+ROLLUP_TABLES = {
+    "1d": ("water_consump_hot_1d", "time_1day"),
+    "1w": ("water_consump_hot_1w", "time_1week"),
+}
+
+# Пороги те же, что в исходных CREATE TABLE ... AS
+DIFFR_5MIN_MIN_COLD = 0.01
+DIFFR_1H_MIN_COLD = 0.05
+
+SCHEMA_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS rollup_dirty_hours (
+        id_house BIGINT NOT NULL,
+        time_1hour TIMESTAMP NOT NULL,
+        PRIMARY KEY (id_house, time_1hour)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_watermark (
+        id_house BIGINT PRIMARY KEY,
+        rolled_up_to TIMESTAMP NOT NULL,
+        updated_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS water_consump_hot_1d (
+        id_house BIGINT NOT NULL,
+        time_1day TIMESTAMP NOT NULL,
+        water_cold DOUBLE PRECISION,
+        water_hot DOUBLE PRECISION,
+        PRIMARY KEY (id_house, time_1day)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS water_consump_hot_1w (
+        id_house BIGINT NOT NULL,
+        time_1week TIMESTAMP NOT NULL,
+        water_cold DOUBLE PRECISION,
+        water_hot DOUBLE PRECISION,
+        PRIMARY KEY (id_house, time_1week)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_water_consump_hot_1h_house_time ON water_consump_hot_1h (id_house, time_1hour)",
+    "CREATE INDEX IF NOT EXISTS ix_water_diffr_coldhot_1h_house_time ON water_diffr_coldhot_1h (id_house, time_1hour)",
+    "CREATE INDEX IF NOT EXISTS ix_water_diffr_coldhot_house_time ON water_diffr_coldhot (id_house, time_5min)",
+    """
+    CREATE OR REPLACE FUNCTION rollup_mark_dirty_hours() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO rollup_dirty_hours (id_house, time_1hour)
+        SELECT DISTINCT id_house, date_trunc('hour', time_5min) FROM changed_rows
+        ON CONFLICT DO NOTHING;
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION rollup_mark_dirty_hours_update() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO rollup_dirty_hours (id_house, time_1hour)
+        SELECT id_house, date_trunc('hour', time_5min) FROM old_rows
+        UNION
+        SELECT id_house, date_trunc('hour', time_5min) FROM new_rows
+        ON CONFLICT DO NOTHING;
+        RETURN NULL;
+    END
+    $$
+    """,
+    "DROP TRIGGER IF EXISTS trg_rollup_insert ON water_consump_hot",
+    """
+    CREATE TRIGGER trg_rollup_insert AFTER INSERT ON water_consump_hot
+        REFERENCING NEW TABLE AS changed_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION rollup_mark_dirty_hours()
+    """,
+    "DROP TRIGGER IF EXISTS trg_rollup_delete ON water_consump_hot",
+    """
+    CREATE TRIGGER trg_rollup_delete AFTER DELETE ON water_consump_hot
+        REFERENCING OLD TABLE AS changed_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION rollup_mark_dirty_hours()
+    """,
+    "DROP TRIGGER IF EXISTS trg_rollup_update ON water_consump_hot",
+    """
+    CREATE TRIGGER trg_rollup_update AFTER UPDATE ON water_consump_hot
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION rollup_mark_dirty_hours_update()
+    """,
+]
+
+# Пачка грязных часов как набор ключей
+DIRTY_KEYS = "unnest(CAST(:ids AS bigint[]), CAST(:hours AS timestamp[])) AS k(id_house, time_1hour)"
+
+ROLLUP_STATEMENTS = [
+    # 5-минутная разница ХВС/ГВС за затронутые часы
+    f"""
+    DELETE FROM water_diffr_coldhot t USING {DIRTY_KEYS}
+    WHERE t.id_house = k.id_house
+      AND t.time_5min >= k.time_1hour AND t.time_5min < k.time_1hour + interval '1 hour'
+    """,
+    f"""
+    INSERT INTO water_diffr_coldhot (id_house, time_5min, diffr_cldht, diffr_ratio)
+    SELECT c.id_house, c.time_5min,
+           c.water_consumption - c.water_hot,
+           CASE WHEN c.water_consumption > {DIFFR_5MIN_MIN_COLD}
+                THEN (c.water_consumption - c.water_hot) / c.water_consumption
+                ELSE 0 END
+    FROM {DIRTY_KEYS}
+    JOIN water_consump_hot c ON c.id_house = k.id_house
+     AND c.time_5min >= k.time_1hour AND c.time_5min < k.time_1hour + interval '1 hour'
+    """,
+    # Часовые суммы
+    f"""
+    DELETE FROM water_consump_hot_1h t USING {DIRTY_KEYS}
+    WHERE t.id_house = k.id_house AND t.time_1hour = k.time_1hour
+    """,
+    f"""
+    INSERT INTO water_consump_hot_1h (id_house, time_1hour, water_cold, water_hot)
+    SELECT k.id_house, k.time_1hour, SUM(c.water_consumption), SUM(c.water_hot)
+    FROM {DIRTY_KEYS}
+    JOIN water_consump_hot c ON c.id_house = k.id_house
+     AND c.time_5min >= k.time_1hour AND c.time_5min < k.time_1hour + interval '1 hour'
+    GROUP BY k.id_house, k.time_1hour
+    """,
+    f"""
+    DELETE FROM water_diffr_coldhot_1h t USING {DIRTY_KEYS}
+    WHERE t.id_house = k.id_house AND t.time_1hour = k.time_1hour
+    """,
+    f"""
+    INSERT INTO water_diffr_coldhot_1h (id_house, time_1hour, diffr_cldht, diffr_ratio)
+    SELECT h.id_house, h.time_1hour,
+           h.water_cold - h.water_hot,
+           CASE WHEN h.water_cold > {DIFFR_1H_MIN_COLD}
+                THEN (h.water_cold - h.water_hot) / h.water_cold
+                ELSE 0 END
+    FROM {DIRTY_KEYS}
+    JOIN water_consump_hot_1h h ON h.id_house = k.id_house AND h.time_1hour = k.time_1hour
+    """,
+    # Сутки — из часовых сумм затронутых суток
+    f"""
+    DELETE FROM water_consump_hot_1d t
+    USING (SELECT DISTINCT id_house, date_trunc('day', time_1hour) AS time_1day FROM {DIRTY_KEYS}) d
+    WHERE t.id_house = d.id_house AND t.time_1day = d.time_1day
+    """,
+    f"""
+    INSERT INTO water_consump_hot_1d (id_house, time_1day, water_cold, water_hot)
+    SELECT d.id_house, d.time_1day, SUM(h.water_cold), SUM(h.water_hot)
+    FROM (SELECT DISTINCT id_house, date_trunc('day', time_1hour) AS time_1day FROM {DIRTY_KEYS}) d
+    JOIN water_consump_hot_1h h ON h.id_house = d.id_house
+     AND h.time_1hour >= d.time_1day AND h.time_1hour < d.time_1day + interval '1 day'
+    GROUP BY d.id_house, d.time_1day
+    """,
+    # Недели (с понедельника) — из суточных сумм затронутых недель
+    f"""
+    DELETE FROM water_consump_hot_1w t
+    USING (SELECT DISTINCT id_house, date_trunc('week', time_1hour) AS time_1week FROM {DIRTY_KEYS}) w
+    WHERE t.id_house = w.id_house AND t.time_1week = w.time_1week
+    """,
+    f"""
+    INSERT INTO water_consump_hot_1w (id_house, time_1week, water_cold, water_hot)
+    SELECT w.id_house, w.time_1week, SUM(d.water_cold), SUM(d.water_hot)
+    FROM (SELECT DISTINCT id_house, date_trunc('week', time_1hour) AS time_1week FROM {DIRTY_KEYS}) w
+    JOIN water_consump_hot_1d d ON d.id_house = w.id_house
+     AND d.time_1day >= w.time_1week AND d.time_1day < w.time_1week + interval '7 days'
+    GROUP BY w.id_house, w.time_1week
+    """,
+    # Водяной знак — последний агрегированный час дома
+    f"""
+    INSERT INTO rollup_watermark (id_house, rolled_up_to, updated_at)
+    SELECT id_house, max(time_1hour), now() FROM {DIRTY_KEYS} GROUP BY id_house
+    ON CONFLICT (id_house) DO UPDATE
+        SET rolled_up_to = GREATEST(rollup_watermark.rolled_up_to, EXCLUDED.rolled_up_to),
+            updated_at = now()
+    """,
+]
+
+
+class RollupEngine:
+    """Фоновый пересчёт агрегатов по журналу грязных часов"""
+
+    def __init__(self, session_factory):
+        self._session_factory = session_factory
+        self._wakeup = asyncio.Event()
+        self.hours_rolled_up = 0
+        self.batches = 0
+        self.last_run_at: Optional[datetime] = None
+        self.last_batch_seconds: Optional[float] = None
+
+    async def ensure_schema(self) -> None:
+        """Таблицы, триггеры и первичное заполнение суточных/недельных агрегатов и водяных знаков"""
+        async with self._session_factory() as db:
+            watermark_exists = (await db.execute(text("SELECT to_regclass('public.rollup_watermark')"))).scalar()
+            daily_exists = (await db.execute(text("SELECT to_regclass('public.water_consump_hot_1d')"))).scalar()
+            for statement in SCHEMA_STATEMENTS:
+                await db.execute(text(statement))
+            if not watermark_exists:
+                # Существующие часовые таблицы считаем актуальными на момент установки
+                await db.execute(text("""
+                    INSERT INTO rollup_watermark (id_house, rolled_up_to)
+                    SELECT id_house, max(time_1hour) FROM water_consump_hot_1h GROUP BY id_house
+                """))
+            if not daily_exists:
+                await db.execute(text("""
+                    INSERT INTO water_consump_hot_1d (id_house, time_1day, water_cold, water_hot)
+                    SELECT id_house, date_trunc('day', time_1hour), SUM(water_cold), SUM(water_hot)
+                    FROM water_consump_hot_1h
+                    GROUP BY id_house, date_trunc('day', time_1hour)
+                """))
+                await db.execute(text("""
+                    INSERT INTO water_consump_hot_1w (id_house, time_1week, water_cold, water_hot)
+                    SELECT id_house, date_trunc('week', time_1day), SUM(water_cold), SUM(water_hot)
+                    FROM water_consump_hot_1d
+                    GROUP BY id_house, date_trunc('week', time_1day)
+                """))
+            await db.commit()
+
+    async def catch_up(self) -> int:
+        """
+        Помечает грязными часы новее водяного знака каждого дома (по индексу id_house, time_5min:
+        читаются только новые строки). Час водяного знака перечитывается — он мог быть неполным.
+        """
+        async with self._session_factory() as db:
+            result = await db.execute(text("""
+                INSERT INTO rollup_dirty_hours (id_house, time_1hour)
+                SELECT DISTINCT h.id_house, date_trunc('hour', c.time_5min)
+                FROM lublino_houses_id h
+                LEFT JOIN rollup_watermark w ON w.id_house = h.id_house
+                JOIN LATERAL (
+                    SELECT time_5min FROM water_consump_hot c
+                    WHERE c.id_house = h.id_house
+                      AND c.time_5min >= COALESCE(w.rolled_up_to, CAST('-infinity' AS timestamp))
+                ) c ON true
+                ON CONFLICT DO NOTHING
+            """))
+            await db.commit()
+            return result.rowcount or 0
+
+    async def mark_dirty(self, keys: List[Tuple[int, datetime]]) -> None:
+        """Явно помечает часы (id_house, любой момент внутри часа) для пересчёта"""
+        if not keys:
+            return
+        async with self._session_factory() as db:
+            await db.execute(
+                text("""
+                    INSERT INTO rollup_dirty_hours (id_house, time_1hour)
+                    SELECT DISTINCT id_house, date_trunc('hour', t)
+                    FROM unnest(CAST(:ids AS bigint[]), CAST(:times AS timestamp[])) AS k(id_house, t)
+                    ON CONFLICT DO NOTHING
+                """),
+                {"ids": [int(id_house) for id_house, _ in keys], "times": [t for _, t in keys]},
+            )
+            await db.commit()
+        self.wake()
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    async def run_once(self) -> int:
+        """Пересчитывает все накопившиеся грязные часы пачками; возвращает число часов"""
+        total = 0
+        while True:
+            processed = await self._process_batch()
+            total += processed
+            if processed < ROLLUP_BATCH_HOURS:
+                break
+        self.last_run_at = datetime.now()
+        return total
+
+    async def run(self, interval: float = ROLLUP_INTERVAL_SECONDS) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                processed = await self.run_once()
+                if processed:
+                    print(f"[rollup] Rolled up {processed} house-hours")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[rollup] Error rolling up consumption aggregates: {e}")
+
+    async def _process_batch(self) -> int:
+        started = asyncio.get_running_loop().time()
+        async with self._session_factory() as db:
+            # Удаление из журнала откатится вместе с пересчётом, если транзакция упадёт
+            result = await db.execute(
+                text("""
+                    DELETE FROM rollup_dirty_hours d
+                    USING (
+                        SELECT id_house, time_1hour FROM rollup_dirty_hours
+                        ORDER BY time_1hour
+                        LIMIT :batch
+                        FOR UPDATE SKIP LOCKED
+                    ) c
+                    WHERE d.id_house = c.id_house AND d.time_1hour = c.time_1hour
+                    RETURNING d.id_house, d.time_1hour
+                """),
+                {"batch": ROLLUP_BATCH_HOURS},
+            )
+            keys = result.fetchall()
+            if not keys:
+                return 0
+            params = {"ids": [row.id_house for row in keys], "hours": [row.time_1hour for row in keys]}
+            for statement in ROLLUP_STATEMENTS:
+                await db.execute(text(statement), params)
+
+            hourly = await db.execute(
+                text(f"""
+                    SELECT h.id_house, h.time_1hour, h.water_cold, h.water_hot, d.diffr_ratio
+                    FROM {DIRTY_KEYS}
+                    JOIN water_consump_hot_1h h ON h.id_house = k.id_house AND h.time_1hour = k.time_1hour
+                    LEFT JOIN water_diffr_coldhot_1h d ON d.id_house = k.id_house AND d.time_1hour = k.time_1hour
+                    ORDER BY h.time_1hour
+                """),
+                params,
+            )
+            hourly_rows = hourly.fetchall()
+            await db.commit()
+
+        # Новые и пересчитанные часы сразу видны в хранилище рядов в памяти
+        timeseries_store.upsert(
+            "consumption_1h", ((r.id_house, r.time_1hour, r.water_cold, r.water_hot) for r in hourly_rows)
+        )
+        timeseries_store.upsert("diffr_1h", ((r.id_house, r.time_1hour, r.diffr_ratio) for r in hourly_rows))
+
+        self.batches += 1
+        self.hours_rolled_up += len(keys)
+        self.last_batch_seconds = round(asyncio.get_running_loop().time() - started, 3)
+        return len(keys)
+
+    async def stats(self) -> Dict:
+        async with self._session_factory() as db:
+            pending = (await db.execute(text("SELECT count(*) FROM rollup_dirty_hours"))).scalar_one()
+            lag = (await db.execute(text("""
+                SELECT min(rolled_up_to) AS oldest, max(rolled_up_to) AS newest FROM rollup_watermark
+            """))).one()
+        return {
+            "pending_hours": pending,
+            "hours_rolled_up": self.hours_rolled_up,
+            "batches": self.batches,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_batch_seconds": self.last_batch_seconds,
+            "watermark_oldest": lag.oldest.isoformat() if lag.oldest else None,
+            "watermark_newest": lag.newest.isoformat() if lag.newest else None,
+        }
@@ -17,6 +17,18 @@ class DashboardMetrics(BaseModel):
 	period_days: int
 
 
+class RegionInfo(BaseModel):
+	region_id: str
+	name: str
+	registry_district: str
+
+
+class RegionCreate(BaseModel):
+	region_id: str
+	name: str
+	registry_district: str  # подстрока столбца DISTRICT реестра адресов (lublino_houses)
+
+
 class HouseListItem(BaseModel):
 	house_id: str
 	address: str
@@ -27,6 +39,21 @@ class HouseListItem(BaseModel):
 	unom: Optional[str] = None
 
 
+class HouseListPage(BaseModel):
+	items: List[HouseListItem]
+	next_cursor: Optional[str] = None
+
+
+class HouseOption(BaseModel):
+	id_house: int
+	unom: Optional[int] = None
+	simple_address: Optional[str] = None
+
+
+class HouseOptionsPage(BaseModel):
+	items: List[HouseOption]
+	next_cursor: Optional[str] = None
+
 
 class HouseDetail(BaseModel):
 	house_id: str
@@ -45,6 +72,7 @@ class HouseDetail(BaseModel):
 
 class LLMQuestionRequest(BaseModel):
     question: str
+    region_id: str = "lublino"  # для вопросов по району
 
 class StatusHealthResponse(BaseModel):
     id: int
@@ -74,4 +102,25 @@ class HouseWithStatusResponse(BaseModel):
     house_health: Optional[str]
     simple_address: Optional[str]
     address: Optional[str]
-    district: Optional[str]
\ No newline at end of file
+    district: Optional[str]
+
+class WaterReading(BaseModel):
+    id_house: int
+    time_5min: datetime
+    water_consumption: Optional[float] = None
+    water_hot: Optional[float] = None
+
+
+class WaterReadingsBatch(BaseModel):
+    readings: List[WaterReading]
+
+
+class HouseStatusUpdateItem(BaseModel):
+    house_id: int
+    # Не переданное поле не меняется (как в POST /api/houses/{house_id}/status)
+    incident_status: Optional[str] = None
+    house_health: Optional[HouseHealthStatus] = None
+
+
+class HouseStatusBulkUpdate(BaseModel):
+    items: List[HouseStatusUpdateItem]
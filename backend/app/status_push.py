@@ -0,0 +1,250 @@
+"""
+Push-канал изменений статусов домов (house_health, status_incident) вместо опроса дашборда.
+
+Хаб подписан на status_snapshot.add_status_change_listener и видит всё, что проходит через
+apply_status_change: create_incident_v2, PUT статуса дома и фоновый классификатор house_health.
+Клиент подписывается на район и сначала получает snapshot — статусы всех домов района и счётчики
+дашборда, затем changes — только изменившиеся дома с новыми счётчиками. У каждого сообщения
+растущий seq района: изменения с seq не больше, чем у snapshot, в нём уже учтены.
+
+Статусы района держатся в памяти, пока у района есть подписчики, поэтому snapshot для нового
+клиента отдаётся без запроса к БД. Изменения за один проход цикла событий (например, пачка от
+классификатора) собираются в одно сообщение, которое сериализуется один раз для всех подписчиков.
+Пока ничего не меняется, подписчик только ждёт своё asyncio.Event; раз в
+STATUS_PUSH_HEARTBEAT_SECONDS уходит heartbeat, чтобы прокси не закрывали соединение.
+
+Отстающий клиент не тормозит остальных: если у него накопилось больше STATUS_PUSH_QUEUE_SIZE
+сообщений, очередь сбрасывается и вместо пропущенных изменений он получает свежий snapshot.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Optional, Set
+
+from sqlalchemy import select
+
+from app.metrics import counter, gauge
+from app.models import StatusHealth
+from app.status_snapshot import (
+    SNAPSHOT_MAX_AGE_SECONDS,
+    UNCHANGED,
+    add_status_change_listener,
+    cached_status_snapshot,
+    get_status_snapshot,
+)
+
+STATUS_PUSH_QUEUE_SIZE = int(os.getenv("STATUS_PUSH_QUEUE_SIZE", "256"))
+STATUS_PUSH_HEARTBEAT_SECONDS = float(os.getenv("STATUS_PUSH_HEARTBEAT_SECONDS", "25"))
+
+STATUS_FIELDS = ("house_health", "status_incident")
+
+resyncs = counter("status_push_resyncs_total", "Snapshot вместо пропущенных изменений из-за переполнения очереди")
+
+
+class PushMessage:
+    """Сообщение, сериализованное один раз для всех подписчиков"""
+
+    __slots__ = ("event", "seq", "data")
+
+    def __init__(self, event: str, seq: int, data: str):
+        self.event = event
+        self.seq = seq
+        self.data = data
+
+    def sse(self) -> str:
+        return f"event: {self.event}\nid: {self.seq}\ndata: {self.data}\n\n"
+
+
+HEARTBEAT = PushMessage("heartbeat", 0, json.dumps({"type": "heartbeat"}))
+
+
+class Subscriber:
+    def __init__(self, region_id: str):
+        self.region_id = region_id
+        self.messages: Deque[PushMessage] = deque()
+        self.wakeup = asyncio.Event()
+        # Первым сообщением (и после переполнения очереди) уходит snapshot
+        self.needs_snapshot = True
+
+    def push(self, message: PushMessage) -> bool:
+        """Ставит сообщение в очередь; False — очередь переполнена и клиент получит snapshot"""
+        if self.needs_snapshot:
+            return True
+        overflow = len(self.messages) >= STATUS_PUSH_QUEUE_SIZE
+        if overflow:
+            self.messages.clear()
+            self.needs_snapshot = True
+        else:
+            self.messages.append(message)
+        self.wakeup.set()
+        return not overflow
+
+
+class _RegionState:
+    def __init__(self):
+        self.subscribers: Set[Subscriber] = set()
+        # id_house -> {"house_health": ..., "status_incident": ...}; None — ещё не загружено
+        self.houses: Optional[Dict[int, Dict]] = None
+        # Изменения, ещё не разосланные подписчикам: id_house -> изменённые поля
+        self.pending: Dict[int, Dict] = {}
+        self.seq = 0
+        self.loaded_at = 0.0
+        self.snapshot: Optional[PushMessage] = None
+        self.lock = asyncio.Lock()
+
+
+class StatusPushHub:
+    def __init__(self):
+        self._regions: Dict[str, _RegionState] = {}
+        self._flush_scheduled = False
+
+    def on_status_change(
+        self, region_id: str, id_house: Optional[int], new_health: Optional[str], new_status: Optional[str]
+    ) -> None:
+        """
+        Слушатель status_snapshot. UNCHANGED в new_health/new_status — поле не менялось
+        (классификатор передаёт только house_health), None — поле сброшено в NULL.
+        Районы без подписчиков не стоят ничего.
+        """
+        state = self._regions.get(region_id)
+        if state is None or id_house is None:
+            return
+        fields = state.pending.setdefault(id_house, {})
+        if new_health is not UNCHANGED:
+            fields["house_health"] = new_health
+        if new_status is not UNCHANGED:
+            fields["status_incident"] = new_status
+        if self._flush_scheduled:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        self._flush_scheduled = True
+        loop.call_soon(self.flush)
+
+    def flush(self) -> None:
+        """Применяет накопленные изменения к статусам районов и рассылает их одним сообщением на район"""
+        self._flush_scheduled = False
+        for region_id, state in self._regions.items():
+            if state.pending and state.houses is not None:
+                self._apply_pending(region_id, state)
+
+    def _apply_pending(self, region_id: str, state: _RegionState) -> None:
+        pending, state.pending = state.pending, {}
+        changes = []
+        for id_house, fields in pending.items():
+            current = state.houses.setdefault(id_house, dict.fromkeys(STATUS_FIELDS))
+            changed = {name: value for name, value in fields.items() if current[name] != value}
+            if changed:
+                current.update(changed)
+                changes.append({"id_house": id_house, **current})
+        if not changes:
+            return
+        state.seq += 1
+        state.snapshot = None
+        message = self._message("changes", region_id, state.seq, {"changes": changes})
+        for subscriber in state.subscribers:
+            if not subscriber.push(message):
+                resyncs.inc()
+
+    def _message(self, event: str, region_id: str, seq: int, body: Dict) -> PushMessage:
+        payload = {"type": event, "region_id": region_id, "seq": seq, **body}
+        snapshot = cached_status_snapshot(region_id)
+        if snapshot is not None:
+            payload["counts"] = dict(snapshot["counts"])
+            payload["total_houses"] = snapshot["total_houses"]
+        return PushMessage(event, seq, json.dumps(payload, ensure_ascii=False))
+
+    async def _load(self, region_id: str, state: _RegionState, session_factory) -> None:
+        """Читает статусы района из БД; при перечитывании расхождения с памятью расходятся как changes"""
+        async with state.lock:
+            if state.houses is not None and time.monotonic() - state.loaded_at < SNAPSHOT_MAX_AGE_SECONDS:
+                return
+            async with session_factory() as db:
+                # Счётчики нужны в каждом сообщении — загружаем снимок, если его ещё нет
+                await get_status_snapshot(db, region_id)
+                result = await db.execute(
+                    select(StatusHealth.id_house, StatusHealth.house_health, StatusHealth.status_incident)
+                    .where(StatusHealth.region_id == region_id)
+                )
+                loaded = {
+                    row.id_house: {"house_health": row.house_health, "status_incident": row.status_incident}
+                    for row in result
+                }
+            state.loaded_at = time.monotonic()
+            if state.houses is None:
+                state.houses = loaded
+            else:
+                # Изменения, пришедшие во время чтения, новее прочитанного — накладываем их сверху
+                for id_house, fields in state.pending.items():
+                    loaded.setdefault(id_house, {}).update(fields)
+                state.pending = loaded
+            self._apply_pending(region_id, state)
+
+    async def subscribe(self, region_id: str, session_factory) -> Subscriber:
+        state = self._regions.setdefault(region_id, _RegionState())
+        subscriber = Subscriber(region_id)
+        # Регистрируемся до загрузки, чтобы состояние района не удалили, пока читаем БД
+        state.subscribers.add(subscriber)
+        try:
+            await self._load(region_id, state, session_factory)
+        except Exception:
+            self.unsubscribe(subscriber)
+            raise
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        state = self._regions.get(subscriber.region_id)
+        if state is None:
+            return
+        state.subscribers.discard(subscriber)
+        if not state.subscribers:
+            # Без подписчиков статусы района не держим: следующий подписчик прочитает их заново
+            del self._regions[subscriber.region_id]
+
+    def _snapshot(self, region_id: str) -> PushMessage:
+        state = self._regions[region_id]
+        if state.snapshot is None:
+            houses = [{"id_house": id_house, **fields} for id_house, fields in state.houses.items()]
+            state.snapshot = self._message("snapshot", region_id, state.seq, {"houses": houses})
+        return state.snapshot
+
+    async def messages(self, subscriber: Subscriber) -> AsyncIterator[PushMessage]:
+        """Сообщения подписчика: snapshot, затем changes и heartbeat при простое"""
+        while True:
+            if subscriber.needs_snapshot:
+                subscriber.needs_snapshot = False
+                subscriber.messages.clear()
+                yield self._snapshot(subscriber.region_id)
+            elif subscriber.messages:
+                yield subscriber.messages.popleft()
+            else:
+                subscriber.wakeup.clear()
+                try:
+                    await asyncio.wait_for(subscriber.wakeup.wait(), STATUS_PUSH_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT
+
+    def stats(self) -> Dict:
+        return {
+            "regions": {
+                region_id: {"subscribers": len(state.subscribers), "seq": state.seq}
+                for region_id, state in self._regions.items()
+            },
+            "resyncs": int(resyncs._values.get((), 0)),
+        }
+
+
+status_hub = StatusPushHub()
+add_status_change_listener(status_hub.on_status_change)
+
+gauge(
+    "status_push_subscribers",
+    "Открытые подписки на изменения статусов по району",
+    lambda: [((region_id,), len(state.subscribers)) for region_id, state in status_hub._regions.items()],
+    ("region",),
+)
@@ -0,0 +1,182 @@
+import asyncio
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import LublinoHousesId, StatusHealth
+
+# Через сколько секунд снимок перечитывается из БД целиком (страховка от изменений в обход API)
+SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv("STATUS_SNAPSHOT_MAX_AGE", "300"))
+
+ACTIVE_INCIDENT_STATUSES = ("New", "Work", "Repair")
+PROCESSED_INCIDENT_STATUSES = ("Work", "Repair")
+
+COUNTER_NAMES = (
+    "red",
+    "yellow",
+    "green",
+    "in_work",
+    "total_current_failures",
+    "processed_current",
+)
+
+_snapshots: Dict[str, Dict] = {}
+_locks: Dict[str, asyncio.Lock] = {}
+# Сколько раз подряд перечитывать снимок, если во время чтения менялись статусы
+SNAPSHOT_RELOAD_ATTEMPTS = 3
+
+# Коммиты status_houses, которые ещё не вернулись (их изменения уже могут быть видны чтению снимка,
+# а apply_status_change ещё не вызван), и счётчик завершённых коммитов
+_commits_in_flight = 0
+_commit_seq = 0
+
+# Значение new_health/new_status для поля, которое не менялось (None — это сброс поля в NULL)
+UNCHANGED = object()
+
+# Подписчики на изменения статусов: callback(region_id, id_house, new_health, new_status)
+StatusChangeListener = Callable[[str, Optional[int], Optional[str], Optional[str]], None]
+_listeners: List[StatusChangeListener] = []
+
+
+def add_status_change_listener(listener: StatusChangeListener) -> None:
+    """Регистрирует обработчик, вызываемый после каждого закоммиченного изменения статуса дома"""
+    _listeners.append(listener)
+
+
+def _row_contribution(house_health: Optional[str], status_incident: Optional[str]) -> Dict[str, int]:
+    """Вклад одной строки status_houses в счётчики снимка"""
+    return {
+        "red": int(house_health == "Red"),
+        "yellow": int(house_health == "Yellow"),
+        "green": int(house_health == "Green"),
+        "in_work": int(status_incident in ACTIVE_INCIDENT_STATUSES),
+        "total_current_failures": int(house_health in ("Red", "Yellow")),
+        "processed_current": int(status_incident in PROCESSED_INCIDENT_STATUSES),
+    }
+
+
+async def _load_snapshot(db: AsyncSession, region_id: str) -> Dict:
+    """Считает все счётчики дашборда одним запросом (один проход по секции status_houses района)"""
+    query = select(
+        func.count().filter(StatusHealth.house_health == "Red").label("red"),
+        func.count().filter(StatusHealth.house_health == "Yellow").label("yellow"),
+        func.count().filter(StatusHealth.house_health == "Green").label("green"),
+        func.count().filter(
+            StatusHealth.status_incident.in_(ACTIVE_INCIDENT_STATUSES)
+        ).label("in_work"),
+        func.count().filter(
+            StatusHealth.house_health.in_(["Red", "Yellow"])
+        ).label("total_current_failures"),
+        func.count().filter(
+            StatusHealth.status_incident.in_(PROCESSED_INCIDENT_STATUSES)
+        ).label("processed_current"),
+        select(func.count(LublinoHousesId.id_house))
+        .where(LublinoHousesId.region_id == region_id)
+        .scalar_subquery()
+        .label("total_houses"),
+    ).select_from(StatusHealth).where(StatusHealth.region_id == region_id)
+
+    row = (await db.execute(query)).one()
+    return {
+        "counts": {name: getattr(row, name) or 0 for name in COUNTER_NAMES},
+        "total_houses": row.total_houses or 0,
+        "loaded_at": time.monotonic(),
+    }
+
+
+async def get_status_snapshot(db: AsyncSession, region_id: str) -> Dict:
+    """
+    Возвращает снимок статусов региона.
+    Из БД читается только при первом обращении или когда снимок устарел.
+    """
+    snapshot = _snapshots.get(region_id)
+    if snapshot and time.monotonic() - snapshot["loaded_at"] < SNAPSHOT_MAX_AGE_SECONDS:
+        return snapshot
+
+    lock = _locks.setdefault(region_id, asyncio.Lock())
+    async with lock:
+        # Пока ждали блокировку, снимок мог обновить другой запрос
+        snapshot = _snapshots.get(region_id)
+        if snapshot and time.monotonic() - snapshot["loaded_at"] < SNAPSHOT_MAX_AGE_SECONDS:
+            return snapshot
+        return await _reload_snapshot(db, region_id)
+
+
+async def _reload_snapshot(db: AsyncSession, region_id: str) -> Dict:
+    """
+    Читает снимок и заменяет им старый. Чтение точно, если за время запроса ни один коммит
+    status_houses не начался и не завершился (commit_status_changes): иначе неизвестно, вошло ли
+    изменение в прочитанные счётчики, и снимок читается заново. Если статусы меняются непрерывно,
+    после SNAPSHOT_RELOAD_ATTEMPTS попыток последний снимок сохраняется уже просроченным —
+    его перечитает следующее обращение.
+    """
+    for _ in range(SNAPSHOT_RELOAD_ATTEMPTS):
+        seq = _commit_seq
+        snapshot = await _load_snapshot(db, region_id)
+        if _commit_seq == seq and not _commits_in_flight:
+            break
+    else:
+        snapshot["loaded_at"] = float("-inf")
+    _snapshots[region_id] = snapshot
+    return snapshot
+
+
+async def commit_status_changes(db: AsyncSession) -> None:
+    """
+    Коммит транзакции, изменившей status_houses. apply_status_change этих изменений нужно вызвать
+    сразу после него, без await между ними: тогда чтение снимка, которое застало коммит в процессе
+    или завершённым, но без изменений в памяти, узнаёт об этом и перечитывает снимок.
+    """
+    global _commits_in_flight, _commit_seq
+    _commits_in_flight += 1
+    try:
+        await db.commit()
+    finally:
+        _commits_in_flight -= 1
+        _commit_seq += 1
+
+
+def cached_status_snapshot(region_id: str) -> Optional[Dict]:
+    """Снимок из памяти без обращения к БД (None, если он ещё не загружался)"""
+    return _snapshots.get(region_id)
+
+
+async def refresh_status_snapshot(db: AsyncSession, region_id: str) -> Dict:
+    """Принудительно перечитывает снимок (например, после массовой пересборки status_houses)"""
+    return await _reload_snapshot(db, region_id)
+
+
+def apply_status_change(
+    region_id: str,
+    old_health: Optional[str],
+    old_status: Optional[str],
+    new_health: Optional[str],
+    new_status: Optional[str],
+    is_new_row: bool = False,
+    id_house: Optional[int] = None,
+) -> None:
+    """
+    Обновляет снимок после коммита (commit_status_changes) изменения одной строки status_houses без запроса к БД
+    и оповещает подписчиков. Если снимок ещё не загружен, он будет прочитан целиком при первом чтении.
+    UNCHANGED в new_health/new_status — поле не менялось (классификатор меняет только house_health).
+    """
+    snapshot = _snapshots.get(region_id)
+    if snapshot:
+        counts = snapshot["counts"]
+        if not is_new_row:
+            for name, value in _row_contribution(old_health, old_status).items():
+                counts[name] -= value
+        for name, value in _row_contribution(
+            old_health if new_health is UNCHANGED else new_health,
+            old_status if new_status is UNCHANGED else new_status,
+        ).items():
+            counts[name] += value
+
+    for listener in _listeners:
+        try:
+            listener(region_id, id_house, new_health, new_status)
+        except Exception as e:
+            print(f"Error in status change listener {listener}: {e}")
@@ -0,0 +1,362 @@
+"""
+Синтетические 5-минутные ряды ХВС/ГВС для десятков тысяч домов (проверка детектора и прогноза на масштабе города).
+
+Суточный профиль и недельные коэффициенты — из generate_water_usage_5min ("Копия Врем ряды.ipynb"),
+но ряд строится сразу матрицей дома × время средствами NumPy, а не циклом по отметкам одного дома.
+В часть домов внедряются аномалии с эталонной разметкой в synthetic_anomalies:
+    leak         — утечка: постоянный дополнительный расход ХВС с момента начала (видна ночью);
+    meter_drift  — дрейф счётчика ГВС: показания линейно уходят от истинных (как water_lintrend_3000);
+    divergence   — расхождение ГВС и ХВС больше 10% (правило детектора инцидентов).
+
+Дома обрабатываются кусками; кусок кодируется в бинарный формат COPY одним структурированным
+массивом NumPy и уходит в water_consump_hot, пока следующий генерируется в потоке.
+
+Запуск из директории backend:
+    python -m app.synthetic_data --region lublino --days 30 --leak-share 0.01
+    python -m app.synthetic_data --houses 50000 --first-house-id 1000000 --days 14 --dry-run
+"""
+import argparse
+import asyncio
+import struct
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+import asyncpg
+import numpy as np
+
+from db.database import ASYNCPG_DSN
+
+SLOTS_PER_DAY = 24 * 12
+WEEKLY_MULTIPLIER = np.array([1.0, 1.0, 1.0, 1.0, 1.0, 1.4, 1.6])  # пн..вс, выходные выше
+ANOMALY_TYPES = ("leak", "meter_drift", "divergence")
+# Строк (дом × отметка) в одном куске: ~100 МБ промежуточных массивов
+ROWS_PER_CHUNK = 2_000_000
+PROGRESS_REPORT_SECONDS = 5.0
+
+PG_EPOCH = np.datetime64("2000-01-01T00:00:00", "us")
+COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+COPY_TRAILER = struct.pack(">h", -1)
+# Строка бинарного COPY: число полей и (длина, значение) для bigint, timestamp, float8, float8
+COPY_ROW_DTYPE = np.dtype([
+    ("fields", ">i2"),
+    ("id_len", ">i4"), ("id_house", ">i8"),
+    ("ts_len", ">i4"), ("time_5min", ">i8"),
+    ("cold_len", ">i4"), ("water_consumption", ">f8"),
+    ("hot_len", ">i4"), ("water_hot", ">f8"),
+])
+READING_COLUMNS = ["id_house", "time_5min", "water_consumption", "water_hot"]
+# Типы, при которых работает бинарный COPY; иначе — построчный copy_records_to_table
+BINARY_COPY_TYPES = {
+    "id_house": "bigint",
+    "time_5min": "timestamp without time zone",
+    "water_consumption": "double precision",
+    "water_hot": "double precision",
+}
+
+SCHEMA_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS synthetic_anomalies (
+        run_id UUID NOT NULL,
+        id_house BIGINT NOT NULL,
+        anomaly TEXT NOT NULL,
+        started_at TIMESTAMP NOT NULL,
+        ended_at TIMESTAMP,
+        magnitude DOUBLE PRECISION NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_synthetic_anomalies_house ON synthetic_anomalies (id_house, started_at)",
+]
+
+
+def daily_pattern() -> np.ndarray:
+    """Расход на 288 пятиминуток суток (кусочно-заданный профиль из ноутбука)"""
+    hour = np.arange(SLOTS_PER_DAY) / 12.0
+    segments = [
+        (hour < 3, lambda h: 0.13 * (h / 3 - 1) ** 2 + 0.05),
+        (hour < 5, lambda h: 0.13 * ((h - 3) / 2) ** 2 + 0.05),
+        (hour < 8, lambda h: 0.18 + 0.07 * (h - 5) / 3),
+        (hour < 10, lambda h: -0.6 * ((h - 8) / 2 - 0.5) ** 2 + 0.4),
+        (hour < 13, lambda h: 0.25 + 0.05 * (h - 10) / 3),
+        (hour < 16, lambda h: -0.4 * ((h - 13) / 3 - 0.5) ** 2 + 0.4),
+        (hour < 17, lambda h: 0.3 - 0.05 * (h - 16)),
+        (hour < 22, lambda h: -1.48 * ((h - 17) / 5 - 0.5) ** 2 + 0.62),
+        (hour < 24, lambda h: 0.25 - 0.07 * (h - 22) / 2),
+    ]
+    pattern = np.empty_like(hour)
+    done = np.zeros(hour.shape, dtype=bool)
+    for condition, formula in segments:
+        mask = condition & ~done
+        pattern[mask] = formula(hour[mask])
+        done |= mask
+    return pattern
+
+
+DAILY_PATTERN = daily_pattern()
+
+
+@dataclass
+class SyntheticConfig:
+    noise_level: float = 0.05
+    spike_probability: float = 0.002
+    hot_noise: float = 0.02  # относительный разброс ГВС вокруг ХВС у исправного дома
+    leak_share: float = 0.01
+    drift_share: float = 0.01
+    divergence_share: float = 0.01
+    seed: int = 0
+
+
+@dataclass
+class SyntheticChunk:
+    house_ids: np.ndarray
+    cold: np.ndarray  # (дома, отметки)
+    hot: np.ndarray
+    labels: List[tuple] = field(default_factory=list)  # (id_house, anomaly, started_at, ended_at, magnitude)
+
+
+def time_grid(start: datetime, end: datetime) -> np.ndarray:
+    """Пятиминутки [start, end), start выравнивается вниз до 5 минут"""
+    first = np.datetime64(start.replace(second=0, microsecond=0), "m")
+    first -= first.astype(np.int64) % 5
+    return np.arange(first, np.datetime64(end, "m"), np.timedelta64(5, "m"))
+
+
+def baseline(times: np.ndarray) -> np.ndarray:
+    """Суточный профиль × недельный коэффициент для каждой отметки"""
+    minutes = times.astype("datetime64[m]").astype(np.int64)
+    slot = (minutes % 1440) // 5
+    weekday = (minutes // 1440 + 3) % 7  # 1970-01-01 — четверг
+    return DAILY_PATTERN[slot] * WEEKLY_MULTIPLIER[weekday]
+
+
+def _anomaly_windows(rng, count: int, periods: int):
+    """Начало и конец (индексы отметок) аномалий; конец == periods — длится до конца ряда"""
+    starts = rng.integers(int(periods * 0.2), max(int(periods * 0.9), int(periods * 0.2) + 1), size=count)
+    ongoing = rng.random(count) < 0.5
+    min_length = min(72, periods)  # не короче 6 часов
+    ends = np.where(ongoing, periods, np.minimum(periods, starts + rng.integers(min_length, periods + 1, size=count)))
+    return starts, ends
+
+
+def generate_chunk(house_ids: np.ndarray, times: np.ndarray, config: SyntheticConfig, rng) -> SyntheticChunk:
+    """Ряды ХВС/ГВС для куска домов; аномалии внедряются случайно по долям из config"""
+    houses, periods = len(house_ids), len(times)
+    base = baseline(times)[None, :]
+    scale = rng.lognormal(0.0, 0.4, size=(houses, 1))  # размер дома
+
+    cold = scale * base * (1 + config.noise_level * rng.standard_normal((houses, periods)))
+    if config.spike_probability > 0:
+        spikes = rng.random((houses, periods)) < config.spike_probability
+        cold[spikes] += rng.exponential(0.3, size=int(spikes.sum())) * np.broadcast_to(scale, cold.shape)[spikes]
+    np.maximum(cold, 0.0, out=cold)
+    hot = cold * (1 + config.hot_noise * rng.standard_normal((houses, periods)))
+    np.maximum(hot, 0.0, out=hot)
+
+    chunk = SyntheticChunk(house_ids, cold, hot)
+    step = np.arange(periods)[None, :]
+    for anomaly, share in (
+        ("leak", config.leak_share),
+        ("meter_drift", config.drift_share),
+        ("divergence", config.divergence_share),
+    ):
+        rows = np.flatnonzero(rng.random(houses) < share)
+        if not len(rows):
+            continue
+        starts, ends = _anomaly_windows(rng, len(rows), periods)
+        active = (step >= starts[:, None]) & (step < ends[:, None])
+        if anomaly == "leak":
+            # Доля среднего расхода дома, которая уходит постоянно, в том числе ночью
+            magnitude = rng.uniform(0.2, 1.0, size=len(rows))
+            cold[rows] += active * (magnitude * scale[rows, 0] * base.mean())[:, None]
+        elif anomaly == "meter_drift":
+            # Итоговое отклонение показаний ГВС к концу окна: от -40% до +40%
+            magnitude = rng.uniform(0.15, 0.4, size=len(rows)) * rng.choice((-1.0, 1.0), size=len(rows))
+            progress = np.clip((step - starts[:, None]) / np.maximum(ends - starts, 1)[:, None], 0.0, 1.0)
+            hot[rows] *= 1 + active * progress * magnitude[:, None]
+        else:
+            # ГВС меньше ХВС на 15–40%
+            magnitude = rng.uniform(0.15, 0.4, size=len(rows))
+            hot[rows] *= 1 - active * magnitude[:, None]
+        for row, start, end, value in zip(rows, starts, ends, magnitude):
+            chunk.labels.append((
+                int(house_ids[row]),
+                anomaly,
+                times[start].astype(datetime),
+                times[end].astype(datetime) if end < periods else None,
+                float(value),
+            ))
+    return chunk
+
+
+def encode_copy_binary(house_ids: np.ndarray, times: np.ndarray, cold: np.ndarray, hot: np.ndarray) -> bytes:
+    """Кусок в формате бинарного COPY (id_house, time_5min, water_consumption, water_hot), строки по домам"""
+    houses, periods = cold.shape
+    rows = np.empty(houses * periods, dtype=COPY_ROW_DTYPE)
+    rows["fields"] = 4
+    rows["id_len"] = rows["ts_len"] = rows["cold_len"] = rows["hot_len"] = 8
+    rows["id_house"] = np.repeat(np.asarray(house_ids, dtype=np.int64), periods)
+    rows["time_5min"] = np.tile((times.astype("datetime64[us]") - PG_EPOCH).astype(np.int64), houses)
+    rows["water_consumption"] = cold.ravel()
+    rows["water_hot"] = hot.ravel()
+    return COPY_HEADER + rows.tobytes() + COPY_TRAILER
+
+
+def _records(chunk: SyntheticChunk, times: np.ndarray) -> List[tuple]:
+    stamps = times.astype("datetime64[us]").astype(object)
+    return [
+        (int(house_id), stamps[j], float(chunk.cold[i, j]), float(chunk.hot[i, j]))
+        for i, house_id in enumerate(chunk.house_ids)
+        for j in range(len(stamps))
+    ]
+
+
+async def _binary_copy_supported(conn: asyncpg.Connection) -> bool:
+    rows = await conn.fetch("""
+        SELECT column_name, data_type FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'water_consump_hot'
+    """)
+    types = {row["column_name"]: row["data_type"] for row in rows}
+    return all(types.get(column) == data_type for column, data_type in BINARY_COPY_TYPES.items())
+
+
+async def load_synthetic_readings(
+    house_ids: Sequence[int],
+    start: datetime,
+    end: datetime,
+    config: Optional[SyntheticConfig] = None,
+    replace: bool = True,
+    dry_run: bool = False,
+    rows_per_chunk: int = ROWS_PER_CHUNK,
+) -> Dict:
+    """
+    Генерирует ряды [start, end) для house_ids и пишет их в water_consump_hot, а разметку аномалий —
+    в synthetic_anomalies (run_id в статистике). replace — сначала удалить показания этих домов за период;
+    dry_run — только генерация и кодирование (замер скорости без БД).
+    """
+    config = config or SyntheticConfig()
+    rng = np.random.default_rng(config.seed or None)
+    times = time_grid(start, end)
+    house_array = np.asarray(house_ids, dtype=np.int64)
+    houses_per_chunk = max(1, rows_per_chunk // max(len(times), 1))
+    run_id = uuid.uuid4()
+    stats = {"run_id": str(run_id), "houses": len(house_array), "periods": len(times), "rows": 0, "anomalies": {}}
+    if not len(times) or not len(house_array):
+        return stats
+
+    started = time.perf_counter()
+    conn = None if dry_run else await asyncpg.connect(ASYNCPG_DSN)
+    try:
+        binary = True
+        if conn is not None:
+            for statement in SCHEMA_STATEMENTS:
+                await conn.execute(statement)
+            binary = await _binary_copy_supported(conn)
+            if not binary:
+                print("[synthetic] water_consump_hot column types differ from bigint/timestamp/float8, using row COPY")
+            if replace:
+                await conn.execute(
+                    "DELETE FROM water_consump_hot WHERE id_house = ANY($1::bigint[]) "
+                    "AND time_5min >= $2 AND time_5min < $3",
+                    house_array.tolist(), times[0].astype(datetime), (times[-1] + np.timedelta64(5, "m")).astype(datetime),
+                )
+
+        def build(offset: int):
+            chunk = generate_chunk(house_array[offset:offset + houses_per_chunk], times, config, rng)
+            payload = encode_copy_binary(chunk.house_ids, times, chunk.cold, chunk.hot) if binary else _records(chunk, times)
+            return chunk, payload
+
+        last_report = started
+        offsets = list(range(0, len(house_array), houses_per_chunk))
+        pending = asyncio.ensure_future(asyncio.to_thread(build, offsets[0]))
+        for i in range(len(offsets)):
+            chunk, payload = await pending
+            if i + 1 < len(offsets):
+                # Следующий кусок генерируется в потоке, пока текущий идёт в COPY
+                pending = asyncio.ensure_future(asyncio.to_thread(build, offsets[i + 1]))
+            if conn is not None:
+                async with conn.transaction():
+                    if binary:
+                        await conn.copy_to_table(
+                            "water_consump_hot", source=payload, columns=READING_COLUMNS, format="binary"
+                        )
+                    else:
+                        await conn.copy_records_to_table("water_consump_hot", records=payload, columns=READING_COLUMNS)
+                    if chunk.labels:
+                        await conn.copy_records_to_table(
+                            "synthetic_anomalies",
+                            records=[(run_id, *label) for label in chunk.labels],
+                            columns=["run_id", "id_house", "anomaly", "started_at", "ended_at", "magnitude"],
+                        )
+            stats["rows"] += chunk.cold.size
+            for label in chunk.labels:
+                stats["anomalies"][label[1]] = stats["anomalies"].get(label[1], 0) + 1
+
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_REPORT_SECONDS:
+                last_report = now
+                print(f"[synthetic] {stats['rows']} rows, {stats['rows'] / (now - started):.0f} rows/s")
+    finally:
+        if conn is not None:
+            await conn.close()
+
+    elapsed = time.perf_counter() - started
+    stats["elapsed_seconds"] = round(elapsed, 1)
+    stats["rows_per_second"] = round(stats["rows"] / elapsed) if elapsed > 0 else 0
+    print(
+        f"[synthetic] {stats['rows']} readings for {stats['houses']} houses in {elapsed:.1f} s "
+        f"({stats['rows_per_second']} rows/s), anomalies: {stats['anomalies']}, run_id {run_id}"
+    )
+    return stats
+
+
+async def _region_house_ids(region_id: str) -> List[int]:
+    conn = await asyncpg.connect(ASYNCPG_DSN)
+    try:
+        rows = await conn.fetch("SELECT id_house FROM lublino_houses_id WHERE region_id = $1 ORDER BY id_house", region_id)
+    finally:
+        await conn.close()
+    return [row["id_house"] for row in rows]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Синтетические 5-минутные ряды ХВС/ГВС с размеченными аномалиями")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--region", help="Дома района из lublino_houses_id")
+    target.add_argument("--houses", type=int, help="Число домов с id подряд от --first-house-id (без реестра)")
+    parser.add_argument("--first-house-id", type=int, default=1_000_000)
+    parser.add_argument("--days", type=float, default=7, help="Дней до --end")
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None, help="Конец периода (по умолчанию — сейчас)")
+    parser.add_argument("--noise", type=float, default=SyntheticConfig.noise_level)
+    parser.add_argument("--leak-share", type=float, default=SyntheticConfig.leak_share)
+    parser.add_argument("--drift-share", type=float, default=SyntheticConfig.drift_share)
+    parser.add_argument("--divergence-share", type=float, default=SyntheticConfig.divergence_share)
+    parser.add_argument("--seed", type=int, default=0, help="Зерно генератора (0 — случайное)")
+    parser.add_argument("--keep-existing", action="store_true", help="Не удалять имеющиеся показания за период")
+    parser.add_argument("--dry-run", action="store_true", help="Только сгенерировать (замер скорости без БД)")
+    args = parser.parse_args()
+
+    if args.region:
+        house_ids = asyncio.run(_region_house_ids(args.region))
+        if not house_ids:
+            parser.error(f"В районе {args.region} нет домов")
+    else:
+        house_ids = list(range(args.first_house_id, args.first_house_id + args.houses))
+    end = args.end or datetime.now()
+    config = SyntheticConfig(
+        noise_level=args.noise,
+        leak_share=args.leak_share,
+        drift_share=args.drift_share,
+        divergence_share=args.divergence_share,
+        seed=args.seed,
+    )
+    asyncio.run(load_synthetic_readings(
+        house_ids, end - timedelta(days=args.days), end, config,
+        replace=not args.keep_existing, dry_run=args.dry_run,
+    ))
+
+
+if __name__ == "__main__":
+    main()
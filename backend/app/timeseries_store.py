@@ -0,0 +1,466 @@
+"""
+Колоночное хранилище часовых рядов в памяти (water_consump_hot_1h, water_diffr_coldhot_1h).
+
+Карточка дома и каждый вопрос LLM о доме читали одни и те же «последние 24 часа»
+из Postgres. Теперь последние TS_STORE_HOURS часов каждого ряда лежат в NumPy-массивах:
+по строке на дом (id_house -> номер строки), время и каждая колонка — отдельный массив
+формы (домов, часов), точки в строке отсортированы по времени.
+
+  - загрузка при старте одним COPY на ряд;
+  - новые часы дописываются: фоновый цикл дочитывает хвост таблиц (последний час
+    перечитывается, т.к. он мог быть пересчитан), также можно вызвать upsert() напрямую;
+  - если задан TS_STORE_DIR, массивы лежат в memory-mapped файлах: один процесс
+    (захвативший файловую блокировку) загружает и дописывает их, остальные воркеры
+    uvicorn открывают те же файлы только на чтение и не держат собственную копию;
+  - чтение, которое хранилище покрыть не может (дом не загружен, нужен более старый
+    диапазон), возвращает None — вызывающий идёт в Postgres.
+"""
+import asyncio
+import io
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import asyncpg
+import numpy as np
+import pandas as pd
+
+from db.database import ASYNCPG_DSN
+
+try:
+    import fcntl
+except ImportError:  # Windows: без разделяемых файлов, каждый процесс держит свою копию
+    fcntl = None
+
+TS_STORE_HOURS = int(os.getenv("TS_STORE_HOURS", str(24 * 7)))
+TS_STORE_DIR = os.getenv("TS_STORE_DIR") or None
+TS_STORE_REFRESH_SECONDS = float(os.getenv("TS_STORE_REFRESH_SECONDS", "60"))
+
+EPOCH = datetime(1970, 1, 1)
+HOUSE_GROWTH = 256
+
+
+@dataclass(frozen=True)
+class SeriesSpec:
+    table: str
+    columns: Tuple[str, ...]
+
+
+# Ключи совпадают с WATER_DATA_QUERIES в real_data
+SERIES: Dict[str, SeriesSpec] = {
+    "consumption_1h": SeriesSpec("water_consump_hot_1h", ("water_cold", "water_hot")),
+    "diffr_1h": SeriesSpec("water_diffr_coldhot_1h", ("diffr_ratio",)),
+}
+
+
+def to_seconds(value: datetime) -> int:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return int((value - EPOCH).total_seconds())
+
+
+def from_seconds(value: int) -> datetime:
+    return EPOCH + timedelta(seconds=int(value))
+
+
+def _clean(value: float) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
+
+
+class SeriesBlock:
+    """Массивы одного ряда: times[дом, i], values[колонка][дом, i], lengths[дом]"""
+
+    def __init__(self, columns: Sequence[str], times: np.ndarray, lengths: np.ndarray, values: Dict[str, np.ndarray]):
+        self.columns = tuple(columns)
+        self.times = times
+        self.lengths = lengths
+        self.values = values
+
+    @property
+    def capacity(self) -> int:
+        return self.times.shape[1]
+
+    def upsert(self, row: int, t: int, point: Sequence[float]) -> None:
+        """Записывает точку в строку дома, сохраняя порядок по времени"""
+        n = int(self.lengths[row])
+        times = self.times[row]
+        if n and t == times[n - 1]:
+            idx = n - 1
+        elif not n or t > times[n - 1]:
+            if n == self.capacity:
+                # Окно сдвигается: самый старый час выпадает
+                times[:-1] = times[1:]
+                for column in self.columns:
+                    self.values[column][row, :-1] = self.values[column][row, 1:]
+                idx = n - 1
+            else:
+                idx = n
+                self.lengths[row] = n + 1
+        else:
+            idx = int(np.searchsorted(times[:n], t))
+            if times[idx] != t:
+                if n == self.capacity:
+                    if idx == 0:
+                        return  # старше окна
+                    # Опоздавший час внутри полного окна: самый старый час выпадает
+                    idx -= 1
+                    times[:idx] = times[1:idx + 1].copy()
+                    for column in self.columns:
+                        data = self.values[column][row]
+                        data[:idx] = data[1:idx + 1].copy()
+                else:
+                    times[idx + 1:n + 1] = times[idx:n].copy()
+                    for column in self.columns:
+                        data = self.values[column][row]
+                        data[idx + 1:n + 1] = data[idx:n].copy()
+                    self.lengths[row] = n + 1
+        times[idx] = t
+        for column, value in zip(self.columns, point):
+            self.values[column][row, idx] = np.nan if value is None else value
+
+    def points(self, row: int, start: int = 0, end: Optional[int] = None) -> List[Dict]:
+        n = int(self.lengths[row])
+        end = n if end is None else end
+        return [
+            {
+                "time": from_seconds(self.times[row, i]).isoformat(),
+                "values": {column: _clean(self.values[column][row, i]) for column in self.columns},
+            }
+            for i in range(start, end)
+        ]
+
+
+class TimeSeriesStore:
+    def __init__(self, capacity_hours: int = TS_STORE_HOURS, directory: Optional[str] = TS_STORE_DIR):
+        self.capacity = capacity_hours
+        self.directory = directory
+        self.house_rows: Dict[int, int] = {}
+        self.blocks: Dict[str, SeriesBlock] = {}
+        # Начало окна при загрузке: дом с неполной строкой хранит все свои точки начиная с него
+        self.loaded_from: Dict[str, int] = {}
+        self.latest: Dict[str, int] = {}
+        self.is_writer = True
+        self._version = 0
+        self._lock_file = None
+        self._meta_mtime = 0
+        self.hits = 0
+        self.misses = 0
+
+    # ----- загрузка и дозапись -----
+
+    async def load(self, dsn: str = ASYNCPG_DSN) -> None:
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self.is_writer = self._acquire_writer_lock()
+            if not self.is_writer:
+                # Писатель мог ещё не закончить загрузку — тогда подключимся при первом чтении
+                self._reattach_if_changed()
+                print(f"[ts-store] Attached read-only to {self.directory}: {len(self.house_rows)} houses")
+                return
+            self._discard_stale_files()
+
+        conn = await asyncpg.connect(dsn)
+        try:
+            frames = {key: await self._copy_window(conn, key, spec) for key, spec in SERIES.items()}
+        finally:
+            await conn.close()
+
+        house_ids = sorted(set().union(*(set(frame["id_house"].unique()) for frame in frames.values())))
+        self.house_rows = {int(id_house): row for row, id_house in enumerate(house_ids)}
+        self._allocate(len(house_ids) + HOUSE_GROWTH)
+        for key, frame in frames.items():
+            self._fill(key, frame)
+        self._write_meta()
+        print(f"[ts-store] Loaded {len(house_ids)} houses x {self.capacity} h for {', '.join(SERIES)}")
+
+    async def _copy_window(self, conn: asyncpg.Connection, key: str, spec: SeriesSpec) -> pd.DataFrame:
+        """
+        Последние capacity часов ряда по каждому дому одним COPY. Окно отсчитывается от последнего часа
+        самого дома: у дома, данные которого отстают, от общего последнего часа осталось бы меньше точек.
+        """
+        latest = await conn.fetchval(f"SELECT max(time_1hour) FROM public.{spec.table}")
+        columns = ", ".join(f"t.{column}" for column in spec.columns)
+        if latest is None:
+            self.loaded_from[key] = 0
+            return pd.DataFrame(columns=["id_house", "time_1hour", *spec.columns])
+        # Окно любого дома начинается не позже общего, поэтому с этого момента загружено всё
+        start = latest - timedelta(hours=self.capacity - 1)
+        self.loaded_from[key] = to_seconds(start)
+        self.latest[key] = to_seconds(latest)
+
+        buffer = io.BytesIO()
+        await conn.copy_from_query(
+            f"""
+            WITH house_latest AS (
+                SELECT id_house, max(time_1hour) AS latest
+                FROM public.{spec.table}
+                GROUP BY id_house
+            )
+            SELECT t.id_house, extract(epoch FROM t.time_1hour)::bigint AS time_1hour, {columns}
+            FROM public.{spec.table} t
+            JOIN house_latest l ON l.id_house = t.id_house
+            WHERE t.time_1hour >= l.latest - make_interval(hours => $1)
+            ORDER BY t.id_house, t.time_1hour
+            """,
+            self.capacity - 1,
+            output=buffer,
+            format="csv",
+        )
+        buffer.seek(0)
+        return pd.read_csv(buffer, header=None, names=["id_house", "time_1hour", *spec.columns])
+
+    def _fill(self, key: str, frame: pd.DataFrame) -> None:
+        """Раскладывает отсортированные (id_house, time) строки по строкам массивов векторно"""
+        block = self.blocks[key]
+        if frame.empty:
+            return
+        rows = frame["id_house"].map(self.house_rows).to_numpy()
+        positions = frame.groupby("id_house").cumcount().to_numpy()
+        block.times[rows, positions] = frame["time_1hour"].to_numpy(dtype=np.int64)
+        for column in block.columns:
+            block.values[column][rows, positions] = frame[column].to_numpy(dtype=np.float64)
+        counts = frame.groupby("id_house").size()
+        block.lengths[counts.index.map(self.house_rows).to_numpy()] = counts.to_numpy()
+
+    def upsert(self, key: str, rows: Iterable[Tuple]) -> int:
+        """Дописывает точки (id_house, time_1hour, *колонки) в ряд key; вызывается только в процессе-писателе"""
+        block = self.blocks.get(key)
+        if block is None or not self.is_writer:
+            return 0
+        count = 0
+        for id_house, time_1hour, *point in rows:
+            row = self.house_rows.get(int(id_house))
+            if row is None:
+                row = self._add_house(int(id_house))
+                block = self.blocks[key]
+            t = to_seconds(time_1hour)
+            block.upsert(row, t, point)
+            self.latest[key] = max(self.latest.get(key, t), t)
+            count += 1
+        return count
+
+    async def refresh(self, dsn: str = ASYNCPG_DSN) -> int:
+        """Дочитывает новые часы из Postgres (последний известный час перечитывается)"""
+        if not self.is_writer or not self.blocks:
+            return 0
+        conn = await asyncpg.connect(dsn)
+        try:
+            total = 0
+            for key, spec in SERIES.items():
+                since = from_seconds(self.latest.get(key, self.loaded_from.get(key, 0)))
+                records = await conn.fetch(
+                    f"""
+                    SELECT id_house, time_1hour, {", ".join(spec.columns)}
+                    FROM public.{spec.table}
+                    WHERE time_1hour >= $1
+                    ORDER BY time_1hour
+                    """,
+                    since,
+                )
+                total += self.upsert(key, (tuple(record) for record in records))
+            return total
+        finally:
+            await conn.close()
+
+    async def run_refresher(self, interval: float = TS_STORE_REFRESH_SECONDS) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[ts-store] Error refreshing time series: {e}")
+
+    # ----- чтение -----
+
+    def _block_for(self, key: str, id_house: int) -> Tuple[Optional[SeriesBlock], Optional[int]]:
+        if not self.is_writer:
+            self._reattach_if_changed()
+        block = self.blocks.get(key)
+        row = self.house_rows.get(int(id_house))
+        return block, row
+
+    def recent(self, key: str, id_house: int, limit: int) -> Optional[List[Dict]]:
+        """
+        Последние limit точек по убыванию времени (как ORDER BY time_1hour DESC LIMIT limit).
+        None — в хранилище меньше limit точек дома, и более старые могут быть только в БД.
+        """
+        block, row = self._block_for(key, id_house)
+        if block is None or row is None or int(block.lengths[row]) < limit:
+            self.misses += 1
+            return None
+        self.hits += 1
+        n = int(block.lengths[row])
+        return block.points(row, n - limit, n)[::-1]
+
+    def window(self, key: str, id_house: int, start: datetime, end: Optional[datetime] = None) -> Optional[List[Dict]]:
+        """Точки дома за [start, end] по возрастанию времени; None — диапазон старше окна хранилища"""
+        block, row = self._block_for(key, id_house)
+        if block is None or row is None:
+            self.misses += 1
+            return None
+        n = int(block.lengths[row])
+        start_s = to_seconds(start)
+        # Полная строка хранит только последние capacity часов, неполная — всё с момента загрузки
+        covered_from = int(block.times[row, 0]) if n == block.capacity else self.loaded_from.get(key, 0)
+        if start_s < covered_from:
+            self.misses += 1
+            return None
+        self.hits += 1
+        times = block.times[row, :n]
+        first = int(np.searchsorted(times, start_s, side="left"))
+        last = n if end is None else int(np.searchsorted(times, to_seconds(end), side="right"))
+        return block.points(row, first, last)
+
+    def latest_time(self, key: str, id_house: int) -> Optional[datetime]:
+        block, row = self._block_for(key, id_house)
+        if block is None or row is None or not int(block.lengths[row]):
+            return None
+        return from_seconds(block.times[row, int(block.lengths[row]) - 1])
+
+    def stats(self) -> Dict:
+        requests = self.hits + self.misses
+        return {
+            "houses": len(self.house_rows),
+            "capacity_hours": self.capacity,
+            "series": list(self.blocks),
+            "shared_dir": self.directory,
+            "writer": self.is_writer,
+            "memory_bytes": sum(
+                block.times.nbytes + block.lengths.nbytes + sum(v.nbytes for v in block.values.values())
+                for block in self.blocks.values()
+            ),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / requests, 4) if requests else 0.0,
+        }
+
+    # ----- массивы и memory-mapped файлы -----
+
+    def _array(self, name: str, dtype, shape: Tuple[int, ...], fill, mode: str = "w+") -> np.ndarray:
+        if not self.directory:
+            return np.full(shape, fill, dtype=dtype)
+        path = os.path.join(self.directory, f"{name}.v{self._version}.bin")
+        array = np.memmap(path, dtype=dtype, mode=mode, shape=shape)
+        if mode == "w+":
+            array[...] = fill
+        return array
+
+    def _allocate(self, house_capacity: int, version: Optional[int] = None) -> None:
+        old_files = self._data_files()
+        self._version = self._version + 1 if version is None else version
+        old_blocks = self.blocks
+        self.blocks = {}
+        for key, spec in SERIES.items():
+            shape = (house_capacity, self.capacity)
+            block = SeriesBlock(
+                spec.columns,
+                self._array(f"{key}.times", np.int64, shape, 0),
+                self._array(f"{key}.lengths", np.int32, (house_capacity,), 0),
+                {column: self._array(f"{key}.{column}", np.float64, shape, np.nan) for column in spec.columns},
+            )
+            old = old_blocks.get(key)
+            if old is not None:
+                rows = old.lengths.shape[0]
+                block.times[:rows] = old.times
+                block.lengths[:rows] = old.lengths
+                for column in spec.columns:
+                    block.values[column][:rows] = old.values[column]
+            self.blocks[key] = block
+        # Читатели со старыми отображениями продолжают работать: файл на Linux живёт до закрытия
+        for path in old_files:
+            os.remove(path)
+
+    def _add_house(self, id_house: int) -> int:
+        row = len(self.house_rows)
+        capacity = next(iter(self.blocks.values())).lengths.shape[0]
+        if row >= capacity:
+            self._allocate(capacity + HOUSE_GROWTH)
+        self.house_rows[id_house] = row
+        self._write_meta()
+        return row
+
+    def _data_files(self) -> List[str]:
+        if not self.directory or not self._version:
+            return []
+        suffix = f".v{self._version}.bin"
+        return [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(suffix)]
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+    def _write_meta(self) -> None:
+        if not self.directory:
+            return
+        meta = {
+            "version": self._version,
+            "capacity": self.capacity,
+            "house_capacity": next(iter(self.blocks.values())).lengths.shape[0],
+            "houses": list(self.house_rows),
+            "loaded_from": self.loaded_from,
+        }
+        tmp_path = self._meta_path() + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path())
+
+    def _attach(self) -> None:
+        with open(self._meta_path()) as f:
+            meta = json.load(f)
+        self._meta_mtime = os.stat(self._meta_path()).st_mtime_ns
+        self.capacity = meta["capacity"]
+        self._version = meta["version"]
+        self.loaded_from = meta["loaded_from"]
+        self.house_rows = {int(id_house): row for row, id_house in enumerate(meta["houses"])}
+        house_capacity = meta["house_capacity"]
+        self.blocks = {}
+        for key, spec in SERIES.items():
+            shape = (house_capacity, self.capacity)
+            self.blocks[key] = SeriesBlock(
+                spec.columns,
+                self._array(f"{key}.times", np.int64, shape, 0, mode="r"),
+                self._array(f"{key}.lengths", np.int32, (house_capacity,), 0, mode="r"),
+                {column: self._array(f"{key}.{column}", np.float64, shape, np.nan, mode="r") for column in spec.columns},
+            )
+
+    def _reattach_if_changed(self) -> None:
+        try:
+            mtime = os.stat(self._meta_path()).st_mtime_ns
+            if mtime != self._meta_mtime:
+                self._attach()
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[ts-store] Could not re-attach shared store: {e}")
+
+    def _discard_stale_files(self) -> None:
+        """
+        Новый писатель продолжает нумерацию версий с той, что в meta.json: её файлы могут быть
+        открыты читателями, поэтому перезаписывать их нельзя; файлы остальных версий удаляются.
+        """
+        try:
+            with open(self._meta_path()) as f:
+                self._version = json.load(f)["version"]
+        except (OSError, ValueError, KeyError):
+            self._version = 0
+        keep = f".v{self._version}.bin"
+        for name in os.listdir(self.directory):
+            if name.endswith(".bin") and not name.endswith(keep):
+                os.remove(os.path.join(self.directory, name))
+
+    def _acquire_writer_lock(self) -> bool:
+        if fcntl is None:
+            self.directory = None
+            return True
+        self._lock_file = open(os.path.join(self.directory, ".writer.lock"), "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+
+timeseries_store = TimeSeriesStore()
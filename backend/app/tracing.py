@@ -0,0 +1,162 @@
+"""
+Трассировка запросов: сколько времени каждый маршрут тратит на БД, сборку контекста, LLM и т.д.
+
+TracingMiddleware (чистый ASGI — учитывает и тело StreamingResponse до последнего байта) заводит
+на запрос RequestTrace в contextvar. Участки кода отмечаются span("имя") или add_span() — время
+суммируется по имени в пределах запроса (SQL-запросы добавляет app.db_metrics как span "db").
+Вне запроса (фоновые задачи: SMTP, пересчёты) участки записываются под маршрутом "background".
+
+По окончании запроса время и участки попадают в гистограммы Prometheus и в скользящие окна
+последних TRACE_WINDOW_SIZE наблюдений, по которым считаются p50/p95/p99 (latency_report, /metrics).
+"""
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from app.metrics import gauge, histogram
+
+TRACE_WINDOW_SIZE = int(os.getenv("TRACE_WINDOW_SIZE", "2048"))
+QUANTILES = (0.5, 0.95, 0.99)
+BACKGROUND_ROUTE = "background"
+UNMATCHED_ROUTE = "unmatched"
+
+
+class RequestTrace:
+    __slots__ = ("route", "spans")
+
+    def __init__(self):
+        self.route = UNMATCHED_ROUTE
+        self.spans: Dict[str, float] = {}
+
+
+_current: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+request_duration = histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP-запроса (до отправки последнего байта ответа)",
+    ("route", "method", "status"),
+)
+span_duration = histogram(
+    "http_span_duration_seconds",
+    "Время участка обработки (db, context_format, llm_upstream, smtp, ...) за запрос",
+    ("route", "span"),
+)
+
+
+class LatencyWindow:
+    """Последние N наблюдений; квантили считаются при чтении"""
+
+    def __init__(self, size: int = TRACE_WINDOW_SIZE):
+        self._values: Deque[float] = deque(maxlen=size)
+        self.total = 0
+
+    def add(self, value: float) -> None:
+        self._values.append(value)
+        self.total += 1
+
+    def quantiles(self) -> Dict[str, float]:
+        if not self._values:
+            return {}
+        values = np.quantile(np.fromiter(self._values, dtype=np.float64), QUANTILES)
+        return {f"p{round(q * 100)}": float(v) for q, v in zip(QUANTILES, values)}
+
+
+# (маршрут, участок) -> окно; участок "total" — весь запрос
+_windows: Dict[Tuple[str, str], LatencyWindow] = {}
+
+
+def _observe(route: str, name: str, seconds: float) -> None:
+    window = _windows.get((route, name))
+    if window is None:
+        window = _windows[(route, name)] = LatencyWindow()
+    window.add(seconds)
+
+
+def add_span(name: str, seconds: float) -> None:
+    trace = _current.get()
+    if trace is None:
+        span_duration.observe(seconds, BACKGROUND_ROUTE, name)
+        _observe(BACKGROUND_ROUTE, name, seconds)
+        return
+    trace.spans[name] = trace.spans.get(name, 0.0) + seconds
+
+
+@contextmanager
+def span(name: str):
+    """Замер участка кода (работает и в async-коде: время ожидания внутри тоже учитывается)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_span(name, time.perf_counter() - started)
+
+
+def _route_path(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", UNMATCHED_ROUTE) if route is not None else UNMATCHED_ROUTE
+
+
+class TracingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace()
+        token = _current.set(trace)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            elapsed = time.perf_counter() - started
+            # Шаблон маршрута (/api/houses/{house_id}), а не путь — чтобы не плодить метки
+            route = _route_path(scope)
+            request_duration.observe(elapsed, route, scope["method"], str(status))
+            _observe(route, "total", elapsed)
+            for name, seconds in trace.spans.items():
+                span_duration.observe(seconds, route, name)
+                _observe(route, name, seconds)
+
+
+def latency_report() -> Dict[str, Dict]:
+    """{маршрут: {"count", "p50", "p95", "p99", "spans": {участок: {...}}}} по скользящим окнам"""
+    report: Dict[str, Dict] = {}
+    for (route, name), window in sorted(_windows.items()):
+        entry = report.setdefault(route, {"count": 0, "spans": {}})
+        stats = {"count": window.total, **window.quantiles()}
+        if name == "total":
+            entry.update(stats)
+        else:
+            entry["spans"][name] = stats
+    return report
+
+
+def _quantile_samples() -> Iterable[Tuple[Tuple[str, ...], float]]:
+    for (route, name), window in sorted(_windows.items()):
+        for label, value in window.quantiles().items():
+            yield (route, name, label), value
+
+
+gauge(
+    "http_latency_quantile_seconds",
+    f"p50/p95/p99 по последним {TRACE_WINDOW_SIZE} запросам маршрута (span=total — весь запрос)",
+    _quantile_samples,
+    ("route", "span", "quantile"),
+)
@@ -0,0 +1,321 @@
+"""
+Нагрузочный тест API: конкурентные запросы к реальным эндпоинтам, RPS и перцентили задержки.
+
+Сценарии (вес в смеси запросов):
+    dashboard        GET  /api/regions/{region}/dashboard
+    house_list       GET  /api/regions/{region}/houses со случайными фильтрами и сортировкой
+    house_detail     GET  /api/houses/{id}
+    status_update    POST /api/houses/{id}/status (только incident_status — без смены house_health)
+    incident_create  POST /api/v2/incidents/create
+    ask_llm          POST /api/ask-llm и /api/houses/{id}/ask-llm (нужен mock upstream)
+
+Подготовка (из директории backend):
+    python -m bench.seed --region bench --houses 2000 --days 7
+    uvicorn bench.mock_llm:app --port 9000
+    OPENROUTER_BASE_URL=http://127.0.0.1:9000/v1 OPENROUTER_API_KEY=bench NOTIFICATION_EMAILS= \\
+        uvicorn app.main:app --port 8000 --workers 1
+    Один воркер, как в Dockerfile: детектор инцидентов, классификатор house_health, снимки статусов и кэши
+    живут в памяти процесса, и с несколькими воркерами каждый видел бы только свою часть изменений.
+Запуск:
+    python -m bench.load --region bench --concurrency 64 --duration 60 --output results.json
+    python -m bench.load ... --baseline results-main.json   # код выхода 1 при регрессии
+
+Результат — JSON: конфигурация, коммит, по каждому сценарию число запросов, ошибок, RPS и
+задержки p50/p90/p95/p99/max в мс.
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+DEFAULT_BASE_URL = "http://127.0.0.1:8000"
+MAX_HOUSES = 5000
+QUANTILES = (50, 90, 95, 99)
+# Регрессия: p95 выросла или RPS упал больше чем на эту долю относительно baseline
+DEFAULT_MAX_REGRESSION = 0.2
+
+Request = Tuple[str, str, Optional[Dict]]  # метод, путь, JSON-тело
+
+
+@dataclass
+class LoadContext:
+    region_id: str
+    house_ids: List[int]
+    unique_questions: bool
+    counter: int = 0
+
+    def house(self) -> int:
+        return random.choice(self.house_ids)
+
+    def question(self, text: str) -> str:
+        # Уникальный вопрос — мимо кэша ответов LLM, к upstream
+        self.counter += 1
+        return f"{text} (#{self.counter})" if self.unique_questions else text
+
+
+def _dashboard(ctx: LoadContext) -> Request:
+    return "GET", f"/api/regions/{ctx.region_id}/dashboard", None
+
+
+def _house_list(ctx: LoadContext) -> Request:
+    params = [f"limit={random.choice((20, 50, 100))}", f"sort_by={random.choice(('address', 'unom'))}"]
+    status = random.choice((None, "red", "yellow", "green", "in_work"))
+    if status:
+        params.append(f"status={status}")
+    if random.random() < 0.3:
+        params.append("search=" + random.choice(("улица", "проезд", "дом 1", "бульвар")))
+    return "GET", f"/api/regions/{ctx.region_id}/houses?{'&'.join(params)}", None
+
+
+def _house_detail(ctx: LoadContext) -> Request:
+    return "GET", f"/api/houses/{ctx.house()}", None
+
+
+def _status_update(ctx: LoadContext) -> Request:
+    return "POST", f"/api/houses/{ctx.house()}/status", {"incident_status": random.choice(("Work", "Repair"))}
+
+
+def _incident_create(ctx: LoadContext) -> Request:
+    return "POST", "/api/v2/incidents/create", {
+        "id_house": ctx.house(),
+        "status_incident": "New",
+        "house_health": random.choice(("Yellow", "Red")),
+    }
+
+
+def _ask_llm(ctx: LoadContext) -> Request:
+    if random.random() < 0.5:
+        return "POST", "/api/ask-llm", {
+            "question": ctx.question("Какие дома района требуют внимания?"), "region_id": ctx.region_id,
+        }
+    return "POST", f"/api/houses/{ctx.house()}/ask-llm", {"question": ctx.question("Есть ли проблемы у дома?")}
+
+
+SCENARIOS: Dict[str, Tuple[int, Callable[[LoadContext], Request]]] = {
+    "dashboard": (3, _dashboard),
+    "house_list": (4, _house_list),
+    "house_detail": (4, _house_detail),
+    "status_update": (1, _status_update),
+    "incident_create": (1, _incident_create),
+    "ask_llm": (1, _ask_llm),
+}
+
+
+@dataclass
+class ScenarioResult:
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+    statuses: Dict[str, int] = field(default_factory=dict)
+
+    def summary(self, elapsed: float) -> Dict:
+        requests = len(self.latencies)
+        summary = {
+            "requests": requests,
+            "errors": self.errors,
+            "rps": round(requests / elapsed, 2) if elapsed > 0 else 0.0,
+            "statuses": dict(sorted(self.statuses.items())),
+        }
+        if requests:
+            values = np.array(self.latencies) * 1000
+            for q, value in zip(QUANTILES, np.percentile(values, QUANTILES)):
+                summary[f"p{q}_ms"] = round(float(value), 2)
+            summary["mean_ms"] = round(float(values.mean()), 2)
+            summary["max_ms"] = round(float(values.max()), 2)
+        return summary
+
+
+async def load_house_ids(client: httpx.AsyncClient, region_id: str, limit: int = MAX_HOUSES) -> List[int]:
+    """id домов района через /api/v2/houses/options (постранично)"""
+    house_ids: List[int] = []
+    cursor = None
+    while len(house_ids) < limit:
+        params = {"region_id": region_id, "limit": 500}
+        if cursor:
+            params["cursor"] = cursor
+        resp = await client.get("/api/v2/houses/options", params=params)
+        resp.raise_for_status()
+        page = resp.json()
+        house_ids.extend(item["id_house"] for item in page["items"])
+        cursor = page.get("next_cursor")
+        if not cursor:
+            break
+    return house_ids[:limit]
+
+
+async def _worker(
+    client: httpx.AsyncClient,
+    ctx: LoadContext,
+    names: List[str],
+    weights: List[int],
+    results: Dict[str, ScenarioResult],
+    record_from: float,
+    deadline: float,
+) -> None:
+    while True:
+        started = time.perf_counter()
+        if started >= deadline:
+            return
+        name = random.choices(names, weights)[0]
+        method, path, body = SCENARIOS[name][1](ctx)
+        try:
+            resp = await client.request(method, path, json=body)
+            status = str(resp.status_code)
+            failed = resp.status_code >= 400
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+            failed = True
+        finished = time.perf_counter()
+        if started < record_from:  # прогрев
+            continue
+        result = results[name]
+        result.latencies.append(finished - started)
+        result.statuses[status] = result.statuses.get(status, 0) + 1
+        result.errors += failed
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_load(
+    base_url: str,
+    region_id: str,
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    scenarios: List[str],
+    unique_questions: bool = True,
+    timeout: float = 60.0,
+) -> Dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        house_ids = await load_house_ids(client, region_id)
+        if not house_ids:
+            raise SystemExit(f"В районе {region_id} нет домов — сначала python -m bench.seed --region {region_id}")
+        ctx = LoadContext(region_id, house_ids, unique_questions)
+        results = {name: ScenarioResult() for name in scenarios}
+        weights = [SCENARIOS[name][0] for name in scenarios]
+
+        print(f"[load] {len(house_ids)} houses, {concurrency} workers, {warmup:.0f}s warm-up + {duration:.0f}s")
+        started = time.perf_counter()
+        record_from = started + warmup
+        deadline = record_from + duration
+        await asyncio.gather(*(
+            _worker(client, ctx, scenarios, weights, results, record_from, deadline)
+            for _ in range(concurrency)
+        ))
+        # Последние запросы заканчиваются после deadline — считаем по фактическому времени
+        elapsed = time.perf_counter() - record_from
+
+    endpoints = {name: result.summary(elapsed) for name, result in results.items()}
+    total = ScenarioResult()
+    for result in results.values():
+        total.latencies.extend(result.latencies)
+        total.errors += result.errors
+        for status, count in result.statuses.items():
+            total.statuses[status] = total.statuses.get(status, 0) + count
+    return {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "config": {
+            "base_url": base_url,
+            "region_id": region_id,
+            "houses": len(house_ids),
+            "concurrency": concurrency,
+            "duration_seconds": duration,
+            "warmup_seconds": warmup,
+            "scenarios": {name: SCENARIOS[name][0] for name in scenarios},
+        },
+        "elapsed_seconds": round(elapsed, 2),
+        "total": total.summary(elapsed),
+        "endpoints": endpoints,
+    }
+
+
+def print_report(report: Dict) -> None:
+    header = f"{'endpoint':<17}{'requests':>9}{'errors':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, s in [*report["endpoints"].items(), ("total", report["total"])]:
+        print(
+            f"{name:<17}{s['requests']:>9}{s['errors']:>8}{s['rps']:>9.1f}"
+            f"{s.get('p50_ms', 0):>9.1f}{s.get('p95_ms', 0):>9.1f}{s.get('p99_ms', 0):>9.1f}{s.get('max_ms', 0):>9.1f}"
+        )
+
+
+def compare(report: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    """Регрессии относительно baseline: рост p95 или падение RPS больше max_regression"""
+    regressions = []
+    for key in ("concurrency", "scenarios", "houses"):
+        if baseline.get("config", {}).get(key) != report["config"][key]:
+            print(f"[load] Warning: baseline was run with different {key}, comparison is approximate")
+    for name, current in [*report["endpoints"].items(), ("total", report["total"])]:
+        before = baseline["total"] if name == "total" else baseline.get("endpoints", {}).get(name)
+        if not before or not before.get("requests") or not current.get("requests"):
+            continue
+        if before.get("p95_ms") and current["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {before['p95_ms']} -> {current['p95_ms']} ms")
+        if before["rps"] and current["rps"] < before["rps"] * (1 - max_regression):
+            regressions.append(f"{name}: rps {before['rps']} -> {current['rps']}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест GVS Monitoring API")
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL)
+    parser.add_argument("--region", default="bench", help="region_id района (см. bench.seed)")
+    parser.add_argument("--concurrency", type=int, default=32, help="Одновременных клиентов")
+    parser.add_argument("--duration", type=float, default=30, help="Секунд замера")
+    parser.add_argument("--warmup", type=float, default=5, help="Секунд прогрева (не учитываются)")
+    parser.add_argument(
+        "--scenarios", default=",".join(SCENARIOS),
+        help=f"Сценарии через запятую: {', '.join(SCENARIOS)}",
+    )
+    parser.add_argument("--cached-llm", action="store_true", help="Повторять вопросы к LLM (проверка кэша ответов)")
+    parser.add_argument("--output", help="Записать результат в JSON-файл")
+    parser.add_argument("--baseline", help="JSON предыдущего прогона для сравнения")
+    parser.add_argument("--max-regression", type=float, default=DEFAULT_MAX_REGRESSION)
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Неизвестные сценарии: {', '.join(sorted(unknown))}")
+
+    report = asyncio.run(run_load(
+        args.base_url, args.region, args.concurrency, args.duration, args.warmup,
+        scenarios, unique_questions=not args.cached_llm,
+    ))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"[load] Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        if regressions:
+            print("[load] Regressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("[load] No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
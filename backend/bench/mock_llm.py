@@ -0,0 +1,55 @@
+"""
+Локальный mock-сервер OpenRouter chat/completions (обычный и потоковый ответ).
+
+Запуск из директории backend:
+    uvicorn bench.mock_llm:app --port 9000
+и в .env:
+    OPENROUTER_BASE_URL=http://127.0.0.1:9000/v1
+
+Задержки настраиваются переменными MOCK_LLM_FIRST_TOKEN_MS и MOCK_LLM_TOKEN_MS.
+"""
+import asyncio
+import json
+import os
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+FIRST_TOKEN_DELAY = float(os.getenv("MOCK_LLM_FIRST_TOKEN_MS", "300")) / 1000
+TOKEN_DELAY = float(os.getenv("MOCK_LLM_TOKEN_MS", "20")) / 1000
+ANSWER = (
+    "**Сводка по району**\n\n"
+    "- Критических инцидентов немного, большинство домов в норме.\n"
+    "- Рекомендуется проверить дома с предупреждениями за последние сутки.\n"
+)
+
+app = FastAPI(title="Mock OpenRouter")
+
+
+def _tokens():
+    return [word + " " for word in ANSWER.split(" ")]
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    await asyncio.sleep(FIRST_TOKEN_DELAY)
+
+    if not body.get("stream"):
+        await asyncio.sleep(TOKEN_DELAY * len(_tokens()))
+        return {
+            "id": f"mock-{time.time_ns()}",
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": ANSWER}}],
+        }
+
+    async def events():
+        yield ": OPENROUTER PROCESSING\n\n"
+        for token in _tokens():
+            chunk = {"choices": [{"index": 0, "delta": {"content": token}}]}
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(TOKEN_DELAY)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
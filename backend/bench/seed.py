@@ -0,0 +1,244 @@
+"""
+Синтетический район для нагрузочных тестов в локальной базе.
+
+Создаёт (если их нет) базовые таблицы схемы, адреса района в реестре lublino_houses,
+регистрирует район (секции, дома, status_houses — как POST /api/regions), заливает 5-минутные
+показания за последние дни (app.synthetic_data), инциденты и 5-минутный прогноз (как у Prophet)
+с последних суток на двое вперёд и досчитывает агрегаты 1h/1d/1w. Повторный запуск перезаписывает показания того же района.
+
+Запуск из директории backend (API при этом может быть не запущен):
+    python -m bench.seed --region bench --houses 2000 --days 7
+"""
+import argparse
+import asyncio
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import asyncpg
+import numpy as np
+
+from app.districts import district_registry
+from app.rollups import RollupEngine
+from app.synthetic_data import SyntheticConfig, baseline, load_synthetic_readings, time_grid
+from db.database import ASYNCPG_DSN, AsyncSessionLocal
+from db.import_lublino import CREATE_TABLE_SQL
+
+DEFAULT_REGION = "bench"
+DEFAULT_HOUSES = 1000
+DEFAULT_DAYS = 3
+# Доля домов с расхождением горячей и холодной воды (инциденты, Red/Yellow)
+DEFAULT_ANOMALY_SHARE = 0.02
+FORECAST_HOURS = 48
+# Прогноз и на прошедшие сутки — по ним детектор отклонений от прогноза восстанавливает историю остатков
+FORECAST_HISTORY_HOURS = 24
+STREETS = ["Бенчмарковая улица", "Нагрузочный проезд", "Тестовый бульвар", "Синтетическая набережная"]
+
+# Для пустой базы: таблицы, которые в рабочей базе строит "SQL Postgres water.sql".
+# Секционирование по району и агрегаты создают districts / rollups
+BASE_SCHEMA_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS lublino_houses_id (
+        id_house BIGINT, unom BIGINT, address TEXT, simple_address TEXT, district TEXT, n_fias UUID, nreg TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS status_houses (
+        id_house BIGINT, unom BIGINT, house_health TEXT, status_incident VARCHAR(50)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS water_consump_hot (
+        id_house BIGINT, time_5min TIMESTAMP, water_consumption DOUBLE PRECISION, water_hot DOUBLE PRECISION
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS water_diffr_coldhot (
+        id_house BIGINT, time_5min TIMESTAMP, diffr_cldht DOUBLE PRECISION, diffr_ratio DOUBLE PRECISION
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS water_consump_hot_1h (
+        id_house BIGINT, time_1hour TIMESTAMP, water_cold DOUBLE PRECISION, water_hot DOUBLE PRECISION
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS water_diffr_coldhot_1h (
+        id_house BIGINT, time_1hour TIMESTAMP, diffr_cldht DOUBLE PRECISION, diffr_ratio DOUBLE PRECISION
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS incident_hist_2 (
+        id_house BIGINT, time_5min TIMESTAMP, diffr_prcnt_1h DOUBLE PRECISION, type_incdnt INTEGER, comment_incdnt TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS water_forecast_all (
+        id_house BIGINT, ds TIMESTAMP, yhat DOUBLE PRECISION, yhat_lower DOUBLE PRECISION, yhat_upper DOUBLE PRECISION
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_water_consump_hot_house_time ON water_consump_hot (id_house, time_5min)",
+    "CREATE INDEX IF NOT EXISTS ix_water_diffr_coldhot_house_time ON water_diffr_coldhot (id_house, time_5min)",
+]
+
+
+async def _create_addresses(conn: asyncpg.Connection, registry_district: str, houses: int) -> None:
+    """Адреса района в реестре lublino_houses (unom — после максимального существующего)"""
+    if await conn.fetchval("SELECT to_regclass('public.lublino_houses')") is None:
+        await conn.execute(CREATE_TABLE_SQL.format(table="lublino_houses"))
+    await conn.execute("DELETE FROM lublino_houses WHERE district = $1", registry_district)
+    first_unom = await conn.fetchval("""
+        SELECT GREATEST(
+            (SELECT COALESCE(max(unom), 0) FROM lublino_houses),
+            (SELECT COALESCE(max(unom), 0) FROM lublino_houses_id)
+        ) + 1
+    """)
+    records = []
+    for i in range(houses):
+        street = STREETS[i % len(STREETS)]
+        simple_address = f"{street}, дом {i // len(STREETS) + 1}"
+        records.append((
+            first_unom + i,
+            f"Российская Федерация, город Москва, внутригородская территория {registry_district}, {simple_address}",
+            simple_address,
+            registry_district,
+        ))
+    await conn.copy_records_to_table(
+        "lublino_houses", records=records, columns=["unom", "address", "simple_address", "district"]
+    )
+
+
+async def seed_district(
+    region_id: str = DEFAULT_REGION,
+    houses: int = DEFAULT_HOUSES,
+    days: int = DEFAULT_DAYS,
+    anomaly_share: float = DEFAULT_ANOMALY_SHARE,
+    random_seed: int = 0,
+) -> Dict:
+    started = time.perf_counter()
+    random_seed = random_seed or zlib.crc32(region_id.encode())
+    rng = np.random.default_rng(random_seed)
+    registry_district = f"Бенчмарк {region_id}"
+    rollup_engine = RollupEngine(AsyncSessionLocal)
+
+    conn = await asyncpg.connect(ASYNCPG_DSN)
+    try:
+        for statement in BASE_SCHEMA_STATEMENTS:
+            await conn.execute(statement)
+        async with AsyncSessionLocal() as db:
+            await district_registry.ensure_schema(db)
+        await rollup_engine.ensure_schema()
+
+        house_ids = [row["id_house"] for row in await conn.fetch(
+            "SELECT id_house FROM lublino_houses_id WHERE region_id = $1 ORDER BY id_house", region_id
+        )]
+        if house_ids:
+            print(f"[seed] District {region_id} already has {len(house_ids)} houses, regenerating readings only")
+        else:
+            await _create_addresses(conn, registry_district, houses)
+            async with AsyncSessionLocal() as db:
+                await district_registry.register(db, region_id, f"Синтетический район {region_id}", registry_district)
+            house_ids = [row["id_house"] for row in await conn.fetch(
+                "SELECT id_house FROM lublino_houses_id WHERE region_id = $1 ORDER BY id_house", region_id
+            )]
+
+        end = datetime.now().replace(second=0, microsecond=0)
+        end -= timedelta(minutes=end.minute % 5)
+        # Все показания домов района заменяются; триггеры агрегатов пометят часы, run_once ниже их пересчитает
+        await conn.execute("DELETE FROM water_consump_hot WHERE id_house = ANY($1::bigint[])", house_ids)
+        readings = await load_synthetic_readings(
+            house_ids, end - timedelta(days=days), end,
+            SyntheticConfig(leak_share=0.0, drift_share=0.0, divergence_share=anomaly_share, seed=random_seed),
+            replace=False,
+        )
+        # Дома с расхождением ГВС/ХВС получают инциденты и статус Red
+        incident_houses = [row["id_house"] for row in await conn.fetch(
+            "SELECT DISTINCT id_house FROM synthetic_anomalies WHERE run_id = $1", readings["run_id"]
+        )]
+        await _seed_incidents(conn, region_id, house_ids, incident_houses, end)
+        await _seed_forecast(conn, region_id, house_ids, end, rng)
+    finally:
+        await conn.close()
+
+    hours = await rollup_engine.run_once()
+    elapsed = time.perf_counter() - started
+    stats = {
+        "region_id": region_id,
+        "houses": len(house_ids),
+        "readings": readings["rows"],
+        "incident_houses": len(incident_houses),
+        "rolled_up_hours": hours,
+        "elapsed_seconds": round(elapsed, 1),
+    }
+    print(f"[seed] Done: {stats}")
+    return stats
+
+
+async def _seed_incidents(conn, region_id: str, house_ids: List[int], incident_houses: List[int], end: datetime) -> None:
+    """Инцидент (type 1) и предупреждения (type 3) за последние сутки у аномальных домов"""
+    await conn.execute(
+        "DELETE FROM incident_hist_2 WHERE region_id = $1 AND id_house = ANY($2::bigint[])", region_id, house_ids
+    )
+    records = []
+    for house_id in incident_houses:
+        records.append((region_id, house_id, end - timedelta(hours=2), 25.0, 1, "Расхождение ГВС и ХВС за час 25%"))
+        for minutes in (30, 20, 10):
+            records.append((region_id, house_id, end - timedelta(minutes=minutes), 18.0, 3, "Предупреждение: расхождение 18%"))
+    if records:
+        await conn.copy_records_to_table(
+            "incident_hist_2", records=records,
+            columns=["region_id", "id_house", "time_5min", "diffr_prcnt_1h", "type_incdnt", "comment_incdnt"],
+        )
+    await conn.execute(
+        """
+        UPDATE status_houses
+        SET house_health = CASE WHEN id_house = ANY($2::bigint[]) THEN 'Red' ELSE 'Green' END,
+            status_incident = CASE WHEN id_house = ANY($2::bigint[]) THEN 'New' END
+        WHERE region_id = $1
+        """,
+        region_id, incident_houses,
+    )
+
+
+async def _seed_forecast(conn, region_id: str, house_ids: List[int], end: datetime, rng) -> None:
+    """
+    5-минутный прогноз с FORECAST_HISTORY_HOURS назад на FORECAST_HOURS вперёд по тому же суточному
+    профилю, в масштабе среднего расхода ХВС дома, — обычные дома укладываются в интервал прогноза
+    """
+    await conn.execute(
+        "DELETE FROM water_forecast_all WHERE region_id = $1 AND id_house = ANY($2::bigint[])", region_id, house_ids
+    )
+    means = dict(await conn.fetch(
+        "SELECT id_house, avg(water_consumption) FROM water_consump_hot WHERE id_house = ANY($1::bigint[]) GROUP BY id_house",
+        house_ids,
+    ))
+    grid = time_grid(end - timedelta(hours=FORECAST_HISTORY_HOURS), end + timedelta(hours=FORECAST_HOURS))
+    times = grid.astype(datetime).tolist()
+    # Средний уровень профиля за неделю переводит средний расход дома в масштаб профиля
+    profile_mean = float(baseline(time_grid(end - timedelta(days=7), end)).mean())
+    profile = baseline(grid) / profile_mean
+    records = [
+        (region_id, house_id, ds, float(yhat), float(yhat * 0.8), float(yhat * 1.2))
+        for house_id in house_ids
+        for ds, yhat in zip(times, profile * (means.get(house_id) or rng.uniform(0.2, 1.5) * profile_mean))
+    ]
+    await conn.copy_records_to_table(
+        "water_forecast_all", records=records,
+        columns=["region_id", "id_house", "ds", "yhat", "yhat_lower", "yhat_upper"],
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Синтетический район для нагрузочных тестов")
+    parser.add_argument("--region", default=DEFAULT_REGION, help="region_id района (латиница, цифры, _)")
+    parser.add_argument("--houses", type=int, default=DEFAULT_HOUSES, help="Домов в районе (при первом создании)")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help="Дней 5-минутных показаний до текущего момента")
+    parser.add_argument("--anomaly-share", type=float, default=DEFAULT_ANOMALY_SHARE, help="Доля домов с инцидентами")
+    parser.add_argument("--seed", type=int, default=0, help="Зерно генератора (0 — по region_id)")
+    args = parser.parse_args()
+    asyncio.run(seed_district(args.region, args.houses, args.days, args.anomaly_share, args.seed))
+
+
+if __name__ == "__main__":
+    main()
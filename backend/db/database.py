@@ -1,7 +1,10 @@
 import os
+import time
+from sqlalchemy import exc
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,7 +16,43 @@ DATABASE_URL = (
     f"{os.getenv('DB_NAME')}"
 )
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+# DSN для прямых подключений asyncpg (COPY, потоковое чтение) в обход пула SQLAlchemy
+ASYNCPG_DSN = DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+# DB_ECHO=true печатает каждый SQL-запрос (только для отладки: под нагрузкой это дорого)
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул подключений, сообщающий, сколько ждали подключение (см. app.db_metrics)"""
+
+    # callable(секунды ожидания, timed_out); задаётся на классе, т.к. dispose() пересоздаёт пул
+    wait_observer = None
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            if self.wait_observer is not None:
+                self.wait_observer(time.perf_counter() - started, True)
+            raise
+        if self.wait_observer is not None:
+            self.wait_observer(time.perf_counter() - started, False)
+        return connection
+
+
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=DB_ECHO,
+    poolclass=TimedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+)
 
 AsyncSessionLocal = sessionmaker(
     bind=engine,
@@ -1,64 +1,46 @@
-import os
-import pandas as pd
-from sqlalchemy import text
-from sqlalchemy.ext.asyncio import create_async_engine
-from dotenv import load_dotenv
-from pathlib import Path
+"""
+Загрузка реестра адресов (CSV data.mos.ru) в lublino_houses.
+
+CSV читается кусками, столбцы приводятся к типам векторно (pandas), каждый кусок через
+бинарный COPY уходит в промежуточную таблицу, пока следующий кусок уже разбирается.
+В конце промежуточная таблица одной транзакцией подменяет lublino_houses — до этого момента
+API и запросы видят прежние данные, а при ошибке загрузки они не затрагиваются.
+Так за разумное время грузится и полный реестр Москвы (миллионы строк).
+
+Запуск из директории backend:
+    python -m db.import_lublino data-60562-2025-09-26.csv --district Люблино --district Марьино
+    python -m db.import_lublino data-60562-2025-09-26.csv --all-districts
+"""
+import argparse
 import asyncio
+import codecs
+import re
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
 
-# Загружаем переменные окружения
-load_dotenv()
-
-# Подключение к БД
-DATABASE_URL = (
-    f"postgresql+asyncpg://"
-    f"{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@"
-    f"{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/"
-    f"{os.getenv('DB_NAME')}"
-)
-
-async def import_lublino_from_csv(csv_path: str):
-    engine = create_async_engine(DATABASE_URL, echo=True)
-
-    # 1. Чтение CSV
-    try:
-        df = pd.read_csv(
-            csv_path,
-            sep=';',
-            encoding='cp1251',
-            on_bad_lines='skip'
-        )
-    except UnicodeDecodeError:
-        # fallback на UTF-8
-        df = pd.read_csv(
-            csv_path,
-            sep=';',
-            encoding='utf-8',
-            on_bad_lines='skip'
-        )
-
-    # 2. Фильтрация по району "Люблино"
-    df = df[df['DISTRICT'].str.contains('Люблино', case=False, na=False, regex=False)].copy()
-
-    # 3. Выбор нужных столбцов
-    required_columns = [
-        'UNOM', 'ADDRESS', 'SIMPLE_ADDRESS', 'DISTRICT',
-        'N_FIAS', 'D_FIAS', 'NREG', 'TDOC', 'NDOC', 'DDOC',
-        'SOSTAD', 'STATUS', 'DREG', 'KLADR', 'P90', 'P91'
-    ]
-
-    missing_cols = set(required_columns) - set(df.columns)
-    if missing_cols:
-        raise ValueError(f"Отсутствуют столбцы в CSV: {missing_cols}")
-
-    df = df[required_columns]
-
-    # 4. Преобразуем NaN в None
-    df = df.where(pd.notnull(df), None)
+import asyncpg
+import numpy as np
+import pandas as pd
 
-    # 5. Создание таблицы
-    create_table_sql = """
-    CREATE TABLE IF NOT EXISTS lublino_houses (
+from db.database import ASYNCPG_DSN
+
+DEFAULT_CSV = "data-60562-2025-09-26.csv"
+DEFAULT_DISTRICTS = ["Люблино"]
+CHUNK_SIZE = 100_000
+PROGRESS_REPORT_SECONDS = 5.0
+ENCODING_SAMPLE_BYTES = 1 << 20
+
+REQUIRED_COLUMNS = [
+    'UNOM', 'ADDRESS', 'SIMPLE_ADDRESS', 'DISTRICT',
+    'N_FIAS', 'D_FIAS', 'NREG', 'TDOC', 'NDOC', 'DDOC',
+    'SOSTAD', 'STATUS', 'DREG', 'KLADR', 'P90', 'P91'
+]
+TABLE_COLUMNS = [column.lower() for column in REQUIRED_COLUMNS]
+DATE_COLUMNS = ['D_FIAS', 'DDOC', 'DREG']
+UUID_PATTERN = r"[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}"
+
+CREATE_TABLE_SQL = """
+    CREATE TABLE {table} (
         unom BIGINT,
         address TEXT,
         simple_address TEXT,
@@ -75,73 +57,195 @@ async def import_lublino_from_csv(csv_path: str):
         kladr TEXT,
         p90 TEXT,
         p91 TEXT
-    );
+    )
+"""
+
+Record = Tuple
+
+
+def detect_encoding(csv_path: str) -> str:
+    """UTF-8 (в т.ч. с BOM), если начало файла корректно декодируется, иначе cp1251"""
+    with open(csv_path, "rb") as f:
+        sample = f.read(ENCODING_SAMPLE_BYTES)
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # final=False: кусок мог оборваться посреди многобайтного символа
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1251"
+
+
+def integer_text(values: pd.Series) -> pd.Series:
+    """'123', '123.0', '1.23E+5' -> '123', '123', '123000'; нечисловые значения остаются строкой как есть"""
+    result = values.copy()
+    # Строки из одних цифр не трогаем (длинные КЛАДР не пролезают через float без потери точности)
+    rest = values.notna() & ~values.str.isdigit().fillna(False).astype(bool)
+    if rest.any():
+        numbers = pd.to_numeric(values[rest], errors="coerce")
+        numbers = numbers[numbers.notna() & (numbers.abs() < 2 ** 63)]
+        result.loc[numbers.index] = numbers.round().astype("int64").astype(str)
+    return result
+
+
+def parse_dates(values: pd.Series) -> pd.Series:
+    """
+    Даты ДД.ММ.ГГГГ и ГГГГ-ММ-ДД разбираются векторно, прочие форматы — поэлементно с dayfirst;
+    неразобранные -> NaT
+    """
+    parsed = pd.to_datetime(values, format="%d.%m.%Y", errors="coerce")
+    for fmt, options in (("ISO8601", {}), ("mixed", {"dayfirst": True})):
+        rest = values.notna() & parsed.isna()
+        if not rest.any():
+            break
+        parsed[rest] = pd.to_datetime(values[rest], format=fmt, errors="coerce", **options)
+    return parsed
+
+
+def _nullable(values: pd.Series) -> List:
+    """Столбец -> список Python-значений с None вместо NaN/NaT/NA (для COPY)"""
+    return values.astype(object).where(values.notna(), None).tolist()
+
+
+def prepare_chunk(df: pd.DataFrame, district_pattern: Optional[str]) -> List[Record]:
+    """Фильтр по районам и приведение типов куска CSV; возвращает записи в порядке TABLE_COLUMNS"""
+    if district_pattern is not None:
+        df = df[df['DISTRICT'].str.contains(district_pattern, case=False, na=False, regex=True)]
+    if df.empty:
+        return []
+
+    columns: Dict[str, List] = {}
+    for column in REQUIRED_COLUMNS:
+        values = df[column]
+        if column == 'UNOM':
+            numbers = np.trunc(pd.to_numeric(values, errors="coerce"))
+            numbers = numbers.where(numbers.abs() < 2 ** 63)
+            columns[column] = _nullable(numbers.astype("Int64"))
+        elif column in ('NREG', 'KLADR'):
+            columns[column] = _nullable(integer_text(values))
+        elif column in DATE_COLUMNS:
+            dates = parse_dates(values)
+            columns[column] = _nullable(dates.dt.date.where(dates.notna()))
+        elif column == 'N_FIAS':
+            stripped = values.str.strip()
+            columns[column] = _nullable(stripped.where(stripped.str.fullmatch(UUID_PATTERN, na=False)))
+        else:
+            columns[column] = _nullable(values)
+    return list(zip(*(columns[column] for column in REQUIRED_COLUMNS)))
+
+
+def _read_chunk(reader, district_pattern: Optional[str]) -> Optional[Tuple[int, List[Record]]]:
+    """Следующий кусок CSV: (строк прочитано, подготовленные записи) или None в конце файла"""
+    try:
+        df = next(reader)
+    except StopIteration:
+        return None
+    return len(df), prepare_chunk(df, district_pattern)
+
+
+async def import_lublino_from_csv(
+    csv_path: str,
+    districts: Optional[Sequence[str]] = DEFAULT_DISTRICTS,
+    table: str = "lublino_houses",
+    chunk_size: int = CHUNK_SIZE,
+) -> Dict:
     """
+    Потоковая загрузка CSV в table. districts — подстроки столбца DISTRICT (без учёта регистра),
+    None — весь реестр. Возвращает статистику загрузки (строк прочитано/загружено, строк/с).
+    """
+    started = time.perf_counter()
+    encoding = detect_encoding(csv_path)
+    header = pd.read_csv(csv_path, sep=';', encoding=encoding, nrows=0)
+    missing_cols = set(REQUIRED_COLUMNS) - set(header.columns)
+    if missing_cols:
+        raise ValueError(f"Отсутствуют столбцы в CSV: {missing_cols}")
 
-    async with engine.begin() as conn:
-        await conn.execute(text("DROP TABLE IF EXISTS lublino_houses;"))
-        await conn.execute(text(create_table_sql))
-
-        # 6. Подготовка записей с приведением типов
-        records = df.to_dict(orient='records')
-        cleaned_records = []
-
-        for r in records:
-            # UNOM → int
-            if r['UNOM'] is not None:
-                try:
-                    r['UNOM'] = int(float(r['UNOM']))
-                except (ValueError, TypeError, OverflowError):
-                    r['UNOM'] = None
-
-            # NREG → str (без .0)
-            if r['NREG'] is not None:
-                try:
-                    r['NREG'] = str(int(float(r['NREG'])))
-                except (ValueError, TypeError):
-                    r['NREG'] = str(r['NREG'])
-
-            # KLADR → str (без экспоненты и .0)
-            if r['KLADR'] is not None:
-                try:
-                    val = float(r['KLADR'])
-                    if val.is_integer():
-                        r['KLADR'] = str(int(val))
-                    else:
-                        r['KLADR'] = str(int(round(val)))
-                except (ValueError, TypeError, OverflowError):
-                    r['KLADR'] = str(r['KLADR'])
-
-            # Даты → 'YYYY-MM-DD'
-            for col in ['D_FIAS', 'DDOC', 'DREG']:
-                if r[col] is not None:
-                    try:
-                        r[col] = pd.to_datetime(r[col], dayfirst=True).date()
-                    except Exception:
-                        r[col] = None
-
-            cleaned_records.append(r)
-
-        # 7. Вставка
-        await conn.execute(
-            text("""
-                INSERT INTO lublino_houses (
-                    unom, address, simple_address, district,
-                    n_fias, d_fias, nreg, tdoc, ndoc, ddoc,
-                    sostad, status, dreg, kladr, p90, p91
-                ) VALUES (
-                    :UNOM, :ADDRESS, :SIMPLE_ADDRESS, :DISTRICT,
-                    :N_FIAS, :D_FIAS, :NREG, :TDOC, :NDOC, :DDOC,
-                    :SOSTAD, :STATUS, :DREG, :KLADR, :P90, :P91
+    district_pattern = "|".join(re.escape(d) for d in districts) if districts else None
+    reader = pd.read_csv(
+        csv_path,
+        sep=';',
+        encoding=encoding,
+        on_bad_lines='skip',
+        usecols=REQUIRED_COLUMNS,
+        dtype=str,
+        chunksize=chunk_size,
+    )
+
+    staging = f"{table}_staging"
+    stats = {"rows_read": 0, "rows_loaded": 0, "encoding": encoding, "swapped": False}
+    conn = await asyncpg.connect(ASYNCPG_DSN)
+    try:
+        await conn.execute(f"DROP TABLE IF EXISTS {staging}")
+        await conn.execute(CREATE_TABLE_SQL.format(table=staging))
+
+        last_report = started
+        pending = asyncio.ensure_future(asyncio.to_thread(_read_chunk, reader, district_pattern))
+        while True:
+            chunk = await pending
+            if chunk is None:
+                break
+            # Следующий кусок разбирается в потоке, пока текущий идёт в COPY
+            pending = asyncio.ensure_future(asyncio.to_thread(_read_chunk, reader, district_pattern))
+            rows_read, records = chunk
+            if records:
+                await conn.copy_records_to_table(staging, records=records, columns=TABLE_COLUMNS)
+            stats["rows_read"] += rows_read
+            stats["rows_loaded"] += len(records)
+
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_REPORT_SECONDS:
+                last_report = now
+                print(
+                    f"[import] прочитано {stats['rows_read']}, загружено {stats['rows_loaded']}, "
+                    f"{stats['rows_read'] / (now - started):.0f} строк/с"
                 )
-            """),
-            cleaned_records
+
+        if not stats["rows_loaded"]:
+            print(f"⚠️ Ни одной строки для районов {districts} — таблица '{table}' не изменена")
+        else:
+            await conn.execute(f"CREATE INDEX ix_{staging}_unom ON {staging} (unom)")
+            await conn.execute(f"ANALYZE {staging}")
+            async with conn.transaction():
+                await conn.execute(f"DROP TABLE IF EXISTS {table}_old")
+                await conn.execute(f"ALTER TABLE IF EXISTS {table} RENAME TO {table}_old")
+                await conn.execute(f"ALTER TABLE {staging} RENAME TO {table}")
+                await conn.execute(f"DROP TABLE IF EXISTS {table}_old")
+                await conn.execute(f"ALTER INDEX ix_{staging}_unom RENAME TO ix_{table}_unom")
+            stats["swapped"] = True
+    finally:
+        if not stats["swapped"]:
+            await conn.execute(f"DROP TABLE IF EXISTS {staging}")
+        await conn.close()
+
+    elapsed = time.perf_counter() - started
+    stats["elapsed_seconds"] = round(elapsed, 1)
+    stats["rows_per_second"] = round(stats["rows_read"] / elapsed) if elapsed > 0 else 0
+    if stats["swapped"]:
+        print(
+            f"✅ Успешно загружено {stats['rows_loaded']} записей в таблицу '{table}' "
+            f"(прочитано {stats['rows_read']} строк, {encoding}) за {elapsed:.1f} с, "
+            f"{stats['rows_per_second']} строк/с"
         )
+    return stats
 
-    print(f"✅ Успешно загружено {len(cleaned_records)} записей в таблицу 'lublino_houses'")
 
-if __name__ == "__main__":
-    import asyncio
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Загрузка реестра адресов из CSV в lublino_houses (COPY)")
+    parser.add_argument("csv_path", nargs="?", default=DEFAULT_CSV, help="CSV-файл реестра (разделитель ';')")
+    parser.add_argument(
+        "--district",
+        action="append",
+        dest="districts",
+        help="Район (подстрока DISTRICT), можно указать несколько раз; по умолчанию — Люблино",
+    )
+    parser.add_argument("--all-districts", action="store_true", help="Загрузить реестр целиком")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Строк CSV в одном куске")
+    args = parser.parse_args()
+
+    districts = None if args.all_districts else (args.districts or DEFAULT_DISTRICTS)
+    asyncio.run(import_lublino_from_csv(args.csv_path, districts=districts, chunk_size=args.chunk_size))
 
-    csv_file = "data-60562-2025-09-26.csv"  
-    asyncio.run(import_lublino_from_csv(csv_file))
\ No newline at end of file
+
+if __name__ == "__main__":
+    main()
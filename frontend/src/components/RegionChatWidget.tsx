@@ -1,7 +1,7 @@
 import React, { useState } from 'react';
-import axios from 'axios';
 import { marked } from 'marked';
 import DOMPurify from 'dompurify';
+import { streamLLMAnswer } from '../utils/llmStream';
 
 const apiBase = () => (import.meta.env.VITE_API_URL || 'http://127.0.0.1:8000');
 
@@ -26,13 +26,24 @@ export const GlobalChatWidget: React.FC = () => {
 
     try {
       const base = apiBase();
-      const response = await axios.post(`${base}/api/ask-llm`, {
-        question: userMessage
+      let started = false;
+      await streamLLMAnswer(`${base}/api/ask-llm/stream`, userMessage, token => {
+        if (!started) {
+          started = true;
+          setMessages(prev => [...prev, { role: 'assistant', text: token }]);
+        } else {
+          setMessages(prev => [
+            ...prev.slice(0, -1),
+            { role: 'assistant', text: prev[prev.length - 1].text + token }
+          ]);
+        }
       });
-      setMessages(prev => [...prev, { role: 'assistant', text: response.data.answer || 'Без ответа.' }]);
+      if (!started) {
+        setMessages(prev => [...prev, { role: 'assistant', text: 'Без ответа.' }]);
+      }
     } catch (error: any) {
       console.error('LLM error:', error);
-      const errorMsg = error.response?.data?.detail || 'Не удалось получить ответ от модели.';
+      const errorMsg = error.message || 'Не удалось получить ответ от модели.';
       setMessages(prev => [...prev, { role: 'assistant', text: errorMsg }]);
     } finally {
       setIsLoading(false);
@@ -123,7 +134,7 @@ export const GlobalChatWidget: React.FC = () => {
                 />
               </div>
             ))}
-            {isLoading && <div style={{
+            {isLoading && messages[messages.length - 1].role === 'user' && <div style={{
               fontWeight: 'bold',
               color: 'var(--primary)'
             }}>Генерация ответа...</div>}
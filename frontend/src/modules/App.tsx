@@ -9,18 +9,16 @@ import { UserInfo } from './auth/UserInfo'
 import { ThemeProvider } from '../contexts/ThemeContext'
 import { ThemeToggle } from '../components/ThemeToggle'
 import { HouseSummaryPage } from './house/HouseSummaryPage'
+import { HouseOption, loadMoreOnScroll, useHouseAutocomplete, useHouseOptionPages } from '../utils/addressSearch'
 
 type ModelRelearn = {
   id: number
   date: string
   model_name: string
   status_relearn: string
-}
-
-type HouseOption = {
-  id_house: number
-  unom: number
-  simple_address: string
+  progress: number | null
+  duration_seconds: number | null
+  houses_processed: number | null
 }
 
 const apiBase = () => (import.meta.env.VITE_API_URL || 'http://127.0.0.1:8000')
@@ -31,7 +29,6 @@ const AppContent: React.FC = () => {
   const [showHistoryModal, setShowHistoryModal] = useState(false)
   const [showIncidentModal, setShowIncidentModal] = useState(false)
   const [modelHistory, setModelHistory] = useState<ModelRelearn[]>([])
-  const [houseOptions, setHouseOptions] = useState<HouseOption[]>([])
   const [selectedHouse, setSelectedHouse] = useState<number | null>(null)
   const [newIncidentStatus, setNewIncidentStatus] = useState<string>('New')
   const [newHouseHealth, setNewHouseHealth] = useState<string>('Green')
@@ -46,18 +43,11 @@ const AppContent: React.FC = () => {
       .catch(console.error)
   }
 
-  const loadHouseOptions = () => {
-    axios.get(`${apiBase()}/api/v2/houses/options`)
-      .then(r => setHouseOptions(r.data))
-      .catch(console.error)
-  }
-
   useEffect(() => {
     const auth = localStorage.getItem('auth')
     setIsAuthenticated(!!auth)
     setLoading(false)
     if (showHistoryModal) loadModelHistory()
-    if (showIncidentModal) loadHouseOptions()
   }, [showHistoryModal, showIncidentModal])
 
   const handleCreateIncident = () => {
@@ -104,8 +94,11 @@ const AppContent: React.FC = () => {
     'Нет проблем': 'Green'
   }
 
-  const filteredOptions = houseOptions.filter(house =>
-    house.simple_address.toLowerCase().includes(searchQuery.toLowerCase()) ||
+  // Подсказки ищутся на сервере по индексу адресов; для пустого/короткого запроса — список домов постранично
+  const suggestions = useHouseAutocomplete(apiBase(), searchQuery)
+  const houseOptions = useHouseOptionPages(apiBase(), showIncidentModal && showDropdown)
+  const filteredOptions: HouseOption[] = suggestions ?? houseOptions.items.filter(house =>
+    (house.simple_address || '').toLowerCase().includes(searchQuery.toLowerCase()) ||
     house.unom.toString().includes(searchQuery)
   )
 
@@ -228,6 +221,8 @@ const AppContent: React.FC = () => {
                     <th style={{ padding: '10px 8px' }}>Дата</th>
                     <th style={{ padding: '10px 8px' }}>Модель</th>
                     <th style={{ padding: '10px 8px' }}>Статус</th>
+                    <th style={{ padding: '10px 8px' }}>Длительность</th>
+                    <th style={{ padding: '10px 8px' }}>Домов</th>
                   </tr>
                 </thead>
                 <tbody>
@@ -241,7 +236,14 @@ const AppContent: React.FC = () => {
                         }) : 'Не указана'}
                       </td>
                       <td style={{ padding: '10px 8px' }}>{record.model_name}</td>
-                      <td style={{ padding: '10px 8px' }}>{record.status_relearn}</td>
+                      <td style={{ padding: '10px 8px' }}>
+                        {record.status_relearn}
+                        {record.status_relearn === 'running' && record.progress !== null ? ` (${record.progress}%)` : ''}
+                      </td>
+                      <td style={{ padding: '10px 8px' }}>
+                        {record.duration_seconds !== null ? `${Math.round(record.duration_seconds)} с` : '—'}
+                      </td>
+                      <td style={{ padding: '10px 8px' }}>{record.houses_processed ?? '—'}</td>
                     </tr>
                   ))}
                 </tbody>
@@ -249,16 +251,18 @@ const AppContent: React.FC = () => {
             </div>
             <div style={{ display: 'flex', gap: '10px', flexShrink: 0, flexWrap: 'wrap' }}>
               <button className="button" onClick={() => {
-                const modelName = `model_${Date.now()}`
-                axios.post(`${apiBase()}/api/model-relearn/start`, {
-                  model_name: modelName,
-                  status_relearn: 'started'
-                })
+                axios.post(`${apiBase()}/api/model-relearn/start`, {})
                   .then(() => {
                     alert('Переобучение модели запущено!')
                     loadModelHistory()
                   })
-                  .catch(console.error)
+                  .catch(err => {
+                    if (err.response?.status === 409) {
+                      alert('Переобучение этой модели уже выполняется')
+                    } else {
+                      console.error(err)
+                    }
+                  })
               }}>
                 Переобучить
               </button>
@@ -333,6 +337,7 @@ const AppContent: React.FC = () => {
                       maxHeight: '200px',
                       overflowY: 'auto',
                     }}
+                    onScroll={suggestions ? undefined : loadMoreOnScroll(houseOptions.loadMore)}
                   >
                     {filteredOptions.length > 0 ? (
                       filteredOptions.map(house => (
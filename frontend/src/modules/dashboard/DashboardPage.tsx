@@ -3,6 +3,7 @@ import { useParams, Link, useNavigate } from 'react-router-dom'
 import axios from 'axios'
 import { GlobalChatWidget } from '../../components/RegionChatWidget'
 import { GrafanaChartStable } from '../../components/GrafanaCharStable'
+import { HouseOption, loadMoreOnScroll, useHouseAutocomplete, useHouseOptionPages } from '../../utils/addressSearch'
 
 type DashboardMetrics = {
   region_id: string
@@ -11,12 +12,6 @@ type DashboardMetrics = {
   period_days: number
 }
 
-type HouseOption = {
-  id_house: number
-  unom: number
-  simple_address: string
-}
-
 // Add forecast type
 type ForecastData = {
   v1: number
@@ -34,7 +29,6 @@ export const DashboardPage: React.FC<{ regionId?: string }> = ({ regionId }) =>
   const [forecastData, setForecastData] = useState<ForecastData | null>(null) // Add forecast state
 
   // Состояния для селекта с поиском
-  const [houseOptions, setHouseOptions] = useState<HouseOption[]>([])
   const [searchQuery, setSearchQuery] = useState('')
   const [showDropdown, setShowDropdown] = useState(false)
   const [selectedHouse, setSelectedHouse] = useState<number | null>(null)
@@ -49,11 +43,6 @@ export const DashboardPage: React.FC<{ regionId?: string }> = ({ regionId }) =>
       })
     axios.get(`${base}/api/regions/${rid}/llm-context`).then(r => setLlmContext(r.data)).catch(() => setLlmContext({ region: rid, houses: [] }))
 
-    // Загрузка опций домов для селекта
-    axios.get(`${base}/api/v2/houses/options`)
-      .then(r => setHouseOptions(r.data))
-      .catch(console.error)
-
     // Fetch forecast data (no region_id needed)
     axios.get(`${base}/api/forecast-overall`)
       .then(response => setForecastData(response.data))
@@ -67,8 +56,11 @@ export const DashboardPage: React.FC<{ regionId?: string }> = ({ regionId }) =>
   }, [llmContext])
 
   // Фильтрация опций на основе поискового запроса
-  const filteredOptions = houseOptions.filter(house =>
-    house.simple_address.toLowerCase().includes(searchQuery.toLowerCase()) ||
+  // Подсказки ищутся на сервере по индексу адресов; для пустого/короткого запроса — список домов постранично
+  const suggestions = useHouseAutocomplete(apiBase(), searchQuery)
+  const houseOptions = useHouseOptionPages(apiBase(), showDropdown)
+  const filteredOptions: HouseOption[] = suggestions ?? houseOptions.items.filter(house =>
+    (house.simple_address || '').toLowerCase().includes(searchQuery.toLowerCase()) ||
     house.unom.toString().includes(searchQuery)
   )
 
@@ -149,6 +141,7 @@ export const DashboardPage: React.FC<{ regionId?: string }> = ({ regionId }) =>
                     maxHeight: '200px',
                     overflowY: 'auto',
                   }}
+                  onScroll={suggestions ? undefined : loadMoreOnScroll(houseOptions.loadMore)}
                 >
                   {filteredOptions.length > 0 ? (
                     filteredOptions.map(house => (
@@ -2,6 +2,8 @@ import React, { useEffect, useMemo, useState } from 'react'
 import { useNavigate, useParams } from 'react-router-dom'
 import axios from 'axios'
 import * as XLSX from 'xlsx'
+import { fetchPage } from '../../utils/pagination'
+import { useDebouncedValue } from '../../utils/addressSearch'
 
 type HouseRow = {
   house_id: string
@@ -23,13 +25,38 @@ export const StatusListPage: React.FC = () => {
   const [is, setIs] = useState<string>('')
   const [sortBy, setSortBy] = useState<keyof HouseRow>('address')
   const [sortDir, setSortDir] = useState<'asc' | 'desc'>('asc')
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [total, setTotal] = useState<number | null>(null)
+
+  // Адрес и УНОМ сортируются на сервере (страницы идут в этом порядке), остальные колонки — в загруженных строках
+  const serverSort = sortBy === 'unom' ? 'unom' : 'address'
+  const serverDir = sortBy === 'unom' || sortBy === 'address' ? sortDir : 'asc'
+  // Поиск уходит на сервер после паузы в наборе, а не на каждое нажатие клавиши
+  const search = useDebouncedValue(query.trim())
+  const filters = { status, incident_status: is || undefined, search: search || undefined }
+  const listUrl = `${apiBase()}/api/regions/${regionId}/houses`
+
+  useEffect(() => {
+    fetchPage<HouseRow>(listUrl, { ...filters, sort_by: serverSort, sort_dir: serverDir })
+      .then(page => {
+        setRows(page.items)
+        setNextCursor(page.next_cursor)
+      })
+  }, [regionId, status, search, is, serverSort, serverDir])
 
   useEffect(() => {
-    const base = apiBase()
-    axios.get(`${base}/api/regions/${regionId}/houses`, {
-      params: { status, incident_status: is || undefined, search: query || undefined }
-    }).then(r => setRows(r.data))
-  }, [regionId, status, query, is])
+    setTotal(null)
+    axios.get(`${listUrl}/count`, { params: filters }).then(r => setTotal(r.data.total))
+  }, [regionId, status, search, is])
+
+  const loadMore = () => {
+    if (!nextCursor) return
+    fetchPage<HouseRow>(listUrl, { ...filters, sort_by: serverSort, sort_dir: serverDir }, nextCursor)
+      .then(page => {
+        setRows(prev => [...prev, ...page.items])
+        setNextCursor(page.next_cursor)
+      })
+  }
 
   const sorted = useMemo(() => {
     const arr = [...rows]
@@ -171,6 +198,10 @@ export const StatusListPage: React.FC = () => {
             </tbody>
           </table>
         </div>
+        <div style={{ display: 'flex', alignItems: 'center', gap: 12, marginTop: 12 }}>
+          <span>Показано {rows.length}{total !== null ? ` из ${total}` : ''}</span>
+          {nextCursor && <button className="button" onClick={loadMore}>Показать ещё</button>}
+        </div>
       </div>
     </div>
   )
@@ -0,0 +1,82 @@
+import { useCallback, useEffect, useRef, useState } from 'react'
+import type { UIEvent } from 'react'
+import axios from 'axios'
+import { fetchPage } from './pagination'
+
+export type AddressSuggestion = {
+    id_house: number
+    unom: number
+    simple_address: string
+    address: string
+    score: number
+}
+
+export type HouseOption = {
+    id_house: number
+    unom: number
+    simple_address: string
+}
+
+// Значение, которое обновляется только после паузы в наборе (чтобы не слать запрос на каждое нажатие)
+export const useDebouncedValue = <T>(value: T, delayMs = 250): T => {
+    const [debounced, setDebounced] = useState(value)
+    useEffect(() => {
+        const timer = setTimeout(() => setDebounced(value), delayMs)
+        return () => clearTimeout(timer)
+    }, [value, delayMs])
+    return debounced
+}
+
+// Подсказки адресов с сервера; null — запрос слишком короткий, показывать обычный список
+export const useHouseAutocomplete = (apiBase: string, query: string, limit = 20): AddressSuggestion[] | null => {
+    const debounced = useDebouncedValue(query.trim())
+    const [suggestions, setSuggestions] = useState<AddressSuggestion[] | null>(null)
+
+    useEffect(() => {
+        if (debounced.length < 2) {
+            setSuggestions(null)
+            return
+        }
+        let cancelled = false
+        axios.get<AddressSuggestion[]>(`${apiBase}/api/v2/houses/autocomplete`, { params: { q: debounced, limit } })
+            .then(r => { if (!cancelled) setSuggestions(r.data) })
+            .catch(() => { if (!cancelled) setSuggestions(null) })
+        return () => { cancelled = true }
+    }, [apiBase, debounced, limit])
+
+    return suggestions
+}
+
+// Список домов для селекта при коротком запросе: первая страница — когда селект открыт,
+// следующие — по loadMore при прокрутке, весь реестр района не загружается
+export const useHouseOptionPages = (apiBase: string, enabled: boolean, pageSize = 50) => {
+    const [items, setItems] = useState<HouseOption[]>([])
+    const [hasMore, setHasMore] = useState(true)
+    const cursor = useRef<string | null>(null)
+    const loading = useRef(false)
+
+    const loadMore = useCallback(() => {
+        if (!enabled || loading.current || !hasMore) return
+        loading.current = true
+        fetchPage<HouseOption>(`${apiBase}/api/v2/houses/options`, { limit: pageSize }, cursor.current)
+            .then(page => {
+                setItems(prev => [...prev, ...page.items])
+                cursor.current = page.next_cursor
+                setHasMore(page.next_cursor !== null)
+            })
+            .catch(console.error)
+            .finally(() => { loading.current = false })
+    }, [apiBase, enabled, hasMore, pageSize])
+
+    useEffect(() => {
+        if (enabled && items.length === 0) loadMore()
+    }, [enabled, items.length, loadMore])
+
+    return { items, hasMore, loadMore }
+}
+
+// Обработчик прокрутки выпадающего списка: подгружает следующую страницу у нижнего края
+export const loadMoreOnScroll = (loadMore: () => void) => (e: UIEvent<HTMLDivElement>) => {
+    const el = e.currentTarget
+    if (el.scrollTop + el.clientHeight >= el.scrollHeight - 40) loadMore()
+}
@@ -0,0 +1,52 @@
+// Чтение потокового ответа LLM (Server-Sent Events) из POST-запроса.
+// EventSource умеет только GET, поэтому поток разбираем вручную через fetch.
+export const streamLLMAnswer = async (
+    url: string,
+    question: string,
+    onToken: (token: string) => void
+): Promise<void> => {
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+        body: JSON.stringify({ question })
+    })
+
+    if (!response.ok || !response.body) {
+        let detail = 'Не удалось получить ответ от модели.'
+        try {
+            detail = (await response.json()).detail || detail
+        } catch {
+            // тело ответа не JSON
+        }
+        throw new Error(detail)
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+
+    while (true) {
+        const { value, done } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+
+        let separator = buffer.indexOf('\n\n')
+        while (separator !== -1) {
+            const rawEvent = buffer.slice(0, separator)
+            buffer = buffer.slice(separator + 2)
+            separator = buffer.indexOf('\n\n')
+
+            let eventName = 'message'
+            let data = ''
+            for (const line of rawEvent.split('\n')) {
+                if (line.startsWith('event:')) eventName = line.slice(6).trim()
+                else if (line.startsWith('data:')) data += line.slice(5).trim()
+            }
+            const payload = data ? JSON.parse(data) : {}
+
+            if (eventName === 'done') return
+            if (eventName === 'error') throw new Error(payload.detail || 'Ошибка генерации ответа')
+            if (payload.token) onToken(payload.token)
+        }
+    }
+}
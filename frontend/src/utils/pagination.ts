@@ -0,0 +1,12 @@
+import axios from 'axios'
+
+export type Page<T> = {
+    items: T[]
+    next_cursor: string | null
+}
+
+// Загружает одну страницу списка с курсорной пагинацией
+export const fetchPage = async <T>(url: string, params: Record<string, unknown> = {}, cursor?: string | null): Promise<Page<T>> => {
+    const response = await axios.get<Page<T>>(url, { params: { ...params, cursor: cursor || undefined } })
+    return response.data
+}